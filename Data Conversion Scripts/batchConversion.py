@@ -0,0 +1,255 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+########################################################################################################
+###
+### DESCRIPTION:
+###
+### This script runs the conversion of conversionPipeline.py for every user and every day at once.
+### It discovers all the user directories (named by IMEI) under a data directory and all the raw
+### data files (project_gps_edited_<i>.txt) in each of them, and converts the files in parallel
+### over a pool of processes.
+###
+### The files are converted in the order of user and day number, and a summary line is printed
+### for each file in that same order irrespective of the order in which the processes finish.
+###
+### When the routes are filled in, every process of the pool opens a single router (see
+### populateData.Router) that is kept for all the files it converts, so that the routes looked up
+### for one day can be reused for the days converted after it by the same process.
+###
+### The days whose outputs are up to date in the manifest of their user directory (see
+### conversionManifest.py) are skipped, so that a rerun only converts new or changed raw data files.
+### The manifests are only read and written by the main process.
+###
+########################################################################################################
+
+import os
+import re
+import time
+import multiprocessing
+import multiprocessing.util
+import populateData
+import conversionManifest
+from conversionPipeline import convertDay, checkDay, startDay, recordDay, getSkippedSummary
+
+numProcesses = None  # no. of processes used for conversion, None uses one process per core
+shouldFillRoutes = False  # decides whether the points returned by the routing service are added between consecutive points
+shouldWriteIntermediateFiles = False  # decides whether the converted/ and populated/ files are also written
+shouldWriteColumnarFiles = False  # decides whether the sample rows are also written as columnar files
+shouldUseManifest = True  # decides whether the days whose outputs are up to date in the manifest are skipped
+rawFilePattern = re.compile(r'^project_gps_edited_(\d+)\.txt$')
+
+def discoverFiles(dataDirectory):
+    """Returns a sorted list of (user directory, day number) for every raw data file under dataDirectory"""
+    
+    tasks = []
+    for user in sorted(os.listdir(dataDirectory)):
+        directory = os.path.join(dataDirectory, user)
+        if not os.path.isdir(directory):
+            continue
+        days = []
+        for name in os.listdir(directory):
+            m = rawFilePattern.match(name)
+            if m:
+                days.append(int(m.group(1)))
+        for n in sorted(days):
+            tasks.append((directory, n))
+    return tasks
+
+def prepareDirectories(tasks, writeIntermediateFiles):
+    """Creates the output directories of every user directory in tasks that do not exist yet"""
+    
+    subdirectories = ['sample']
+    if writeIntermediateFiles:
+        subdirectories = subdirectories + ['converted', 'populated']
+    for directory in sorted(set(directory for directory, n in tasks)):
+        for subdirectory in subdirectories:
+            path = os.path.join(directory, subdirectory)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+router = None  # the router of the worker process, kept across tasks so that its route index keeps growing
+
+def startWorker(processes):
+    """Sets up a worker process of the pool: shares the request quota and opens the router used by all its tasks"""
+    
+    global router
+    shareRequestQuota(processes)
+    if shouldFillRoutes:
+        router = populateData.Router()
+        # the route cache is committed and the routing engine stopped when the worker process exits
+        multiprocessing.util.Finalize(router, router.close, exitpriority=10)
+
+def getRouterCounts():
+    """Returns the (hits, misses, reused) counts of the router of the worker process so far"""
+    
+    hits = 0
+    misses = 0
+    reused = 0
+    if not router is None and not router.cache is None:
+        hits = router.cache.hits
+        misses = router.cache.misses
+    if not router is None and not router.index is None:
+        reused = router.index.reused
+    return hits, misses, reused
+
+def convertTask(task):
+    """Converts the file of a single (user directory, day number, from converted file) task and returns its summary"""
+    
+    directory, n, fromConverted = task
+    routeMany = None
+    if not router is None:
+        routeMany = router.routeMany
+    counts = getRouterCounts()
+    start = time.time()
+    try:
+        summary = convertDay(n, directory, routeMany, shouldWriteIntermediateFiles, shouldWriteColumnarFiles, fromConverted)
+        summary['error'] = None
+    except Exception as e:
+        summary = {'path': None, 'converted': 0, 'sample': 0, 'unfilled': 0, 'skipped': False, 'error': '%s: %s' % (type(e).__name__, e)}
+    finally:
+        if not router is None:
+            router.commit()
+    # the counts of the router add up over the tasks of the process, so only those of this task are reported
+    hits, misses, reused = [b - a for a, b in zip(counts, getRouterCounts())]
+    summary['hits'] = hits
+    summary['misses'] = misses
+    summary['reused'] = reused
+    summary['directory'] = directory
+    summary['day'] = n
+    summary['seconds'] = time.time() - start
+    return summary
+
+def shareRequestQuota(processes):
+    """Divides the request quota of the concurrent routing client among the processes of the pool"""
+    
+    if not populateData.requestsPerSecond is None:
+        populateData.requestsPerSecond = populateData.requestsPerSecond / float(processes)
+
+def convertAll(dataDirectory, processes=None):
+    """Converts every raw data file under dataDirectory over a pool of processes.
+    
+    Yields the summary of each file in the order of discoverFiles. The files that are up to date in the
+    manifests are not converted again, and the manifests are updated as the other files are converted.
+    
+    """
+    
+    files = discoverFiles(dataDirectory)
+    prepareDirectories(files, shouldWriteIntermediateFiles)
+    manifests = {}
+    skipped = {}
+    tasks = []
+    for directory, n in files:
+        fromConverted = False
+        if shouldUseManifest:
+            if directory not in manifests:
+                manifests[directory] = conversionManifest.Manifest(directory)
+            isCurrent, fromConverted = checkDay(manifests[directory], n, shouldFillRoutes, shouldWriteIntermediateFiles, shouldWriteColumnarFiles)
+            if isCurrent:
+                skipped[(directory, n)] = getSkippedSummary(manifests[directory], n)
+                continue
+            startDay(manifests[directory], n, shouldWriteIntermediateFiles, shouldWriteColumnarFiles, fromConverted)
+        tasks.append((directory, n, fromConverted))
+    for manifest in manifests.values():
+        manifest.save()
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes, startWorker, (processes,))
+    try:
+        summaries = pool.imap(convertTask, tasks)
+        for directory, n in files:
+            if (directory, n) in skipped:
+                summary = skipped[(directory, n)]
+                summary.update({'error': None, 'hits': 0, 'misses': 0, 'reused': 0, 'directory': directory, 'day': n, 'seconds': 0.0})
+            else:
+                summary = summaries.next()
+                if summary['error'] is None and directory in manifests:
+                    recordDay(manifests[directory], n, summary, shouldFillRoutes, shouldWriteIntermediateFiles, shouldWriteColumnarFiles)
+                    manifests[directory].save()
+            yield summary
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+def main():
+    dataDirectory = raw_input("Enter data directory: ")
+    files = 0
+    failed = 0
+    upToDate = 0
+    rows = 0
+    hits = 0
+    misses = 0
+    reused = 0
+    unfilled = 0
+    for summary in convertAll(dataDirectory, numProcesses):
+        files = files + 1
+        hits = hits + summary['hits']
+        misses = misses + summary['misses']
+        reused = reused + summary['reused']
+        unfilled = unfilled + summary['unfilled']
+        user = os.path.basename(summary['directory'])
+        if summary['skipped']:
+            upToDate = upToDate + 1
+            print "%s day %d: up to date" % (user, summary['day'])
+        elif summary['error'] is None:
+            rows = rows + summary['sample']
+            print "%s day %d: %d location rows -> %d sample rows in %.2fs" % (user, summary['day'], summary['converted'], summary['sample'], summary['seconds'])
+        else:
+            failed = failed + 1
+            print "%s day %d: FAILED (%s)" % (user, summary['day'], summary['error'])
+    print
+    print "Files converted:", files - failed - upToDate, "| Up to date:", upToDate, "| Failed:", failed, "| Sample rows:", rows
+    if hits + misses > 0:
+        print "Route cache hits:", hits, "| misses:", misses
+    if reused > 0:
+        print "Routes reused:", reused
+    if unfilled > 0:
+        print "Routes missing from the route cache:", unfilled, "(their days are converted again by the next run)"
+
+if __name__ == '__main__':
+    main()
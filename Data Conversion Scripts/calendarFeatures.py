@@ -0,0 +1,232 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+########################################################################################################
+###
+### DESCRIPTION:
+###
+### Hour-of-day and day-of-week features of millisecond timestamps, computed for whole columns of
+### timestamps at once with integer arithmetic in a given IANA time zone (e.g. 'Asia/Shanghai').
+###
+### The time zone rules are read from the compiled tz database of the system (/usr/share/zoneinfo),
+### so the features do not depend on the local time zone of the machine the conversion runs on.
+###
+########################################################################################################
+
+import bisect
+import datetime
+import itertools
+import operator
+import os
+import re
+import struct
+
+zoneInfoDirectories = [os.environ.get('TZDIR', ''), '/usr/share/zoneinfo', '/usr/lib/zoneinfo', '/usr/share/lib/zoneinfo']
+lastRuleYear = 2100  # the daylight saving rules of a time zone are applied up to this year
+hourNames = ['%02d' % h for h in range(24)]
+dayNames = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+epochWeekday = 3  # 1970-01-01 was a Thursday
+posixRule = re.compile(r'^(?P<std><[^>]+>|[A-Za-z]+)(?P<stdOffset>[+-]?[\d:]+)'
+                       r'(?:(?P<dst><[^>]+>|[A-Za-z]+)(?P<dstOffset>[+-]?[\d:]+)?'
+                       r'(?:,(?P<start>[^,/]+)(?:/(?P<startTime>[+-]?[\d:]+))?,(?P<end>[^,/]+)(?:/(?P<endTime>[+-]?[\d:]+))?)?)?$')
+
+def parseSeconds(text):
+    """Returns the no. of seconds in a [+-]hh[:mm[:ss]] string"""
+    
+    sign = 1
+    if text[0] in '+-':
+        if text[0] == '-':
+            sign = -1
+        text = text[1:]
+    seconds = 0
+    for part, scale in zip(text.split(':'), (3600, 60, 1)):
+        seconds = seconds + int(part) * scale
+    return sign * seconds
+
+def getRuleDay(rule, year):
+    """Returns the date in year of a POSIX TZ rule date (Jn, n or Mm.w.d)"""
+    
+    if rule.startswith('M'):
+        month, week, weekday = [int(v) for v in rule[1:].split('.')]
+        first = datetime.date(year, month, 1)
+        # weekday counts from Sunday = 0 in the rule, and from Monday = 0 in datetime
+        day = first + datetime.timedelta(days=(weekday - (first.weekday() + 1)) % 7 + (week - 1) * 7)
+        while day.month != month:
+            day = day - datetime.timedelta(days=7)
+        return day
+    if rule.startswith('J'):
+        n = int(rule[1:])
+        day = datetime.date(year, 1, 1) + datetime.timedelta(days=n - 1)
+        if n >= 60 and (year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)):
+            day = day + datetime.timedelta(days=1)
+        return day
+    return datetime.date(year, 1, 1) + datetime.timedelta(days=int(rule))
+
+def getRuleTransitions(rule, startYear, endYear):
+    """Returns the (time, UTC offset) transitions given by a POSIX TZ rule string from startYear up to endYear.
+    
+    The result is None if the rule has no daylight saving time, and [(None, UTC offset)] for the fixed offset.
+    
+    """
+    
+    m = posixRule.match(rule)
+    if m is None:
+        return None
+    stdOffset = -parseSeconds(m.group('stdOffset'))
+    if m.group('dst') is None:
+        return [(None, stdOffset)]
+    dstOffset = stdOffset + 3600
+    if not m.group('dstOffset') is None:
+        dstOffset = -parseSeconds(m.group('dstOffset'))
+    if m.group('start') is None:
+        return None
+    startTime = parseSeconds(m.group('startTime') or '2')
+    endTime = parseSeconds(m.group('endTime') or '2')
+    transitions = []
+    epoch = datetime.date(1970, 1, 1).toordinal()
+    for year in range(startYear, endYear + 1):
+        # the start is given in standard time and the end in daylight saving time
+        start = (getRuleDay(m.group('start'), year).toordinal() - epoch) * 86400 + startTime - stdOffset
+        end = (getRuleDay(m.group('end'), year).toordinal() - epoch) * 86400 + endTime - dstOffset
+        transitions.extend(sorted([(start, dstOffset), (end, stdOffset)]))
+    return transitions
+
+class TimeZone:
+    """The UTC offsets of an IANA time zone, read from its compiled tz database (TZif) file.
+    
+    name is the name of the time zone, e.g. 'Asia/Shanghai', or the path of a TZif file such as /etc/localtime.
+    The UTC offset offsets[i] holds from transitions[i-1] up to transitions[i] (times in seconds).
+    
+    """
+    
+    def __init__(self, name):
+        self.name = name
+        path = name
+        if not os.path.isabs(name):
+            for directory in zoneInfoDirectories:
+                if directory and os.path.isfile(os.path.join(directory, name)):
+                    path = os.path.join(directory, name)
+                    break
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.transitions, self.offsets, rule = self.parse(data)
+        if rule:
+            lastYear = 1970
+            if self.transitions:
+                lastYear = datetime.datetime.utcfromtimestamp(max(self.transitions[-1], 0)).year
+            ruleTransitions = getRuleTransitions(rule, lastYear, lastRuleYear)
+            if ruleTransitions and ruleTransitions[0][0] is None:
+                if not self.offsets:
+                    self.offsets = [ruleTransitions[0][1]]
+            elif ruleTransitions:
+                for t, offset in ruleTransitions:
+                    if not self.transitions or t > self.transitions[-1]:
+                        self.transitions.append(t)
+                        self.offsets.append(offset)
+    
+    @staticmethod
+    def parse(data):
+        """Returns the transition times, the UTC offsets before and after them, and the POSIX TZ rule in a TZif file"""
+        
+        if data[:4] != 'TZif':
+            raise ValueError('not a TZif file')
+        version = data[4]
+        timeSize = 4
+        header = 44
+        counts = struct.unpack('>6l', data[20:44])
+        if version >= '2':
+            # skip the version 1 data block and use the 64-bit one that follows it
+            isutcnt, isstdcnt, leapcnt, timecnt, typecnt, charcnt = counts
+            start = header + timecnt * 4 + timecnt + typecnt * 6 + charcnt + leapcnt * 8 + isstdcnt + isutcnt
+            data = data[start:]
+            counts = struct.unpack('>6l', data[20:44])
+            timeSize = 8
+        isutcnt, isstdcnt, leapcnt, timecnt, typecnt, charcnt = counts
+        position = header
+        times = list(struct.unpack('>%d%s' % (timecnt, 'q' if timeSize == 8 else 'l'), data[position:position + timecnt * timeSize]))
+        position = position + timecnt * timeSize
+        indices = struct.unpack('>%dB' % timecnt, data[position:position + timecnt])
+        position = position + timecnt
+        types = [struct.unpack('>lBB', data[position + 6 * i:position + 6 * i + 6]) for i in range(typecnt)]
+        position = position + typecnt * 6 + charcnt + leapcnt * (timeSize + 4) + isstdcnt + isutcnt
+        rule = ''
+        if timeSize == 8:
+            rule = data[position:].strip('\n').split('\n')[0] if data[position:].startswith('\n') else ''
+        offsets = [types[0][0]] + [types[i][0] for i in indices]
+        return times, offsets, rule
+    
+    def getOffsets(self, seconds):
+        """Returns the UTC offsets in seconds at the given UTC times in seconds"""
+        
+        offsets = self.offsets
+        return map(offsets.__getitem__, itertools.imap(bisect.bisect_right, itertools.repeat(self.transitions), seconds))
+
+def toMilliseconds(timestamp):
+    """Returns a timestamp string or number as an integer no. of milliseconds"""
+    
+    try:
+        return int(timestamp)
+    except ValueError:
+        return int(float(timestamp))
+
+def getCalendarFeatures(timestamps, timeZone, shiftHours=0):
+    """Returns the hour-of-day ('00'...'23') and day-of-week ('Monday'...) lists for a column of millisecond timestamps.
+    
+    The features are those of the local time in timeZone (a TimeZone) shifted by shiftHours.
+    
+    """
+    
+    try:
+        milliseconds = map(int, timestamps)
+    except ValueError:
+        milliseconds = map(toMilliseconds, timestamps)
+    seconds = map(operator.floordiv, milliseconds, itertools.repeat(1000, len(timestamps)))
+    local = map(operator.add, seconds, timeZone.getOffsets(seconds))
+    if shiftHours:
+        local = map(operator.add, local, itertools.repeat(shiftHours * 3600, len(local)))
+    hours = map(operator.mod, map(operator.floordiv, local, itertools.repeat(3600, len(local))), itertools.repeat(24, len(local)))
+    days = map(operator.floordiv, local, itertools.repeat(86400, len(local)))
+    weekdays = map(operator.mod, map(operator.add, days, itertools.repeat(epochWeekday, len(days))), itertools.repeat(7, len(days)))
+    return map(hourNames.__getitem__, hours), map(dayNames.__getitem__, weekdays)
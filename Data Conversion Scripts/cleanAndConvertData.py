@@ -50,36 +50,98 @@
 ### This script takes the raw GPS data files provided by Huawei (renamed as project_gps_edited_<i>.txt)
 ### [where i represents the day number for a particular user]
 ### and does the following:
-###   * remove rows which have status (and not location) data
+###   * separate rows which have status (and not location) data from the location rows, optionally
+###     writing them to converted/status_data_<i>.txt
 ###   * convert the file from '|' separated to ',' separated format
 ###   * extract and add hour-of-day and day-of-week information from timestamp
 ###   * add column names
 ###
 ########################################################################################################
 
-import datetime
-n1 = raw_input("Enter start file_number: ")
-n2 = raw_input("Enter end file_number: ")
-for n in range(int(n1), int(n2) + 1):
-    f = open("project_gps_edited_" + str(n) + ".txt")
-    outputFile = open("converted/converted_data_" + str(n) + ".txt", 'w')
-    with f, outputFile:
-        contents = f.read()
-        lines = contents.splitlines()
-        nlines = len(lines)
-        j = 1
-        outputFile.write('index,timestamp,hour_of_day,day_of_week,GPS_timestamp,latitude,longitude,altitude,Accuracy,bearing,speed')
-        for i in range(nlines):
-            line = lines[i]
-            if line.count('|') == 7:
-                newline = line.replace('|', ',')
-                idx = newline.find(',')
-                timestamp = newline[:idx]
-                dt = (datetime.datetime.fromtimestamp(float(timestamp)/1000.0) + datetime.timedelta(hours=16))
-                ds_hour = dt.strftime("%H")
-                ds_day = dt.strftime("%A")
-                # ts = dt.strftime("%H:%M:%S %d/%m/%Y")
-                d = timestamp + ',' + ds_hour + ',' + ds_day
-                newline = '\n' + str(j) + ',' + d + newline[idx:]
-                outputFile.write(newline)
-                j = j + 1
\ No newline at end of file
+import itertools
+from calendarFeatures import TimeZone, getCalendarFeatures
+from rawLogReader import readBatches, locationColumns
+
+timeZoneName = 'America/Los_Angeles'  # IANA time zone (or TZif file) in which the hour-of-day and day-of-week are computed
+timeShift = 16  # hours added to the local time in timeZoneName
+# the files converted so far were converted on machines in America/Los_Angeles with a shift of 16 hours,
+# set timeZoneName = 'Asia/Shanghai' and timeShift = 0 for the local time where the data was collected
+shouldWriteStatusFiles = False  # decides whether the status rows are written to converted/status_data_<i>.txt
+header = ['index', 'timestamp', 'hour_of_day', 'day_of_week', 'GPS_timestamp', 'latitude', 'longitude', 'altitude', 'Accuracy', 'bearing', 'speed']
+statusHeader = ['timestamp', 'status']
+timeZones = {}
+
+def getTimeZone():
+    """Returns the TimeZone of timeZoneName, reading it only once"""
+    
+    if timeZoneName not in timeZones:
+        timeZones[timeZoneName] = TimeZone(timeZoneName)
+    return timeZones[timeZoneName]
+
+def getHoursAndDays(timestamps):
+    """Returns the hour-of-day and day-of-week string lists for a list of timestamps given in milliseconds"""
+    
+    return getCalendarFeatures(timestamps, getTimeZone(), timeShift)
+
+def getHourAndDay(timestamp):
+    """Returns the hour-of-day and day-of-week strings for a timestamp given in milliseconds"""
+    
+    hours, days = getHoursAndDays([timestamp])
+    return hours[0], days[0]
+
+def cleanAndConvert(lines, statusFile=None):
+    """Yields a converted row (a list of strings in the order of header) for every location row in lines.
+    
+    lines is either an open raw data file, which is memory-mapped, or any other iterable of raw '|' separated
+    lines, and is read in batches (see rawLogReader.py) so that the file is never loaded into memory as a whole.
+    If statusFile is given, the status rows are written to it as csv preceded by statusHeader.
+    
+    """
+    
+    j = 1
+    if not statusFile is None:
+        statusFile.write(','.join(statusHeader))
+    for locations, statuses in readBatches(lines):
+        if not statusFile is None:
+            for row in itertools.izip(statuses.getText('timestamp'), statuses.getText('status')):
+                statusFile.write('\n' + ','.join(row))
+        if not len(locations):
+            continue
+        hours, days = getHoursAndDays(locations.getValues('timestamp'))
+        indices = itertools.imap(str, xrange(j, j + len(locations)))
+        for row in itertools.izip(indices, locations.getText('timestamp'), hours, days, *[locations.getText(name) for name in locationColumns[1:]]):
+            yield list(row)
+        j = j + len(locations)
+
+def writeConverted(rows, outputFile):
+    """Writes the converted rows to outputFile in the format of the converted/converted_data_<i>.txt files.
+    
+    Each row is yielded back after it has been written so that the writer can be used as a stage of a pipeline.
+    
+    """
+    
+    outputFile.write(','.join(header))
+    for row in rows:
+        outputFile.write('\n' + ','.join(row))
+        yield row
+
+def main():
+    n1 = raw_input("Enter start file_number: ")
+    n2 = raw_input("Enter end file_number: ")
+    for n in range(int(n1), int(n2) + 1):
+        f = open("project_gps_edited_" + str(n) + ".txt")
+        outputFile = open("converted/converted_data_" + str(n) + ".txt", 'w')
+        statusFile = None
+        if shouldWriteStatusFiles:
+            statusFile = open("converted/status_data_" + str(n) + ".txt", 'w')
+        try:
+            for row in writeConverted(cleanAndConvert(f, statusFile), outputFile):
+                pass
+        finally:
+            f.close()
+            outputFile.close()
+            if not statusFile is None:
+                statusFile.close()
+
+if __name__ == '__main__':
+    main()
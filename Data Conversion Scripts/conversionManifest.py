@@ -0,0 +1,152 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+########################################################################################################
+###
+### DESCRIPTION:
+###
+### A manifest of the files produced by conversionPipeline.py and batchConversion.py in a user
+### directory (manifest.json), so that a rerun only converts the days whose raw data file or
+### conversion parameters changed since their outputs were produced.
+###
+### For every output file the manifest records the raw data file it was produced from, with its size,
+### modification time and SHA-1 hash, and the parameters of the stage that produced it. The hash of
+### a raw data file is only computed again when its size or modification time changed.
+###
+########################################################################################################
+
+import hashlib
+import json
+import os
+
+manifestFileName = 'manifest.json'
+hashBlockSize = 1 << 20  # no. of bytes read at a time while hashing a file
+
+def getFileHash(path):
+    """Returns the SHA-1 hash of the contents of the file path"""
+    
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        block = f.read(hashBlockSize)
+        while block:
+            h.update(block)
+            block = f.read(hashBlockSize)
+    return h.hexdigest()
+
+class Manifest:
+    """The manifest of a user directory"""
+    
+    def __init__(self, directory=''):
+        self.directory = directory
+        self.path = os.path.join(directory, manifestFileName)
+        self.entries = {}
+        self.inputs = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+    
+    def getInputInfo(self, name):
+        """Returns the size, modification time and hash of the input file name of the user directory.
+        
+        The information is read once per manifest, so that it describes the file as it was before converting it.
+        
+        """
+        
+        if name not in self.inputs:
+            path = os.path.join(self.directory, name)
+            info = {'size': os.path.getsize(path), 'mtime': os.path.getmtime(path), 'hash': None}
+            for entry in self.entries.values():
+                known = entry['inputInfo']
+                if entry['input'] == name and known['size'] == info['size'] and known['mtime'] == info['mtime']:
+                    info['hash'] = known['hash']
+                    break
+            if info['hash'] is None:
+                info['hash'] = getFileHash(path)
+            self.inputs[name] = info
+        return self.inputs[name]
+    
+    def isCurrent(self, output, input, parameters):
+        """Returns whether the output file was produced from the current contents of the input file with parameters"""
+        
+        entry = self.entries.get(output)
+        if entry is None or entry['input'] != input or entry['parameters'] != parameters:
+            return False
+        if not os.path.exists(os.path.join(self.directory, output)) or not os.path.exists(os.path.join(self.directory, input)):
+            return False
+        info = self.getInputInfo(input)
+        if entry['inputInfo']['size'] != info['size'] or entry['inputInfo']['hash'] != info['hash']:
+            return False
+        entry['inputInfo'] = info
+        return True
+    
+    def getRows(self, output):
+        """Returns the counts of rows recorded for the output file"""
+        
+        return self.entries[output]['rows']
+    
+    def record(self, output, input, parameters, rows):
+        """Records that the output file was produced from the input file with parameters"""
+        
+        self.entries[output] = {'input': input, 'inputInfo': self.getInputInfo(input), 'parameters': parameters, 'rows': rows}
+    
+    def remove(self, output):
+        """Removes the output file from the manifest, e.g. before it is produced again"""
+        
+        self.entries.pop(output, None)
+    
+    def save(self):
+        """Writes the manifest, replacing the previous one only once it has been written completely"""
+        
+        temporaryPath = self.path + '.tmp'
+        with open(temporaryPath, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.rename(temporaryPath, self.path)  # replaces the previous manifest in a single step
+        except OSError:
+            # os.rename cannot replace an existing file on Windows
+            os.remove(self.path)
+            os.rename(temporaryPath, self.path)
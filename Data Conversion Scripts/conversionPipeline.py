@@ -0,0 +1,282 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+########################################################################################################
+###
+### DESCRIPTION:
+###
+### This script takes the raw GPS data files provided by Huawei (renamed as project_gps_edited_<i>.txt)
+### [where i represents the day number for a particular user]
+### and runs the conversions of cleanAndConvertData.py, populateData.py and generateSampleData.py
+### on them in a single pass, creating sample/sample_data_<i>.txt directly.
+###
+### Rows are streamed from one stage to the next, so that no file is ever held in memory as a whole
+### and no intermediate files are needed. The converted/ and populated/ files of the three-script
+### layout can still be written along the way by setting shouldWriteIntermediateFiles, and the sample
+### rows can also be written as a columnar file (sample/sample_data_<i>.col, see trajectoryFiles.py in
+### Machine Learning Python, whose location is set by trajectoryFilesPath) by setting shouldWriteColumnarFiles.
+###
+### The files produced are recorded in the manifest of the user directory (see conversionManifest.py),
+### and the days whose outputs are up to date are skipped. A day whose converted/ file is up to date is
+### converted from that file instead of its raw data file.
+###
+########################################################################################################
+
+import imp
+import os
+import sys
+import conversionManifest
+import cleanAndConvertData
+import populateData
+import generateSampleData
+
+shouldFillRoutes = True  # decides whether the points returned by the routing service are added between consecutive points
+shouldWriteIntermediateFiles = False  # decides whether the converted/ and populated/ files are also written
+shouldWriteColumnarFiles = False  # decides whether the sample rows are also written as a columnar file
+shouldUseManifest = True  # decides whether the days whose outputs are up to date in the manifest are skipped
+trajectoryFilesPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Machine Learning Python', 'trajectoryFiles.py')  # path of trajectoryFiles.py, which writes the columnar files
+
+def toPopulateInput(rows):
+    """Yields the [timestamp, hour_of_day, day_of_week, latitude, longitude] lists from converted rows"""
+    
+    for row in rows:
+        yield [row[1], row[2], row[3], row[5], row[6]]
+
+def countRows(rows, summary, key):
+    """Yields every row of rows, counting them in summary[key]"""
+    
+    for row in rows:
+        summary[key] = summary[key] + 1
+        yield row
+
+def getTrajectoryFiles():
+    """Returns the trajectoryFiles module loaded from trajectoryFilesPath, which is only needed for writing columnar files"""
+    
+    if 'trajectoryFiles' in sys.modules:
+        return sys.modules['trajectoryFiles']
+    return imp.load_source('trajectoryFiles', trajectoryFilesPath)
+
+def getRawFileName(n):
+    return "project_gps_edited_%d.txt" % n
+
+def getOutputs(n, writeIntermediateFiles=False, writeColumnarFile=False):
+    """Returns the (stage, path relative to the user directory) of every file produced for day n"""
+    
+    outputs = [('sample', os.path.join("sample", "sample_data_%d.txt" % n))]
+    if writeColumnarFile:
+        outputs.append(('sample', os.path.join("sample", "sample_data_%d.col" % n)))
+    if writeIntermediateFiles:
+        outputs.append(('converted', os.path.join("converted", "converted_data_%d.txt" % n)))
+        if cleanAndConvertData.shouldWriteStatusFiles:
+            outputs.append(('converted', os.path.join("converted", "status_data_%d.txt" % n)))
+        outputs.append(('populated', os.path.join("populated", "populated_data_%d.txt" % n)))
+    return outputs
+
+def getParameters(fillRoutes):
+    """Returns the parameters each stage of the conversion depends on, by stage"""
+    
+    converted = {'timeZoneName': cleanAndConvertData.timeZoneName, 'timeShift': cleanAndConvertData.timeShift}
+    populated = dict(converted, threshold=populateData.threshold, fillRoutes=fillRoutes)
+    if fillRoutes:
+        # the settings of populateData.Router that change the points added
+        populated['routingEngine'] = populateData.routingEngine
+        if populateData.routingEngine == 'local':
+            populated['roadNetworkFile'] = populateData.roadNetworkFile
+            populated['contractionHierarchyFile'] = populateData.contractionHierarchyFile
+        elif not populateData.requestsPerSecond is None:
+            populated['shouldUseWaypoints'] = populateData.shouldUseWaypoints
+            if populateData.shouldUseWaypoints:
+                populated['maxWaypoints'] = populateData.maxWaypoints
+                populated['shouldCompareReverseRoutes'] = populateData.shouldCompareReverseRoutes
+                populated['windowSize'] = populateData.windowSize
+        if not populateData.routeCacheFile is None:
+            populated['routeCachePrecision'] = populateData.routeCachePrecision
+            populated['shouldUseCacheOnly'] = populateData.shouldUseCacheOnly
+        populated['shouldReuseRoutes'] = populateData.shouldReuseRoutes
+        if populateData.shouldReuseRoutes:
+            populated['routeReuseTolerance'] = populateData.routeReuseTolerance
+            populated['maxReusedRoutes'] = populateData.maxReusedRoutes
+    return {'converted': converted, 'populated': populated, 'sample': populated}
+
+def checkDay(manifest, n, fillRoutes, writeIntermediateFiles=False, writeColumnarFile=False):
+    """Returns whether all the outputs of day n are up to date in manifest, and whether its converted file is"""
+    
+    parameters = getParameters(fillRoutes)
+    isCurrent = True
+    isConvertedCurrent = writeIntermediateFiles
+    for stage, path in getOutputs(n, writeIntermediateFiles, writeColumnarFile):
+        current = manifest.isCurrent(path, getRawFileName(n), parameters[stage])
+        isCurrent = isCurrent and current
+        if stage == 'converted':
+            isConvertedCurrent = isConvertedCurrent and current
+    return isCurrent, isConvertedCurrent
+
+def startDay(manifest, n, writeIntermediateFiles=False, writeColumnarFile=False, fromConverted=False):
+    """Removes the outputs of day n that are about to be written again from manifest, so that they are not
+    considered up to date if the conversion fails
+    
+    """
+    
+    for stage, path in getOutputs(n, writeIntermediateFiles, writeColumnarFile):
+        if not (fromConverted and stage == 'converted'):
+            manifest.remove(path)
+
+def recordDay(manifest, n, summary, fillRoutes, writeIntermediateFiles=False, writeColumnarFile=False):
+    """Records the outputs of day n in manifest after it has been converted.
+    
+    A day with routes that could not be looked up (missing from the route cache in the cache-only mode) is not
+    recorded, so that it is converted again by the next run.
+    
+    """
+    
+    if summary['unfilled'] > 0:
+        return
+    parameters = getParameters(fillRoutes)
+    rows = {'converted': summary['converted'], 'sample': summary['sample']}
+    for stage, path in getOutputs(n, writeIntermediateFiles, writeColumnarFile):
+        manifest.record(path, getRawFileName(n), parameters[stage], rows)
+
+def getSkippedSummary(manifest, n):
+    """Returns the summary of day n when its outputs are up to date in manifest"""
+    
+    path = os.path.join("sample", "sample_data_%d.txt" % n)
+    rows = manifest.getRows(path)
+    return {'path': os.path.join(manifest.directory, path), 'converted': rows['converted'], 'sample': rows['sample'], 'unfilled': 0, 'skipped': True}
+
+def convertDay(n, directory='', routeMany=None, writeIntermediateFiles=False, writeColumnarFile=False, fromConverted=False):
+    """Converts the raw data file of day n in directory into its sample data file.
+    
+    routeMany looks up the routes between the points (see populateData.Router). If routeMany is None,
+    no points are added by the routing service and every row has original-data = 1. If fromConverted is
+    True, the rows are read from the converted/ file of the day, which is kept, instead of the raw data file.
+    Returns a dictionary with the path of the sample data file created, the number of converted and sample rows and
+    the number of pairs of rows whose route could not be looked up.
+    
+    """
+    
+    rawPath = os.path.join(directory, getRawFileName(n))
+    convertedPath = os.path.join(directory, "converted", "converted_data_%d.txt" % n)
+    samplePath = os.path.join(directory, "sample", "sample_data_%d.txt" % n)
+    summary = {'path': samplePath, 'converted': 0, 'sample': 0, 'unfilled': 0, 'skipped': False}
+    openFiles = []
+    columnarFile = None
+    try:
+        if fromConverted:
+            f = open(convertedPath)
+            openFiles.append(f)
+            rows = populateData.readConverted(f)
+        else:
+            f = open(rawPath)
+            openFiles.append(f)
+            statusFile = None
+            if writeIntermediateFiles and cleanAndConvertData.shouldWriteStatusFiles:
+                statusFile = open(os.path.join(directory, "converted", "status_data_%d.txt" % n), 'w')
+                openFiles.append(statusFile)
+            rows = cleanAndConvertData.cleanAndConvert(f, statusFile)
+            if writeIntermediateFiles:
+                convertedFile = open(convertedPath, 'w')
+                openFiles.append(convertedFile)
+                rows = cleanAndConvertData.writeConverted(rows, convertedFile)
+            rows = toPopulateInput(rows)
+        outputFile = open(samplePath, 'w')
+        openFiles.append(outputFile)
+        rows = populateData.populate(countRows(rows, summary, 'converted'), routeMany, summary=summary)
+        if writeIntermediateFiles:
+            populatedFile = open(os.path.join(directory, "populated", "populated_data_%d.txt" % n), 'w')
+            openFiles.append(populatedFile)
+            rows = populateData.writeRows(rows, populatedFile, populateData.header)
+        rows = generateSampleData.addDirections(rows)
+        if writeColumnarFile:
+            columnarFile = getTrajectoryFiles().ColumnarWriter(os.path.join(directory, "sample", "sample_data_%d.col" % n))
+            rows = columnarFile.addRows(n, rows)
+        for row in populateData.writeRows(rows, outputFile, generateSampleData.header):
+            summary['sample'] = summary['sample'] + 1
+    finally:
+        for openFile in openFiles:
+            openFile.close()
+        if not columnarFile is None:
+            columnarFile.close()
+    return summary
+
+def main():
+    router = None
+    routeMany = None
+    if shouldFillRoutes:
+        router = populateData.Router()
+        routeMany = router.routeMany
+    manifest = None
+    if shouldUseManifest:
+        manifest = conversionManifest.Manifest()
+    n1 = raw_input("Enter start file_number: ")
+    n2 = raw_input("Enter end file_number: ")
+    try:
+        for n in range(int(n1), int(n2) + 1):
+            fromConverted = False
+            if not manifest is None:
+                isCurrent, fromConverted = checkDay(manifest, n, shouldFillRoutes, shouldWriteIntermediateFiles, shouldWriteColumnarFiles)
+                if isCurrent:
+                    print getSkippedSummary(manifest, n)['path'], "is up to date."
+                    continue
+                startDay(manifest, n, shouldWriteIntermediateFiles, shouldWriteColumnarFiles, fromConverted)
+                manifest.save()
+            summary = convertDay(n, routeMany=routeMany, writeIntermediateFiles=shouldWriteIntermediateFiles, writeColumnarFile=shouldWriteColumnarFiles, fromConverted=fromConverted)
+            print summary['path'], "created."
+            if summary['unfilled'] > 0:
+                print summary['unfilled'], "routes were missing from the route cache, so the day will be converted again."
+            if not manifest is None:
+                recordDay(manifest, n, summary, shouldFillRoutes, shouldWriteIntermediateFiles, shouldWriteColumnarFiles)
+                manifest.save()
+    finally:
+        if not manifest is None:
+            manifest.save()
+        if not router is None:
+            router.close()
+            if not router.cache is None:
+                print "Route cache hits:", router.cache.hits, "| misses:", router.cache.misses
+            if not router.index is None:
+                print "Routes reused:", router.index.reused
+
+if __name__ == '__main__':
+    main()
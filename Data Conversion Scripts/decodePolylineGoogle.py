@@ -1,3 +1,10 @@
+import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 def decode_line(encoded):
     
     """Decodes a polyline that was encoded using the Google Maps method.
@@ -51,6 +58,160 @@ def decode_line(encoded):
     
     return array
 
+def iter_decode_deltas(encoded):
+    
+    """Yields the (dlat, dlng) differences between the consecutive points of an encoded polyline.
+        
+        The bytes are read in a single pass, and a pair is yielded after every second value.
+        """
+    
+    dlat = None
+    shift = 0
+    result = 0
+    for b in bytearray(encoded):
+        b -= 63
+        result |= (b & 0x1f) << shift
+        if b < 0x20:
+            if dlat is None:
+                dlat = ~(result >> 1) if result & 1 else result >> 1
+            else:
+                yield dlat, ~(result >> 1) if result & 1 else result >> 1
+                dlat = None
+            shift = 0
+            result = 0
+        else:
+            shift += 5
+
+def iter_decode_line(encoded):
+    
+    """Yields the points of a polyline encoded using the Google Maps method one at a time.
+        
+        The points are exactly the ones returned by decode_line.
+        """
+    
+    if isinstance(encoded, unicode):  # e.g. a polyline from a JSON answer
+        encoded = encoded.encode('ascii')
+    lat = 0
+    lng = 0
+    
+    for dlat, dlng in iter_decode_deltas(encoded):
+        lat += dlat
+        lng += dlng
+        yield (lat * 1e-5, lng * 1e-5)
+
+def decode_lines(encoded_lines):
+    
+    """Decodes many polylines encoded using the Google Maps method at once.
+        
+        Returns (lats, lngs, offsets) where lats and lngs are array('d') of the points of all
+        the polylines one after the other, and the points of the ith polyline are the ones from
+        offsets[i] up to offsets[i+1]. The points are exactly the ones returned by decode_line.
+        
+        The bytes of all the polylines are decoded together with numpy when it is installed.
+        """
+    
+    encoded_lines = [encoded.encode('ascii') if isinstance(encoded, unicode) else encoded
+                     for encoded in encoded_lines]  # e.g. polylines from a JSON answer
+    if not numpy is None:
+        decoded = decode_lines_numpy(encoded_lines)
+        if not decoded is None:
+            return decoded
+    
+    lat_values = []
+    lng_values = []
+    offsets = [0]
+    
+    for encoded in encoded_lines:
+        lat = 0
+        lng = 0
+        for dlat, dlng in iter_decode_deltas(encoded):
+            lat += dlat
+            lng += dlng
+            lat_values.append(lat)
+            lng_values.append(lng)
+        offsets.append(len(lat_values))
+    
+    lats = array.array('d', [v * 1e-5 for v in lat_values])
+    lngs = array.array('d', [v * 1e-5 for v in lng_values])
+    return lats, lngs, array.array('l', offsets)
+
+def decode_lines_numpy(encoded_lines):
+    
+    """Decodes many encoded polylines at once like decode_lines, using numpy.
+        
+        Every byte of the polylines is decoded at once: a value ends at every byte without the
+        continuation bit (0x20), the 5-bit chunks of each value are shifted by their position in
+        the value and summed up, and the differences are summed up into the lat and lng values of
+        every polyline. Returns None if a polyline does not end with a complete (lat, lng) pair or
+        has a value too long for 64 bits, which are left to the pure Python decoding.
+        """
+    
+    lengths = numpy.array([len(encoded) for encoded in encoded_lines], dtype=numpy.int64)
+    line_ends = numpy.cumsum(lengths)
+    values = numpy.frombuffer(''.join(encoded_lines), dtype=numpy.uint8).astype(numpy.int64) - 63
+    if len(values) == 0:
+        return array.array('d'), array.array('d'), array.array('l', [0] * (len(encoded_lines) + 1))
+    
+    last = values < 0x20  # the last byte of every value
+    if not last[line_ends[lengths > 0] - 1].all():
+        return None
+    value_ends = numpy.flatnonzero(last) + 1
+    value_starts = numpy.concatenate(([0], value_ends[:-1]))
+    value_lengths = value_ends - value_starts
+    if value_lengths.max() > 12:
+        return None
+    
+    positions = numpy.arange(len(values)) - numpy.repeat(value_starts, value_lengths)
+    results = numpy.add.reduceat((values & 0x1f) << (5 * positions), value_starts)
+    deltas = numpy.where(results & 1, ~(results >> 1), results >> 1)
+    
+    # the no. of values up to the end of every polyline, which must be a whole no. of points
+    line_values = numpy.concatenate(([0], numpy.cumsum(last)))[line_ends]
+    if (line_values % 2).any():
+        return None
+    offsets = numpy.concatenate(([0], line_values // 2))
+    counts = numpy.diff(offsets)
+    
+    lat = numpy.cumsum(deltas[0::2])
+    lng = numpy.cumsum(deltas[1::2])
+    # the sums start again from 0 at the first point of every polyline
+    lat -= numpy.repeat(numpy.concatenate(([0], lat))[offsets[:-1]], counts)
+    lng -= numpy.repeat(numpy.concatenate(([0], lng))[offsets[:-1]], counts)
+    
+    lats = array.array('d', (lat * 1e-5).tostring())
+    lngs = array.array('d', (lng * 1e-5).tostring())
+    return lats, lngs, array.array('l', offsets.tolist())
+
+def encode_value(value, chars):
+    
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        chars.append((0x20 | (value & 0x1f)) + 63)
+        value >>= 5
+    chars.append(value + 63)
+
+def encode_line(points):
+    
+    """Encodes a list of (lat, lng) points using the Google Maps method.
+        
+        The values are rounded to 5 decimal places, so decode_line(encode_line(points)) gives
+        back the points of any polyline decoded by decode_line bit for bit.
+        """
+    
+    chars = bytearray()
+    last_lat = 0
+    last_lng = 0
+    
+    for lat, lng in points:
+        lat = int(round(lat * 1e5))
+        lng = int(round(lng * 1e5))
+        encode_value(lat - last_lat, chars)
+        encode_value(lng - last_lng, chars)
+        last_lat = lat
+        last_lng = lng
+    
+    return str(chars)
+
 def printPoints(line):
     latlngs = decode_line(line)
     for latlng in latlngs:
@@ -0,0 +1,141 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+########################################################################################################
+###
+### DESCRIPTION:
+###
+### Direction-of-movement computation shared by populateData.py and generateSampleData.py.
+###
+### Directions are computed for whole columns of lat/long values at once and returned as compact
+### codes (an array of unsigned bytes), with directionNames mapping the codes to 'N', 'NE', ... 'stat'.
+### The angle of movement is binned into the 8 directions with a lookup table on the 22.5 degree
+### slot it falls in, instead of a chain of comparisons. numpy is used for this when it is installed.
+###
+### compatible = True reproduces the directions of the original getDirection exactly, including its
+### quirks: the angle is measured from the latitude axis, so that e.g. moving east gives 'N', and
+### negative angles are adjusted with 180.0 - deg instead of 360.0 + deg. compatible = False gives
+### the compass direction of the movement.
+###
+########################################################################################################
+
+import array
+import itertools
+import math
+import operator
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+directionNames = ['$', 'stat', 'N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']  # code -> direction, '$' is the direction of the first point
+directionCodes = dict((name, code) for code, name in enumerate(directionNames))
+oppositeDirection = {'N': 'S', 'S': 'N', 'E': 'W', 'W': 'E', 'NE': 'SW', 'SW': 'NE',
+                        'SE': 'NW', 'NW': 'SE', 'stat': '--'}
+
+# direction codes for the 22.5 degree slots int(deg // 22.5) of the adjusted angle (0 <= deg <= 360)
+compatibleSlots = array.array('B', [directionCodes[name] for name in
+                    ['E', 'NE', 'NE', 'N', 'N', 'NW', 'NW', 'W', 'W', 'SW', 'SW', 'S', 'S', 'SE', 'SE', 'E', 'E']])
+compassSlots = array.array('B', [directionCodes[name] for name in
+                    ['N', 'NE', 'NE', 'E', 'E', 'SE', 'SE', 'S', 'S', 'SW', 'SW', 'W', 'W', 'NW', 'NW', 'N', 'N']])
+statCode = directionCodes['stat']
+
+def toNumpy(values):
+    """Returns values as a numpy array of floats, without copying them if they are an array('d')"""
+    
+    if isinstance(values, array.array) and values.typecode == 'd':
+        return numpy.frombuffer(values, dtype=numpy.float64)
+    return numpy.asarray(values, dtype=numpy.float64)
+
+def getCodes(dlats, dlongs, compatible=True):
+    """Returns the direction codes of the movements (dlat, dlong) as an array of unsigned bytes"""
+    
+    if compatible:
+        slots = compatibleSlots
+        adjustment = 180.0
+        sign = -1.0
+    else:
+        slots = compassSlots
+        adjustment = 360.0
+        sign = 1.0
+    if not numpy is None:
+        dlats = toNumpy(dlats)
+        dlongs = toNumpy(dlongs)
+        degs = numpy.degrees(numpy.arctan2(dlongs, dlats))
+        degs = numpy.where(degs >= 0.0, degs, adjustment + sign * degs)
+        codes = numpy.frombuffer(slots, dtype=numpy.uint8)[numpy.floor_divide(degs, 22.5).astype(numpy.intp)]
+        codes[(dlats == 0.0) & (dlongs == 0.0)] = statCode
+        return array.array('B', codes.tostring())
+    degs = map(math.degrees, map(math.atan2, dlongs, dlats))
+    return array.array('B', [(slots[int(deg // 22.5)] if deg >= 0.0 else slots[int((adjustment + sign * deg) // 22.5)]) if dlat or dlong else statCode
+                             for deg, dlat, dlong in itertools.izip(degs, dlats, dlongs)])
+
+def getDirections(lats, longs, compatible=True):
+    """Returns the direction codes of a trajectory given by its lat and long columns.
+    
+    The code of the ith point is the direction from point i-1 to point i, and the code of the first point is '$'.
+    
+    """
+    
+    if len(lats) == 0:
+        return array.array('B')
+    codes = array.array('B', [directionCodes['$']])
+    if not numpy is None:
+        codes.extend(getCodes(numpy.diff(toNumpy(lats)), numpy.diff(toNumpy(longs)), compatible))
+    else:
+        codes.extend(getCodes(map(operator.sub, lats[1:], lats[:-1]), map(operator.sub, longs[1:], longs[:-1]), compatible))
+    return codes
+
+def getDirectionsFrom(lat, long, lats, longs, compatible=True):
+    """Returns the direction codes from point (lat, long) to every point of the lat and long columns"""
+    
+    if not numpy is None:
+        return getCodes(toNumpy(lats) - lat, toNumpy(longs) - long, compatible)
+    return getCodes([v - lat for v in lats], [v - long for v in longs], compatible)
+
+def getDirection(lat1, long1, lat2, long2, compatible=True):
+    """Returns the direction from point (lat1, long1) to point (lat2, long2)"""
+    
+    return directionNames[getCodes([lat2 - lat1], [long2 - long1], compatible)[0]]
@@ -56,73 +56,71 @@
 ###
 ########################################################################################################
 
-import urllib
+import array
 import csv
-import json
-import math
+import itertools
+from populateData import writeRows
+from directionOfMovement import getDirections, directionNames
 
-def getDirection(lat1, long1, lat2, long2):
-    """Returns the direction from point (lat1, long1) to point (lat2, long2)"""
+header = ['timestamp', 'hour_of_day', 'day_of_week', 'latitude', 'longitude', 'original-data', 'direction_of_movement']
+
+def addDirections(rows, chunkSize=1000):
+    """Yields every populated row (a list of strings in the order of populateData.header) with the direction-of-movement appended.
+    
+    The directions are computed for chunkSize rows at a time.
+    
+    """
+    
+    lastLat = None
+    lastLong = None
+    chunk = []
+    for row in itertools.chain(rows, [None]):
+        if not row is None:
+            chunk.append(row)
+            if len(chunk) < chunkSize:
+                continue
+        if not chunk:
+            break
+        lats = array.array('d', [float(r[3]) for r in chunk])
+        longs = array.array('d', [float(r[4]) for r in chunk])
+        if lastLat is None:
+            codes = getDirections(lats, longs)
+        else:
+            # the direction of the first row of the chunk is from the last row of the previous chunk
+            codes = getDirections(array.array('d', [lastLat]) + lats, array.array('d', [lastLong]) + longs)[1:]
+        for r, code in zip(chunk, codes):
+            yield r[:6] + [directionNames[code]]
+        lastLat = lats[-1]
+        lastLong = longs[-1]
+        chunk = []
+
+def readPopulated(f):
+    """Yields the [timestamp, hour_of_day, day_of_week, latitude, longitude, original-data] lists from a populated data file"""
     
-    direction = ''
-    if lat1 == lat2 and long1 == long2:
-        direction = 'stat'
-    else:
-        deg = math.degrees(math.atan2((long2 - long1), (lat2 - lat1)))
-        if deg < 0.0:
-            deg = 180.0 - deg
-        if 22.5 <= deg < 67.5:
-            direction = 'NE'
-        elif 67.5 <= deg < 112.5:
-            direction = 'N'
-        elif 112.5 <= deg < 157.5:
-            direction = 'NW'
-        elif 157.5 <= deg < 202.5:
-            direction = 'W'
-        elif 202.5 <= deg < 247.5:
-            direction = 'SW'
-        elif 247.5 <= deg < 292.5:
-            direction = 'S'
-        elif 292.5 <= deg < 337.5:
-            direction = 'SE'
+    contents = csv.reader(f, delimiter=',')
+    first = True
+    for row in contents:
+        if first:
+            first = False
+            tsIdx = row.index('timestamp')
+            latIdx = row.index('latitude')
+            longIdx = row.index('longitude')
+            hrIdx = row.index('hour_of_day')
+            dayIdx = row.index('day_of_week')
+            origIdx = row.index('original-data')
         else:
-            direction = 'E'
-    return direction
-
-n1 = raw_input("Enter start file_number: ")
-n2 = raw_input("Enter end file_number: ")
-for n in range(int(n1), int(n2) + 1):
-    f = open("populated/populated_data_" + str(n) + ".txt")
-    outputFile = open("sample/sample_data_" + str(n) + ".txt", 'w')
-    with f, outputFile:
-        contents = csv.reader(f, delimiter=',')
-        first = True
-        table = []
-        latIdx = 0
-        longIdx = 0
-        timeIdx = 0
-        lastLat = None
-        lastLong = None
-        for row in contents:
-            if first:
-                first = False
-                tsIdx = row.index('timestamp')
-                latIdx = row.index('latitude')
-                longIdx = row.index('longitude')
-                hrIdx = row.index('hour_of_day')
-                dayIdx = row.index('day_of_week')
-                origIdx = row.index('original-data')
-            else:
-                direction = '$'
-                lat = float(row[latIdx])
-                long = float(row[longIdx])
-                if not lastLat is None:
-                    direction = getDirection(lastLat, lastLong, lat, long)
-                table.append([row[tsIdx], row[hrIdx], row[dayIdx], row[latIdx], row[longIdx], row[origIdx], direction])
-                lastLat = lat
-                lastLong = long
-        csvwriter = csv.writer(outputFile, delimiter=',')
-        csvwriter.writerow(['timestamp', 'hour_of_day', 'day_of_week', 'latitude', 'longitude', 'original-data', 'direction_of_movement'])
-        for row in table:
-            csvwriter.writerow(row)
-        print outputFile.name, "created and filled."
\ No newline at end of file
+            yield [row[tsIdx], row[hrIdx], row[dayIdx], row[latIdx], row[longIdx], row[origIdx]]
+
+def main():
+    n1 = raw_input("Enter start file_number: ")
+    n2 = raw_input("Enter end file_number: ")
+    for n in range(int(n1), int(n2) + 1):
+        f = open("populated/populated_data_" + str(n) + ".txt")
+        outputFile = open("sample/sample_data_" + str(n) + ".txt", 'w')
+        with f, outputFile:
+            for row in writeRows(addDirections(readPopulated(f)), outputFile, header):
+                pass
+            print outputFile.name, "created and filled."
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,436 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+########################################################################################################
+###
+### DESCRIPTION:
+###
+### A local routing engine that can be used by populateData.py instead of the Google Directions
+### service, e.g. on machines without access to the internet.
+###
+### The road network is read from a text file with one node or edge per line:
+###   n,<node id>,<latitude>,<longitude>
+###   e,<from node id>,<to node id>,<length in meters>[,<1 if the edge is one-way>]
+### (lines starting with '#' are ignored) and is kept as a compact adjacency structure.
+### Routes are found by snapping A and B to the nearest nodes of the network (within maxSnapDistance)
+### and running A* between them, or by querying a contraction hierarchy index precomputed from the
+### network by running this script.
+###
+########################################################################################################
+
+import array
+import cPickle
+import heapq
+import math
+
+earthRadius = 6371000.0  # in meters
+snapCellSize = 0.01  # size in degrees of the cells of the grid used to snap points to the nearest node
+maxSnapDistance = 1000.0  # max. distance in meters from a point to the node it is snapped to, points farther from the network are not routed (None for no limit)
+witnessSearchLimit = 500  # max. no. of nodes settled by a witness search while building a contraction hierarchy
+
+def getDistance(lat1, long1, lat2, long2):
+    """Returns the great-circle distance in meters between points (lat1, long1) and (lat2, long2)"""
+    
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(long2 - long1) / 2) ** 2
+    return 2 * earthRadius * math.asin(min(1.0, math.sqrt(a)))
+
+class RoadNetwork:
+    """A road network kept in compressed sparse row form.
+    
+    The edges leaving node u are edgeTarget[firstEdge[u]:firstEdge[u+1]] with the lengths
+    edgeLength[firstEdge[u]:firstEdge[u+1]]. Nodes are numbered 0...n-1 in the order of the file.
+    
+    """
+    
+    def __init__(self, latitudes, longitudes, edges):
+        self.latitudes = array.array('d', latitudes)
+        self.longitudes = array.array('d', longitudes)
+        edges = sorted(edges)
+        self.firstEdge = array.array('l', [0] * (len(self.latitudes) + 1))
+        for u, v, length in edges:
+            self.firstEdge[u + 1] = self.firstEdge[u + 1] + 1
+        for u in range(len(self.latitudes)):
+            self.firstEdge[u + 1] = self.firstEdge[u + 1] + self.firstEdge[u]
+        self.edgeTarget = array.array('l', [v for u, v, length in edges])
+        self.edgeLength = array.array('d', [length for u, v, length in edges])
+        self.grid = {}
+        for u in range(len(self.latitudes)):
+            self.grid.setdefault(self.getCell(self.latitudes[u], self.longitudes[u]), []).append(u)
+        if self.grid:
+            rows = [r for r, c in self.grid]
+            columns = [c for r, c in self.grid]
+            self.bounds = (min(rows), max(rows), min(columns), max(columns))  # first and last row and column of the cells with nodes
+    
+    @staticmethod
+    def load(path):
+        """Reads a road network file"""
+        
+        ids = {}
+        latitudes = []
+        longitudes = []
+        edges = []
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                fields = line.split(',')
+                if fields[0] == 'n':
+                    ids[fields[1]] = len(latitudes)
+                    latitudes.append(float(fields[2]))
+                    longitudes.append(float(fields[3]))
+                elif fields[0] == 'e':
+                    u = ids[fields[1]]
+                    v = ids[fields[2]]
+                    length = float(fields[3])
+                    edges.append((u, v, length))
+                    if len(fields) < 5 or fields[4] != '1':
+                        edges.append((v, u, length))
+        return RoadNetwork(latitudes, longitudes, edges)
+    
+    def getCell(self, lat, long):
+        return (int(math.floor(lat / snapCellSize)), int(math.floor(long / snapCellSize)))
+    
+    def getNearestNode(self, lat, long):
+        """Returns the node closest to (lat, long), or None if the network has no nodes within maxSnapDistance of it"""
+        
+        if not self.grid:
+            return None
+        row, column = self.getCell(lat, long)
+        firstRow, lastRow, firstColumn, lastColumn = self.bounds
+        # no cell with nodes is before the first ring that reaches the bounds or outside the last ring
+        firstRing = max(firstRow - row, row - lastRow, firstColumn - column, column - lastColumn, 0)
+        lastRing = max(row - firstRow, lastRow - row, column - firstColumn, lastColumn - column)
+        best = None
+        bestDistance = None
+        # the rings of cells around the cell of the point are searched until the nearest node found
+        # is closer than any node outside the rings searched so far can be
+        for ring in xrange(firstRing, lastRing + 1):
+            if not maxSnapDistance is None and self.getRingDistance(lat, ring - 1) > maxSnapDistance:
+                break
+            # only the cells of the ring within the bounds are visited
+            for r in xrange(max(row - ring, firstRow), min(row + ring, lastRow) + 1):
+                if abs(r - row) == ring:
+                    columns = xrange(max(column - ring, firstColumn), min(column + ring, lastColumn) + 1)
+                else:
+                    columns = [c for c in (column - ring, column + ring) if firstColumn <= c <= lastColumn]
+                for c in columns:
+                    for u in self.grid.get((r, c), []):
+                        distance = getDistance(lat, long, self.latitudes[u], self.longitudes[u])
+                        if bestDistance is None or distance < bestDistance:
+                            best = u
+                            bestDistance = distance
+            if not best is None and bestDistance <= self.getRingDistance(lat, ring):
+                break
+        if best is None or (not maxSnapDistance is None and bestDistance > maxSnapDistance):
+            return None
+        return best
+    
+    def getRingDistance(self, lat, ring):
+        """Returns a lower bound of the distance in meters from a point at latitude lat to the nodes outside the
+        first ring + 1 rings of cells around the cell of the point
+        
+        """
+        
+        if ring <= 0:
+            return 0.0
+        maxLat = min(abs(lat) + (ring + 1) * snapCellSize, 90.0)
+        return math.radians(ring * snapCellSize) * earthRadius * math.cos(math.radians(maxLat))
+    
+    def getPoints(self, path):
+        """Returns the (lat, long) points of the nodes on path, rounded as in decoded Google polylines"""
+        
+        return [(int(round(self.latitudes[u] * 1e5)) * 1e-5, int(round(self.longitudes[u] * 1e5)) * 1e-5) for u in path]
+    
+    def findPath(self, s, t):
+        """Returns the list of nodes on the shortest path from s to t found with A*, or None if t can not be reached"""
+        
+        latT = self.latitudes[t]
+        longT = self.longitudes[t]
+        distance = {s: 0.0}
+        parent = {s: None}
+        settled = set()
+        heap = [(getDistance(self.latitudes[s], self.longitudes[s], latT, longT), s)]
+        while heap:
+            f, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            if u == t:
+                path = []
+                while not u is None:
+                    path.append(u)
+                    u = parent[u]
+                return path[::-1]
+            settled.add(u)
+            for k in xrange(self.firstEdge[u], self.firstEdge[u + 1]):
+                v = self.edgeTarget[k]
+                d = distance[u] + self.edgeLength[k]
+                if v not in distance or d < distance[v]:
+                    distance[v] = d
+                    parent[v] = u
+                    heapq.heappush(heap, (d + getDistance(self.latitudes[v], self.longitudes[v], latT, longT), v))
+        return None
+
+class ContractionHierarchy:
+    """A contraction hierarchy index of a RoadNetwork for fast shortest-path queries.
+    
+    up[u] holds the edges (v, length) from u to higher ranked nodes and down[v] the edges (u, length)
+    into v from higher ranked nodes. middle[(u, v)] is the node bypassed by the shortcut u->v.
+    
+    """
+    
+    def __init__(self, up, down, middle):
+        self.up = up
+        self.down = down
+        self.middle = middle
+    
+    @staticmethod
+    def build(network):
+        """Builds the contraction hierarchy of network by contracting its nodes in the order of their edge difference"""
+        
+        n = len(network.latitudes)
+        outEdges = [dict() for u in range(n)]
+        inEdges = [dict() for u in range(n)]
+        for u in range(n):
+            for k in xrange(network.firstEdge[u], network.firstEdge[u + 1]):
+                v = network.edgeTarget[k]
+                if v != u and (v not in outEdges[u] or network.edgeLength[k] < outEdges[u][v]):
+                    outEdges[u][v] = network.edgeLength[k]
+                    inEdges[v][u] = network.edgeLength[k]
+        middle = {}
+        
+        def getShortcuts(v):
+            shortcuts = []
+            for u, lengthUV in inEdges[v].iteritems():
+                targets = dict((w, lengthUV + lengthVW) for w, lengthVW in outEdges[v].iteritems() if w != u)
+                if not targets:
+                    continue
+                witnessed = witnessSearch(u, v, targets, max(targets.itervalues()))
+                for w, length in targets.iteritems():
+                    if witnessed.get(w, float('inf')) > length:
+                        shortcuts.append((u, w, length))
+            return shortcuts
+        
+        def witnessSearch(s, skipped, targets, maxLength):
+            distance = {s: 0.0}
+            heap = [(0.0, s)]
+            settled = 0
+            while heap and settled < witnessSearchLimit:
+                d, u = heapq.heappop(heap)
+                if d > distance[u]:
+                    continue
+                if d > maxLength:
+                    break
+                settled = settled + 1
+                for w, length in outEdges[u].iteritems():
+                    if w == skipped:
+                        continue
+                    if w not in distance or d + length < distance[w]:
+                        distance[w] = d + length
+                        heapq.heappush(heap, (d + length, w))
+            return distance
+        
+        def getPriority(v):
+            return len(getShortcuts(v)) - len(inEdges[v]) - len(outEdges[v])
+        
+        heap = [(getPriority(v), v) for v in range(n)]
+        heapq.heapify(heap)
+        up = [None] * n
+        down = [None] * n
+        while heap:
+            priority, v = heapq.heappop(heap)
+            current = getPriority(v)
+            if heap and current > heap[0][0]:  # lazy update of the priority
+                heapq.heappush(heap, (current, v))
+                continue
+            for u, w, length in getShortcuts(v):
+                if w not in outEdges[u] or length < outEdges[u][w]:
+                    outEdges[u][w] = length
+                    inEdges[w][u] = length
+                    middle[(u, w)] = v
+            # all the nodes still adjacent to v are contracted after it, i.e. are ranked higher than v
+            up[v] = sorted(outEdges[v].items())
+            down[v] = sorted(inEdges[v].items())
+            for u in inEdges[v]:
+                del outEdges[u][v]
+            for w in outEdges[v]:
+                del inEdges[w][v]
+            outEdges[v] = {}
+            inEdges[v] = {}
+        return ContractionHierarchy(up, down, middle)
+    
+    @staticmethod
+    def load(path):
+        """Reads a contraction hierarchy index file written by save"""
+        
+        with open(path, 'rb') as f:
+            up, down, middle = cPickle.load(f)
+        return ContractionHierarchy(up, down, middle)
+    
+    def save(self, path):
+        """Writes the contraction hierarchy to an index file"""
+        
+        with open(path, 'wb') as f:
+            cPickle.dump((self.up, self.down, self.middle), f, cPickle.HIGHEST_PROTOCOL)
+    
+    def findPath(self, s, t):
+        """Returns the list of nodes on the shortest path from s to t, or None if t can not be reached"""
+        
+        distances = ({s: 0.0}, {t: 0.0})
+        parents = ({s: None}, {t: None})
+        heaps = ([(0.0, s)], [(0.0, t)])
+        edges = (self.up, self.down)
+        best = float('inf')
+        meeting = None
+        side = 0
+        while heaps[0] or heaps[1]:
+            if not heaps[side]:
+                side = 1 - side
+            d, u = heapq.heappop(heaps[side])
+            if d <= distances[side][u] and d < best:
+                if u in distances[1 - side] and d + distances[1 - side][u] < best:
+                    best = d + distances[1 - side][u]
+                    meeting = u
+                for v, length in edges[side][u]:
+                    if v not in distances[side] or d + length < distances[side][v]:
+                        distances[side][v] = d + length
+                        parents[side][v] = u
+                        heapq.heappush(heaps[side], (d + length, v))
+            if heaps[1 - side]:
+                side = 1 - side
+        if meeting is None:
+            return None
+        forward = []
+        u = meeting
+        while not u is None:
+            forward.append(u)
+            u = parents[0][u]
+        forward.reverse()
+        u = parents[1][meeting]
+        while not u is None:
+            forward.append(u)
+            u = parents[1][u]
+        path = [forward[0]]
+        for k in range(1, len(forward)):
+            path.extend(self.unpack(forward[k - 1], forward[k]))
+        return path
+    
+    def unpack(self, u, v):
+        """Returns the nodes after u on the path of original edges represented by the edge u->v"""
+        
+        stack = [(u, v)]
+        nodes = []
+        while stack:
+            a, b = stack.pop()
+            m = self.middle.get((a, b))
+            if m is None:
+                nodes.append(b)
+            else:
+                stack.append((m, b))
+                stack.append((a, m))
+        return nodes
+
+class LocalRouter:
+    """Looks up routes on a local RoadNetwork with the signature of populateData.getRoute and RoutingClient.routeMany"""
+    
+    def __init__(self, network, hierarchy=None):
+        self.network = network
+        self.hierarchy = hierarchy
+    
+    def route(self, latA, longA, latB, longB):
+        """Returns the list of points on the shortest route between A and B, or [] if there is none or A or B is
+        farther than maxSnapDistance from the network
+        
+        """
+        
+        s = self.network.getNearestNode(float(latA), float(longA))
+        t = self.network.getNearestNode(float(latB), float(longB))
+        if s is None or t is None:
+            return []
+        if self.hierarchy is None:
+            path = self.network.findPath(s, t)
+        else:
+            path = self.hierarchy.findPath(s, t)
+        if path is None:
+            return []
+        return self.network.getPoints(path)
+    
+    def routeMany(self, pairs):
+        """Returns the list of points on the route for every (latA, longA, latB, longB) pair"""
+        
+        return [self.route(latA, longA, latB, longB) for latA, longA, latB, longB in pairs]
+    
+    def close(self):
+        pass
+
+loadedRouters = {}
+
+def openLocalRouter(networkPath, indexPath=None):
+    """Returns a LocalRouter for the road network file and the optional contraction hierarchy index file.
+    
+    The files are read only once per process, so that the router can be opened for every file converted.
+    
+    """
+    
+    if (networkPath, indexPath) not in loadedRouters:
+        hierarchy = None
+        if not indexPath is None:
+            hierarchy = ContractionHierarchy.load(indexPath)
+        loadedRouters[(networkPath, indexPath)] = LocalRouter(RoadNetwork.load(networkPath), hierarchy)
+    return loadedRouters[(networkPath, indexPath)]
+
+def main():
+    networkPath = raw_input("Enter road network file: ")
+    indexPath = raw_input("Enter contraction hierarchy index file to create: ")
+    network = RoadNetwork.load(networkPath)
+    print "Road network loaded:", len(network.latitudes), "nodes,", len(network.edgeTarget), "edges"
+    hierarchy = ContractionHierarchy.build(network)
+    hierarchy.save(indexPath)
+    print indexPath, "created with", len(hierarchy.middle), "shortcuts."
+
+if __name__ == '__main__':
+    main()
@@ -60,43 +60,18 @@
 ##############################################################################################################
 
 import urllib
+import array
 import csv
+import itertools
 import json
-import math
 import time
-import datetime
 from decodePolylineGoogle import decode_line
-
-oppositeDirection = {'N': 'S', 'S': 'N', 'E': 'W', 'W': 'E', 'NE': 'SW', 'SW': 'NE',
-                        'SE': 'NW', 'NW': 'SE', 'stat': '--'}
-
-def getDirection(lat1, long1, lat2, long2):
-    """Returns the direction from point (lat1, long1) to point (lat2, long2)"""
-    
-    direction = ''
-    if lat1 == lat2 and long1 == long2:
-        direction = 'stat'
-    else:
-        deg = math.degrees(math.atan2((long2 - long1), (lat2 - lat1)))
-        if deg < 0.0:
-            deg = 180.0 - deg
-        if 22.5 <= deg < 67.5:
-            direction = 'NE'
-        elif 67.5 <= deg < 112.5:
-            direction = 'N'
-        elif 112.5 <= deg < 157.5:
-            direction = 'NW'
-        elif 157.5 <= deg < 202.5:
-            direction = 'W'
-        elif 202.5 <= deg < 247.5:
-            direction = 'SW'
-        elif 247.5 <= deg < 292.5:
-            direction = 'S'
-        elif 292.5 <= deg < 337.5:
-            direction = 'SE'
-        else:
-            direction = 'E'
-    return direction
+from directionOfMovement import getDirection, getDirectionsFrom, directionCodes, oppositeDirection
+from cleanAndConvertData import getHoursAndDays
+from routeCache import RouteCache
+from routingClient import RoutingClient
+from localRouter import openLocalRouter
+from routeIndex import RouteIndex
 
 def filter(points, latA, longA, latB, longB):
     """This filters out the points on the route from A to B that lie beyond A in B->A direction and beyond B in A->B direction"""
@@ -105,85 +80,238 @@ def filter(points, latA, longA, latB, longB):
     if dirAB == 'stat':
         return []
     dirBA = oppositeDirection[dirAB]
+    lats = array.array('d', [point[0] for point in points])
+    longs = array.array('d', [point[1] for point in points])
+    # a point lies beyond A in B->A direction if the direction from A to it is B->A, and beyond B
+    # in A->B direction if the direction from B to it is A->B
+    fromA = getDirectionsFrom(latA, longA, lats, longs)
+    fromB = getDirectionsFrom(latB, longB, lats, longs)
+    codeAB = directionCodes[dirAB]
+    codeBA = directionCodes[dirBA]
     i = 0
-    while i < len(points) and \
-        dirAB == oppositeDirection[getDirection(latA, longA, points[i][0], points[i][1])]:
+    while i < len(points) and fromA[i] == codeBA:
         i = i + 1
     j = len(points) - 1
-    while j >= 0 and \
-        dirBA == oppositeDirection[getDirection(latB, longB, points[j][0], points[j][1])]:
+    while j >= 0 and fromB[j] == codeAB:
         j = j - 1
     return points[i:(j + 1)]
 
 threshold = 120 * 60000
 # 120min or 2hr of time difference threshold is used to determine if approximation can be made on the route taken by the user
 req = "http://maps.googleapis.com/maps/api/directions/json?origin=%s,%s&destination=%s,%s&sensor=false"
-n1 = raw_input("Enter start file_number: ")
-n2 = raw_input("Enter end file_number: ")
-for n in range(int(n1), int(n2) + 1):
-    f = open("converted/converted_data_" + str(n) + ".txt")
-    outputFile = open("populated/populated_data_" + str(n) + ".txt", 'w')
-    table = []
-    latIdx = 0
-    longIdx = 0
-    tsIdx = 0
-    dayIdx = 0
-    hrIdx = 0
-
-    with f:
-        contents = csv.reader(f, delimiter=',')
-        first = True
-        for row in contents:
-            if first:
-                first = False
-                tsIdx = row.index('timestamp')
-                latIdx = row.index('latitude')
-                longIdx = row.index('longitude')
-                hrIdx = row.index('hour_of_day')
-                dayIdx = row.index('day_of_week')
-            else:
-                table.append(row)
-
-    filled_table = []
-    last = len(table) - 1
-    print "Creating populated/populated_data_" + str(n) + ".txt",
-    for i in range(last):
-        filled_table.append([table[i][tsIdx], table[i][hrIdx], table[i][dayIdx], table[i][latIdx], table[i][longIdx], '1'])
-        ts = int(table[i][tsIdx])
-        timegap = int(table[i+1][tsIdx]) - ts
-        if timegap <= threshold:
-            # Find both the routes A->B and B->A and use the one that has shorter overall distance
-            req1 = urllib.urlopen(req % (table[i][latIdx], table[i][longIdx],
-                                         table[i+1][latIdx], table[i+1][longIdx]))
-            req2 = urllib.urlopen(req % (table[i+1][latIdx], table[i+1][longIdx],
-                                         table[i][latIdx], table[i][longIdx]))
-            route1 = req1.read()
-            route2 = req2.read()
-            j1 = json.loads(route1)
-            j2 = json.loads(route2)
-            j = j1
-            if j2['routes'][0]['legs'][0]['distance']['value'] < j['routes'][0]['legs'][0]['distance']['value']:
-                j = j2
-            # j now has the route with the shortest distance between A and B
-            polyline = j['routes'][0]['overview_polyline']['points']
-            points = decode_line(polyline)  # returns a list of points by decoding the polyline string
-            filtered_points = filter(points, float(table[i][latIdx]), float(table[i][longIdx]), float(table[i+1][latIdx]), float(table[i+1][longIdx]))
-            step = timegap / (len(filtered_points) + 1)
-            t = ts + step
-            for point in filtered_points:
-                dt = (datetime.datetime.fromtimestamp(float(t)/1000.0) + datetime.timedelta(hours=16))
-                ds_hour = dt.strftime("%H")
-                ds_day = dt.strftime("%A")
-                filled_table.append([str(t), ds_hour, ds_day, str(point[0]), str(point[1]), '0'])
-                t = t + step
+requestDelay = 2  # seconds to wait after every route lookup to stay within the request limits of the Directions service
+routeCacheFile = None  # path of the persistent route cache file (e.g. "routes.db"), None disables the cache
+routeCachePrecision = 4  # no. of decimal places the lat/long values are rounded to in the keys of the route cache
+routeCacheSize = 100000  # max. no. of routes kept in the route cache, the least recently used ones are evicted
+shouldUseCacheOnly = False  # decides whether routes are looked up in the route cache only (offline mode)
+shouldReuseRoutes = False  # decides whether parts of the routes looked up before are reused for pairs of points on them (see routeIndex.py)
+routeReuseTolerance = 30.0  # max. distance in meters from a point to a route looked up before for the route to be reused
+maxReusedRoutes = 10000  # max. no. of routes kept for reuse, the oldest ones are dropped
+routingEngine = 'google'  # 'google' looks the routes up with the Google Directions service, 'local' with the local routing engine of localRouter.py
+roadNetworkFile = None  # road network file used by the local routing engine
+contractionHierarchyFile = None  # contraction hierarchy index of the road network used by the local routing engine, None uses A*
+requestsPerSecond = None  # max. requests per second made by the concurrent routing client, None looks the routes up one at a time with getRoute
+maxConcurrentRequests = 8  # no. of requests kept in flight at once by the concurrent routing client
+maxRetries = 5  # no. of times a request that failed transiently is retried by the concurrent routing client
+shouldUseWaypoints = False  # decides whether the concurrent routing client looks up each run of consecutive pairs with a single request through waypoints, which fills in the points of the full-resolution steps instead of the overview polyline
+maxWaypoints = 8  # max. no. of waypoints in a single request when shouldUseWaypoints is set
+shouldCompareReverseRoutes = True  # decides whether the routes B->A are also looked up and used when shorter when shouldUseWaypoints is set
+windowSize = 100  # no. of consecutive points whose routes are looked up together
+header = ['timestamp', 'hour_of_day', 'day_of_week', 'latitude', 'longitude', 'original-data']
+
+def getRoute(latA, longA, latB, longB):
+    """Returns the list of points on the route between A and B as given by the Google Directions service"""
+    
+    # Find both the routes A->B and B->A and use the one that has shorter overall distance
+    req1 = urllib.urlopen(req % (latA, longA, latB, longB))
+    req2 = urllib.urlopen(req % (latB, longB, latA, longA))
+    route1 = req1.read()
+    route2 = req2.read()
+    j1 = json.loads(route1)
+    j2 = json.loads(route2)
+    j = j1
+    if j2['routes'][0]['legs'][0]['distance']['value'] < j['routes'][0]['legs'][0]['distance']['value']:
+        j = j2
+    # j now has the route with the shortest distance between A and B
+    polyline = j['routes'][0]['overview_polyline']['points']
+    time.sleep(requestDelay)
+    return decode_line(polyline)  # returns a list of points by decoding the polyline string
+
+def openRouteCache():
+    """Returns the RouteCache configured by routeCacheFile, or None if the cache is disabled"""
+    
+    if routeCacheFile is None:
+        return None
+    return RouteCache(routeCacheFile, routeCachePrecision, routeCacheSize, shouldUseCacheOnly)
+
+class Router:
+    """Looks up the routes for lists of pairs of points as configured by the settings above.
+    
+    The routes are looked up by a routing engine, which is any object with a routeMany(pairs) method
+    returning the list of points for every (latA, longA, latB, longB) pair, and a close() method.
+    The engine is the local routing engine if routingEngine is 'local', and otherwise the concurrent
+    RoutingClient if requestsPerSecond is set, or getRoute one pair at a time if it is not.
+    The routes are answered from the route cache whenever it is enabled, and then from parts of the
+    routes looked up before if shouldReuseRoutes is set.
+    
+    """
+    
+    def __init__(self):
+        self.cache = openRouteCache()
+        self.engine = None
+        self.lookup = self.routeEach
+        if routingEngine == 'local':
+            self.engine = openLocalRouter(roadNetworkFile, contractionHierarchyFile)
+        elif not requestsPerSecond is None:
+            self.engine = RoutingClient(req, requestsPerSecond, 1, maxConcurrentRequests, maxRetries,
+                                        useWaypoints=shouldUseWaypoints, maxWaypoints=maxWaypoints,
+                                        compareReverse=shouldCompareReverseRoutes)
+        if not self.engine is None:
+            self.lookup = self.engine.routeMany
+        self.index = None
+        if shouldReuseRoutes:
+            self.index = RouteIndex(routeReuseTolerance, maxReusedRoutes)
+            if not self.cache is None:
+                routes = list(itertools.islice(self.cache.getRoutes(), maxReusedRoutes))
+                for points in reversed(routes):
+                    self.index.add(points)
+            self.lookup = self.index.reusedRouteMany(self.lookup)
+        if not self.cache is None:
+            self.lookup = self.cache.cachedRouteMany(self.lookup)
+    
+    def routeEach(self, pairs):
+        """Returns the list of points on the route for every (latA, longA, latB, longB) pair using getRoute"""
+        
+        return [getRoute(latA, longA, latB, longB) for latA, longA, latB, longB in pairs]
+    
+    def routeMany(self, pairs):
+        """Returns the list of points on the route for every (latA, longA, latB, longB) pair"""
+        
+        return self.lookup(pairs)
+    
+    def commit(self):
+        """Commits the pending changes of the route cache"""
+        
+        if not self.cache is None:
+            self.cache.commit()
+    
+    def close(self):
+        """Closes the route cache and the routing engine"""
+        
+        if not self.cache is None:
+            self.cache.close()
+        if not self.engine is None:
+            self.engine.close()
+
+def fillWindow(window, routeMany, summary=None):
+    """Yields the populated rows for window[1:] together with the points added between every consecutive pair of rows in window.
+    
+    A route of None from routeMany (a route missing from the route cache in the cache-only mode) adds no points,
+    and is counted in summary['unfilled'] if summary is not None.
+    
+    """
+    
+    pairs = []
+    for i in range(1, len(window)):
+        if not routeMany is None and int(window[i][0]) - int(window[i-1][0]) <= threshold:
+            pairs.append(i)
+    routes = {}
+    if pairs:
+        points = routeMany([(window[i-1][3], window[i-1][4], window[i][3], window[i][4]) for i in pairs])
+        routes = dict(zip(pairs, points))
+    for i in range(1, len(window)):
+        if i in routes and routes[i] is None:
+            if not summary is None:
+                summary['unfilled'] = summary['unfilled'] + 1
+        elif i in routes:
+            last = window[i-1]
+            row = window[i]
+            ts = int(last[0])
+            timegap = int(row[0]) - ts
+            filtered_points = filter(routes[i], float(last[3]), float(last[4]), float(row[3]), float(row[4]))
+            step = timegap // (len(filtered_points) + 1)
+            times = [ts + step * (k + 1) for k in range(len(filtered_points))]
+            hours, days = getHoursAndDays(times)
+            for point, t, ds_hour, ds_day in zip(filtered_points, times, hours, days):
+                yield [str(t), ds_hour, ds_day, str(point[0]), str(point[1]), '0']
+        yield window[i][:5] + ['1']
+
+def populate(rows, routeMany=None, windowSize=windowSize, summary=None):
+    """Yields the populated rows for the rows of a single day.
+    
+    rows is an iterable of [timestamp, hour_of_day, day_of_week, latitude, longitude] lists of strings.
+    For every consecutive pair of rows within the time difference threshold, the points on the route
+    between them are yielded in between with original-data = 0. The routes are looked up by routeMany
+    for windowSize rows at a time, so that a concurrent router can look them up in parallel.
+    If routeMany is None, only the original rows are yielded. If summary is not None, the pairs whose route
+    could not be looked up are counted in summary['unfilled'].
+    
+    """
+    
+    window = []
+    for row in rows:
+        if not window:
+            yield row[:5] + ['1']
+        window.append(row)
+        if len(window) > windowSize:
+            for filledRow in fillWindow(window, routeMany, summary):
+                yield filledRow
+            window = window[-1:]
+    for filledRow in fillWindow(window, routeMany, summary):
+        yield filledRow
+
+def readConverted(f):
+    """Yields the [timestamp, hour_of_day, day_of_week, latitude, longitude] lists from a converted data file"""
+    
+    contents = csv.reader(f, delimiter=',')
+    first = True
+    for row in contents:
+        if first:
+            first = False
+            tsIdx = row.index('timestamp')
+            latIdx = row.index('latitude')
+            longIdx = row.index('longitude')
+            hrIdx = row.index('hour_of_day')
+            dayIdx = row.index('day_of_week')
+        else:
+            yield [row[tsIdx], row[hrIdx], row[dayIdx], row[latIdx], row[longIdx]]
+
+def writeRows(rows, outputFile, header):
+    """Writes the rows to outputFile as csv preceded by header, yielding each row back after it has been written"""
+    
+    csvwriter = csv.writer(outputFile, delimiter=',')
+    csvwriter.writerow(header)
+    for row in rows:
+        csvwriter.writerow(row)
+        yield row
+
+def main():
+    router = Router()
+    
+    def routeMany(pairs):
+        routes = router.routeMany(pairs)
+        for route in routes:
             print '.',
-            time.sleep(2)
-    filled_table.append([table[last][tsIdx], table[last][hrIdx], table[last][dayIdx], table[last][latIdx], table[last][longIdx], '1'])
-    print 'done'
-
-    with outputFile:
-        csvwriter = csv.writer(outputFile, delimiter=',')
-        csvwriter.writerow(['timestamp', 'hour_of_day', 'day_of_week', 'latitude', 'longitude', 'original-data'])
-        for row in filled_table:
-            csvwriter.writerow(row)
-        print outputFile.name, "created."
\ No newline at end of file
+        return routes
+    
+    n1 = raw_input("Enter start file_number: ")
+    n2 = raw_input("Enter end file_number: ")
+    try:
+        for n in range(int(n1), int(n2) + 1):
+            f = open("converted/converted_data_" + str(n) + ".txt")
+            outputFile = open("populated/populated_data_" + str(n) + ".txt", 'w')
+            with f, outputFile:
+                print "Creating populated/populated_data_" + str(n) + ".txt",
+                for row in writeRows(populate(readConverted(f), routeMany), outputFile, header):
+                    pass
+                print 'done'
+                print outputFile.name, "created."
+    finally:
+        router.close()
+        if not router.cache is None:
+            print "Route cache hits:", router.cache.hits, "| misses:", router.cache.misses
+        if not router.index is None:
+            print "Routes reused:", router.index.reused
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+########################################################################################################
+###
+### DESCRIPTION:
+###
+### Reads the raw GPS data files provided by Huawei (project_gps_edited_<i>.txt) in batches of columns.
+###
+### A raw data file has two kinds of '|' separated rows:
+###   location rows: timestamp|GPS_timestamp|latitude|longitude|altitude|Accuracy|bearing|speed
+###   status rows:   timestamp|status
+### The file is memory-mapped (or, for other iterables of lines, read a chunk of lines at a time) and
+### split into blocks of whole lines of about blockSize bytes. The rows of a block are separated by
+### their no. of fields into location and status rows, and the rows of each kind are split into their
+### columns in bulk, so that the file is never held in memory as a whole and neither kind of row is
+### lost. Rows of any other form are skipped.
+###
+########################################################################################################
+
+import array
+import itertools
+import mmap
+from calendarFeatures import toMilliseconds
+
+blockSize = 1 << 22  # approximate no. of bytes of raw data split into rows at a time
+locationColumns = ['timestamp', 'GPS_timestamp', 'latitude', 'longitude', 'altitude', 'Accuracy', 'bearing', 'speed']
+statusColumns = ['timestamp', 'status']
+integerColumns = set(['timestamp', 'GPS_timestamp', 'status'])
+
+class ColumnBatch:
+    """The columns of a batch of raw rows of one kind.
+    
+    The text of every column is kept as it appears in the raw data, so that it can be written back
+    unchanged, and typed values are computed on request: integers for the timestamps and the status,
+    and array('d') of floats for the other columns.
+    
+    """
+    
+    def __init__(self, names, lines):
+        self.names = names
+        fields = '|'.join(lines).split('|') if lines else []
+        self.columns = dict((name, fields[k::len(names)]) for k, name in enumerate(names))
+        self.values = {}
+    
+    def __len__(self):
+        return len(self.columns[self.names[0]])
+    
+    def getText(self, name):
+        """Returns the strings of column name"""
+        
+        return self.columns[name]
+    
+    def getValues(self, name):
+        """Returns the typed values of column name"""
+        
+        if name not in self.values:
+            if name in integerColumns:
+                try:
+                    self.values[name] = map(int, self.columns[name])
+                except ValueError:
+                    self.values[name] = map(toMilliseconds, self.columns[name])
+            else:
+                self.values[name] = array.array('d', map(float, self.columns[name]))
+        return self.values[name]
+
+def splitBlock(block):
+    """Returns the location and status ColumnBatch of a block of whole raw lines"""
+    
+    lines = block.split('\n')
+    if '\r' in block:
+        lines = [line.rstrip('\r') for line in lines]
+    counts = map(str.count, lines, itertools.repeat('|', len(lines)))
+    locations = [line for line, count in itertools.izip(lines, counts) if count == len(locationColumns) - 1]
+    statuses = [line for line, count in itertools.izip(lines, counts) if count == len(statusColumns) - 1]
+    return ColumnBatch(locationColumns, locations), ColumnBatch(statusColumns, statuses)
+
+def readMappedBlocks(f):
+    """Yields the blocks of whole lines of the memory-mapped file f"""
+    
+    try:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:  # an empty file cannot be mapped
+        return
+    try:
+        start = 0
+        while start < len(data):
+            end = data.find('\n', min(start + blockSize, len(data)) - 1)
+            if end < 0:
+                end = len(data)
+            yield data[start:end]
+            start = end + 1
+    finally:
+        data.close()
+
+def readLineBlocks(lines):
+    """Yields the blocks of whole lines of an iterable of lines"""
+    
+    chunk = []
+    size = 0
+    for line in lines:
+        chunk.append(line.rstrip('\n'))
+        size = size + len(line)
+        if size >= blockSize:
+            yield '\n'.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield '\n'.join(chunk)
+
+def readBatches(lines):
+    """Yields a (location ColumnBatch, status ColumnBatch) pair for every block of the raw data.
+    
+    lines is either an open raw data file, which is memory-mapped, or any other iterable of raw lines.
+    
+    """
+    
+    if isinstance(lines, file):
+        blocks = readMappedBlocks(lines)
+    else:
+        blocks = readLineBlocks(lines)
+    for block in blocks:
+        yield splitBlock(block)
+
+def readLocationBatches(lines):
+    """Yields the location ColumnBatch of every block of the raw data"""
+    
+    return itertools.imap(lambda batches: batches[0], readBatches(lines))
+
+def readStatusBatches(lines):
+    """Yields the status ColumnBatch of every block of the raw data"""
+    
+    return itertools.imap(lambda batches: batches[1], readBatches(lines))
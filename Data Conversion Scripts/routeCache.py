@@ -0,0 +1,184 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+########################################################################################################
+###
+### DESCRIPTION:
+###
+### A persistent cache for the routes looked up by populateData.py.
+###
+### The routes are kept in a single sqlite file, keyed by the origin and destination of the route
+### rounded to a configurable no. of decimal places, so that the routes between the places a user
+### visits every day are only looked up once. The cache holds a bounded no. of routes and evicts
+### the least recently used ones when it is full. Routes are stored as encoded polylines.
+###
+########################################################################################################
+
+import json
+import sqlite3
+import time
+from decodePolylineGoogle import decode_line, decode_lines, encode_line
+
+class RouteCache:
+    
+    def __init__(self, path, precision=4, maxEntries=100000, cacheOnly=False, commitInterval=100):
+        self.path = path
+        self.precision = precision
+        self.maxEntries = maxEntries
+        self.cacheOnly = cacheOnly
+        self.commitInterval = commitInterval
+        self.hits = 0
+        self.misses = 0
+        self.pendingChanges = 0
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS routes (key TEXT PRIMARY KEY, points TEXT NOT NULL, used REAL NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS routes_used ON routes (used)')
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] < 1:
+            # cache files written before the routes were stored as encoded polylines have them as JSON lists
+            rows = self.connection.execute('SELECT key, points FROM routes').fetchall()
+            for key, points in rows:
+                self.connection.execute('UPDATE routes SET points = ? WHERE key = ?', (encode_line(json.loads(points)), key))
+            self.connection.execute('PRAGMA user_version = 1')
+        self.connection.commit()
+        self.size = self.connection.execute('SELECT COUNT(*) FROM routes').fetchone()[0]
+    
+    def getKey(self, latA, longA, latB, longB):
+        """Returns the cache key for the route from A to B after rounding the lat/long values to the cache precision"""
+        
+        return ','.join(['%.*f' % (self.precision, float(v)) for v in (latA, longA, latB, longB)])
+    
+    def get(self, key):
+        """Returns the list of points cached for key, or None if the route is not in the cache"""
+        
+        row = self.connection.execute('SELECT points FROM routes WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self.connection.execute('UPDATE routes SET used = ? WHERE key = ?', (time.time(), key))
+        self.changed()
+        return decode_line(row[0])
+    
+    def put(self, key, points):
+        """Adds the list of points for key to the cache, evicting the least recently used routes if the cache is full"""
+        
+        self.connection.execute('INSERT OR REPLACE INTO routes (key, points, used) VALUES (?, ?, ?)',
+                                (key, encode_line(points), time.time()))
+        self.size = self.size + 1
+        if self.size > self.maxEntries:
+            # the file may be shared with other processes, so the no. of routes is counted again before evicting
+            self.size = self.connection.execute('SELECT COUNT(*) FROM routes').fetchone()[0]
+            if self.size > self.maxEntries:
+                self.connection.execute('DELETE FROM routes WHERE key IN (SELECT key FROM routes ORDER BY used LIMIT ?)',
+                                        (self.size - self.maxEntries,))
+                self.size = self.maxEntries
+        self.changed()
+    
+    def getRoutes(self):
+        """Yields the list of points of every route in the cache, the most recently used first"""
+        
+        cursor = self.connection.execute('SELECT points FROM routes ORDER BY used DESC')
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            lats, longs, offsets = decode_lines([row[0] for row in rows])
+            for i in range(len(rows)):
+                yield zip(lats[offsets[i]:offsets[i + 1]], longs[offsets[i]:offsets[i + 1]])
+    
+    def changed(self):
+        """Commits the changes made to the cache once every commitInterval changes"""
+        
+        self.pendingChanges = self.pendingChanges + 1
+        if self.pendingChanges >= self.commitInterval:
+            self.commit()
+    
+    def commit(self):
+        """Commits the pending changes to the cache file"""
+        
+        self.connection.commit()
+        self.pendingChanges = 0
+    
+    def cachedRouteMany(self, routeMany):
+        """Returns a function with the signature of routeMany that answers lookups from the cache when it can.
+        
+        The pairs missing from the cache are passed on to routeMany together and its answers are added
+        to the cache, unless the cache is in the cache-only (offline) mode, in which case None is
+        returned for them.
+        
+        """
+        
+        def lookup(pairs):
+            routes = []
+            missing = []
+            waiting = {}  # indices of the routes waiting for each missing key
+            for pair in pairs:
+                key = self.getKey(*pair)
+                if key in waiting:  # the same route has already been missed in this lookup
+                    self.hits = self.hits + 1
+                    waiting[key].append(len(routes))
+                    routes.append(None)
+                    continue
+                points = self.get(key)
+                if points is None:
+                    self.misses = self.misses + 1
+                    missing.append((key, pair))
+                    waiting[key] = [len(routes)]
+                    points = None
+                else:
+                    self.hits = self.hits + 1
+                routes.append(points)
+            if missing and not self.cacheOnly:
+                for (key, pair), points in zip(missing, routeMany([pair for key, pair in missing])):
+                    self.put(key, points)
+                    for i in waiting[key]:
+                        routes[i] = points
+            return routes
+        
+        return lookup
+    
+    def close(self):
+        """Commits the pending changes and closes the cache file"""
+        
+        self.commit()
+        self.connection.close()
@@ -0,0 +1,198 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+########################################################################################################
+###
+### DESCRIPTION:
+###
+### A spatial index over the routes looked up by populateData.py, used to answer the lookups for
+### pairs of points that lie on a road looked up before (e.g. the daily commute) without asking
+### the routing engine again.
+###
+### The segments of every route are kept in a grid. When both points of a pair snap within a
+### tolerance onto the same route, with A before B along the route, the part of the route between
+### them is returned. populateData.filter is still applied to it as to any other route.
+###
+########################################################################################################
+
+import collections
+import math
+
+metersPerDegree = 111195.0  # length in meters of a degree of latitude
+
+class RouteIndex:
+    
+    def __init__(self, tolerance=30.0, maxRoutes=10000):
+        self.tolerance = tolerance
+        self.maxRoutes = maxRoutes
+        self.cellSize = tolerance / metersPerDegree
+        self.cells = collections.defaultdict(list)  # cell -> list of (route id, segment index)
+        self.routes = {}  # route id -> list of points
+        self.routeCells = {}  # route id -> set of the cells the route is in
+        self.order = collections.deque()  # route ids in the order they were added
+        self.nextId = 0
+        self.reused = 0
+    
+    def getCell(self, lat, long):
+        return (int(math.floor(lat / self.cellSize)), int(math.floor(long / self.cellSize)))
+    
+    def add(self, points):
+        """Adds the route through points to the index, removing the oldest route if the index is full"""
+        
+        if len(points) < 2:
+            return
+        routeId = self.nextId
+        self.nextId = self.nextId + 1
+        self.routes[routeId] = points
+        cells = set()
+        for i in range(len(points) - 1):
+            (lat1, long1), (lat2, long2) = points[i], points[i + 1]
+            # the segment is sampled at every cell length so that every cell it crosses is found
+            steps = int(max(abs(lat2 - lat1), abs(long2 - long1)) / self.cellSize) + 1
+            segmentCells = set()
+            for k in range(steps + 1):
+                segmentCells.add(self.getCell(lat1 + (lat2 - lat1) * k / float(steps), long1 + (long2 - long1) * k / float(steps)))
+            for cell in segmentCells:
+                self.cells[cell].append((routeId, i))
+            cells.update(segmentCells)
+        self.routeCells[routeId] = cells
+        self.order.append(routeId)
+        if len(self.order) > self.maxRoutes:
+            self.remove(self.order.popleft())
+    
+    def remove(self, routeId):
+        """Removes a route from the index"""
+        
+        for cell in self.routeCells.pop(routeId):
+            entries = [entry for entry in self.cells[cell] if entry[0] != routeId]
+            if entries:
+                self.cells[cell] = entries
+            else:
+                del self.cells[cell]
+        del self.routes[routeId]
+    
+    def snap(self, lat, long):
+        """Returns a dictionary of route id -> (position along the route, distance) for the routes within tolerance of (lat, long).
+        
+        The position is (i, t) for the point at fraction t of the way from points[i] to points[i+1].
+        
+        """
+        
+        scale = math.cos(math.radians(lat))  # meters along a degree of longitude relative to a degree of latitude
+        row, column = self.getCell(lat, long)
+        snapped = {}
+        seen = set()
+        for r in (row - 1, row, row + 1):
+            for c in (column - 1, column, column + 1):
+                for entry in self.cells.get((r, c), []):
+                    if entry in seen:
+                        continue
+                    seen.add(entry)
+                    routeId, i = entry
+                    points = self.routes[routeId]
+                    # the point is projected onto the segment in a local flat approximation
+                    x1 = (points[i][1] - long) * scale
+                    y1 = points[i][0] - lat
+                    x2 = (points[i + 1][1] - long) * scale
+                    y2 = points[i + 1][0] - lat
+                    dx = x2 - x1
+                    dy = y2 - y1
+                    t = 0.0
+                    if dx != 0.0 or dy != 0.0:
+                        t = min(1.0, max(0.0, -(x1 * dx + y1 * dy) / (dx * dx + dy * dy)))
+                    distance = math.hypot(x1 + t * dx, y1 + t * dy) * metersPerDegree
+                    if distance <= self.tolerance and (routeId not in snapped or distance < snapped[routeId][1]):
+                        snapped[routeId] = ((i, t), distance)
+        return snapped
+    
+    def find(self, latA, longA, latB, longB):
+        """Returns the points of a route in the index between A and B, or None if there is no route that passes A and then B.
+        
+        A and B must snap onto different segments of the route: when they are on the same segment there are no
+        points of the route between them to return, and the pair is left to the routing engine.
+        
+        """
+        
+        snappedA = self.snap(float(latA), float(longA))
+        if not snappedA:
+            return None
+        snappedB = self.snap(float(latB), float(longB))
+        best = None
+        bestDistance = None
+        for routeId, (positionA, distanceA) in snappedA.iteritems():
+            if routeId in snappedB:
+                positionB, distanceB = snappedB[routeId]
+                if positionA[0] < positionB[0] and (best is None or distanceA + distanceB < bestDistance):
+                    best = (routeId, positionA[0], positionB[0])
+                    bestDistance = distanceA + distanceB
+        if best is None:
+            return None
+        routeId, i, j = best
+        return self.routes[routeId][(i + 1):(j + 1)]
+    
+    def reusedRouteMany(self, routeMany):
+        """Returns a function with the signature of routeMany that answers lookups from the routes in the index when it can.
+        
+        The other pairs are passed on to routeMany together and the routes it returns are added to the index.
+        
+        """
+        
+        def lookup(pairs):
+            routes = []
+            missing = []
+            for pair in pairs:
+                points = self.find(*pair)
+                if points is None:
+                    missing.append(len(routes))
+                else:
+                    self.reused = self.reused + 1
+                routes.append(points)
+            if missing:
+                for i, points in zip(missing, routeMany([pairs[i] for i in missing])):
+                    self.add(points)
+                    routes[i] = points
+            return routes
+        
+        return lookup
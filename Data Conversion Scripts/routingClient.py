@@ -0,0 +1,309 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+########################################################################################################
+###
+### DESCRIPTION:
+###
+### A concurrent client for the Google Directions service used by populateData.py.
+###
+### The client keeps many route lookups in flight at once on a pool of worker threads, each of which
+### reuses its own keep-alive HTTP connection. Instead of sleeping for a fixed time after every
+### lookup, requests are paced by a token bucket so that the no. of requests per second stays within
+### the quota of the service, and transient failures are retried with exponential backoff.
+###
+### With useWaypoints, a run of consecutive pairs is looked up with one request through waypoints.
+### The service only gives the simplified overview_polyline for a whole route, so the points of each
+### pair are then taken from the step polylines of its leg. These follow the road at full resolution,
+### so a pair can get more (and slightly different) points than with one request per pair.
+###
+########################################################################################################
+
+import httplib
+import json
+import random
+import socket
+import threading
+import time
+import urlparse
+import Queue
+from decodePolylineGoogle import decode_line
+
+transientStatuses = set(['OVER_QUERY_LIMIT', 'UNKNOWN_ERROR'])  # Directions statuses worth retrying
+
+class TransientError(Exception):
+    pass
+
+class TokenBucket:
+    """Paces the requests made by all the threads of a client to at most rate requests per second.
+    
+    Up to burst requests can be made at once after the bucket has been idle.
+    
+    """
+    
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Blocks until a token is available and takes it"""
+        
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens = self.tokens - 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class RoutingClient:
+    
+    def __init__(self, req, requestsPerSecond=10, burst=1, connections=8, maxRetries=5, backoff=1.0, timeout=30,
+                 useWaypoints=False, maxWaypoints=8, compareReverse=True):
+        self.req = req
+        self.useWaypoints = useWaypoints
+        self.maxWaypoints = maxWaypoints
+        self.compareReverse = compareReverse
+        self.bucket = TokenBucket(requestsPerSecond, burst)
+        self.maxRetries = maxRetries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.requests = 0
+        self.retries = 0
+        self.countLock = threading.Lock()
+        self.jobs = Queue.Queue()
+        self.workers = []
+        for i in range(connections):
+            worker = threading.Thread(target=self.work)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+    
+    def work(self):
+        """Runs the lookups queued in self.jobs on a keep-alive connection owned by the thread"""
+        
+        connections = {}
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            url, i, results = job
+            try:
+                results.put((i, self.fetch(connections, url), None))
+            except Exception as e:
+                results.put((i, None, e))
+        for connection in connections.values():
+            connection.close()
+    
+    def fetch(self, connections, url):
+        """Returns the decoded JSON answer for url, retrying transient failures with exponential backoff"""
+        
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+        if query:
+            path = path + '?' + query
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            with self.countLock:
+                self.requests = self.requests + 1
+            try:
+                connection = connections.get((scheme, netloc))
+                if connection is None:
+                    if scheme == 'https':
+                        connection = httplib.HTTPSConnection(netloc, timeout=self.timeout)
+                    else:
+                        connection = httplib.HTTPConnection(netloc, timeout=self.timeout)
+                    connections[(scheme, netloc)] = connection
+                try:
+                    connection.request('GET', path)
+                    response = connection.getresponse()
+                    body = response.read()
+                except (socket.error, httplib.HTTPException) as e:
+                    # the connection can not be reused after a failure
+                    connection.close()
+                    del connections[(scheme, netloc)]
+                    raise TransientError(str(e))
+                if response.status == 429 or response.status >= 500:
+                    raise TransientError('HTTP %d' % response.status)
+                j = json.loads(body)
+                if j.get('status') in transientStatuses:
+                    raise TransientError(j['status'])
+                return j
+            except TransientError:
+                if attempt >= self.maxRetries:
+                    raise
+                with self.countLock:
+                    self.retries = self.retries + 1
+                time.sleep(self.backoff * (2 ** attempt) * (1 + random.random()))
+                attempt = attempt + 1
+    
+    def fetchAll(self, urls):
+        """Fetches all the urls concurrently and returns their decoded JSON answers in the same order"""
+        
+        results = Queue.Queue()
+        for i, url in enumerate(urls):
+            self.jobs.put((url, i, results))
+        answers = [None] * len(urls)
+        error = None
+        for k in range(len(urls)):
+            i, answer, e = results.get()
+            answers[i] = answer
+            if error is None:
+                error = e
+        if not error is None:
+            raise error
+        return answers
+    
+    def routeMany(self, pairs):
+        """Returns the list of points on the route for every (latA, longA, latB, longB) pair.
+        
+        As in populateData.getRoute, both the routes A->B and B->A are looked up and the one
+        with the shorter overall distance is used.
+        
+        """
+        
+        if self.useWaypoints:
+            return self.routeRuns(pairs)
+        urls = []
+        for latA, longA, latB, longB in pairs:
+            urls.append(self.req % (latA, longA, latB, longB))
+            urls.append(self.req % (latB, longB, latA, longA))
+        answers = self.fetchAll(urls)
+        routes = []
+        for k in range(len(pairs)):
+            j1 = answers[2 * k]
+            j2 = answers[2 * k + 1]
+            j = j1
+            if j2['routes'][0]['legs'][0]['distance']['value'] < j['routes'][0]['legs'][0]['distance']['value']:
+                j = j2
+            routes.append(decode_line(j['routes'][0]['overview_polyline']['points']))
+        return routes
+    
+    def splitRuns(self, pairs):
+        """Returns the runs of consecutive pairs (where B of a pair is A of the next) as lists of indices into pairs.
+        
+        A run has at most maxWaypoints + 1 pairs, i.e. the no. of legs of a request with maxWaypoints waypoints.
+        
+        """
+        
+        runs = []
+        for i in range(len(pairs)):
+            if runs and len(runs[-1]) <= self.maxWaypoints and pairs[runs[-1][-1]][2:] == pairs[i][:2]:
+                runs[-1].append(i)
+            else:
+                runs.append([i])
+        return runs
+    
+    def getRunUrl(self, points):
+        """Returns the url of the request for the route through all the (lat, long) points in order"""
+        
+        url = self.req % (points[0][0], points[0][1], points[-1][0], points[-1][1])
+        if len(points) > 2:
+            url = url + '&waypoints=' + '%7C'.join(['%s,%s' % point for point in points[1:-1]])
+        return url
+    
+    def getLegs(self, j):
+        """Returns the (distance, list of points) of every leg of the first route in the answer j.
+        
+        The points of a leg come from its step polylines, as the overview_polyline used by routeMany covers the whole
+        route, so they are not the same points as those of a request for the pair alone (see the description above).
+        
+        """
+        
+        legs = []
+        for leg in j['routes'][0]['legs']:
+            points = []
+            for step in leg['steps']:
+                stepPoints = decode_line(step['polyline']['points'])
+                if points and stepPoints and points[-1] == stepPoints[0]:
+                    stepPoints = stepPoints[1:]
+                points.extend(stepPoints)
+            legs.append((leg['distance']['value'], points))
+        return legs
+    
+    def routeRuns(self, pairs):
+        """Returns the list of points on the route for every pair, making a single request for each run of pairs.
+        
+        If compareReverse is set, every run is also looked up in the reverse order, and for each pair the
+        route of the direction with the shorter leg is used, as in routeMany.
+        
+        """
+        
+        runs = self.splitRuns(pairs)
+        urls = []
+        for run in runs:
+            points = [pairs[run[0]][:2]] + [pairs[i][2:] for i in run]
+            urls.append(self.getRunUrl(points))
+            if self.compareReverse:
+                urls.append(self.getRunUrl(points[::-1]))
+        answers = self.fetchAll(urls)
+        routes = [None] * len(pairs)
+        k = 0
+        for run in runs:
+            legs = self.getLegs(answers[k])
+            k = k + 1
+            if self.compareReverse:
+                reverseLegs = self.getLegs(answers[k])[::-1]
+                k = k + 1
+                for m in range(len(run)):
+                    if reverseLegs[m][0] < legs[m][0]:
+                        legs[m] = reverseLegs[m]
+            for i, leg in zip(run, legs):
+                routes[i] = leg[1]
+        return routes
+    
+    def close(self):
+        """Stops the worker threads and closes their connections"""
+        
+        for worker in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers:
+            worker.join()
@@ -0,0 +1,258 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+# Counts of the grid-ids following the contexts of every order, in a trie of contexts
+
+from __future__ import division
+import heapq
+import itertools
+from gridCells import startCell, segmentMarker
+from transitionCounts import TransitionCounts, TransitionDict, getPreviousCells
+from trajectoryStore import markerDirection
+
+class ContextTrie:
+    """The no. of times each grid-id followed each context of up to order grid-ids, with the contexts kept in a trie.
+    
+    The nodes of the trie are numbered, with the root numbered 0 and standing for the empty context. The child of a node
+    for a symbol extends the context of the node with that symbol, one point further into the past: the children of the
+    root are the grid-ids before a point, their children the grid-ids before those, and so on down to order grid-ids or
+    to startCell at the start of a segment. When the trie has directions, the children of the root are the
+    direction-of-movement codes of the points before, with the grid-ids one level below.
+    
+    The counts of all the nodes are the rows of a single TransitionCounts, so every order is counted in one pass
+    and the memory grows with the no. of distinct contexts. The root counts every grid-id.
+    
+    After prune, the trie keeps only the contexts that change the prediction, within a limit on the no. of counts
+    as in a prediction suffix tree. Counts added later are then only added to the contexts that were kept.
+    
+    After setOnline, the counts are kept in a TransitionDict, so that addTransition can count a single transition
+    in a time that does not depend on the no. of transitions counted so far.
+    
+    """
+    
+    def __init__(self, order, hasDirections=False):
+        self.order = order
+        self.hasDirections = hasDirections
+        self.children = {}
+        self.counts = TransitionCounts()
+        self.isPruned = False
+        self.lastNode = 0
+    
+    def getChild(self, node, symbol):
+        """Returns the child of node for symbol, which is added if it is not in the trie unless the trie is pruned"""
+        
+        child = self.children.get((node, symbol))
+        if child is None and not self.isPruned:
+            self.lastNode = self.lastNode + 1
+            child = self.children[(node, symbol)] = self.lastNode
+        return child
+    
+    def getContexts(self, d, directions=None):
+        """Returns the nodes of all the contexts of each grid-id of d, a list or array of grid-ids and segment markers,
+        and the grid-id that follows each of these nodes.
+        
+        directions are the direction-of-movement codes of the elements of d, when the trie has directions.
+        
+        """
+        
+        levels = [getPreviousCells(d)]
+        for j in range(1, self.order):
+            levels.append(getPreviousCells(d, levels[-1]))
+        if self.hasDirections:
+            previousDirections = list(itertools.chain([markerDirection], directions[:-1]))
+        nodes = []
+        cells = []
+        for i, cell in enumerate(d):
+            if cell == segmentMarker:
+                continue
+            node = 0
+            nodes.append(node)
+            if self.hasDirections:
+                node = self.getChild(node, previousDirections[i])
+                if not node is None:
+                    nodes.append(node)
+            for level in levels:
+                if node is None:
+                    break
+                node = self.getChild(node, level[i])
+                if node is None:
+                    break
+                nodes.append(node)
+                if level[i] == startCell:
+                    break
+            cells.extend(itertools.repeat(cell, len(nodes) - len(cells)))
+        return nodes, cells
+    
+    def train(self, d, directions=None):
+        """Counts the grid-ids of d following each of their contexts, replacing the previous counts"""
+        
+        self.children = {}
+        self.isPruned = False
+        self.lastNode = 0
+        nodes, cells = self.getContexts(d, directions)
+        self.counts = TransitionCounts(nodes, cells)
+    
+    def add(self, d, directions=None, sign=1):
+        """Adds (or subtracts, if sign is -1) the counts of the grid-ids of d, which must have been counted by train"""
+        
+        nodes, cells = self.getContexts(d, directions)
+        self.counts.add(nodes, cells, sign)
+    
+    def setOnline(self):
+        """Moves the counts into a TransitionDict, if they are not there already, so that they can be updated online"""
+        
+        if not isinstance(self.counts, TransitionDict):
+            self.counts = TransitionDict(self.counts)
+    
+    def getSymbols(self, history, direction=None):
+        """Returns the symbols on the path from the root to the longest context of history, as described in findNode"""
+        
+        symbols = []
+        if self.hasDirections:
+            symbols.append(direction)
+        k = len(history)
+        for j in range(self.order):
+            symbol = startCell
+            if j < k and history[k - 1 - j] != segmentMarker:
+                symbol = history[k - 1 - j]
+            symbols.append(symbol)
+            if symbol == startCell:
+                break
+        return symbols
+    
+    def addTransition(self, history, direction, cell, sign=1):
+        """Counts cell following each context of history (or subtracts it, if sign is -1), as train would for a point
+        cell after the points of history. direction is the direction-of-movement code of the latest point of history,
+        or markerDirection if history is empty, when the trie has directions.
+        
+        """
+        
+        nodes = [0]
+        for symbol in self.getSymbols(history, direction):
+            node = self.getChild(nodes[-1], symbol)
+            if node is None:
+                break
+            nodes.append(node)
+        self.counts.add(nodes, [cell] * len(nodes), sign)
+    
+    def prune(self, maxCounts=None):
+        """Removes the contexts that do not change the prediction, then, while more than maxCounts counts are kept,
+        the contexts whose predictions gain the least over those of the shorter contexts.
+        
+        Contexts are only removed from the bottom of the trie. A context whose most frequent next grid-id is that
+        of the context above it predicts the same grid-id as the shorter context that is used once it is removed,
+        so removing it does not change the predictions. To stay within maxCounts, the contexts are then removed
+        in increasing order of the no. of transitions in training that they predict correctly and the context
+        above them does not, for each count removed. The root is never removed, so predictions can always be made.
+        
+        """
+        
+        parents = {}
+        for (parent, symbol), child in self.children.iteritems():
+            parents[child] = parent
+        nodes = sorted(parents)
+        # the grid-id predicted at each node, which is that of the node above it when the node has no counts,
+        # the nodes are numbered after the node above them so that it is known when the node is reached
+        predicted = {0: self.counts.getMaximum(0)[0]}
+        children = dict.fromkeys(nodes, 0)
+        children[0] = 0
+        for node in nodes:
+            y, count = self.counts.getMaximum(node)
+            if count == 0:
+                y = predicted[parents[node]]
+            predicted[node] = y
+            children[parents[node]] = children[parents[node]] + 1
+        isKept = dict.fromkeys(nodes, True)
+        for node in reversed(nodes):
+            if children[node] == 0 and predicted[node] == predicted[parents[node]]:
+                isKept[node] = False
+                children[parents[node]] = children[parents[node]] - 1
+        if not maxCounts is None:
+            size = self.counts.getSize(0) + sum(self.counts.getSize(node) for node in nodes if isKept[node])
+            leaves = [(self.getGain(node, predicted[parents[node]]), -node) for node in nodes if isKept[node] and children[node] == 0]
+            heapq.heapify(leaves)
+            while size > maxCounts and leaves:
+                gain, node = heapq.heappop(leaves)
+                node = -node
+                isKept[node] = False
+                size = size - self.counts.getSize(node)
+                parent = parents[node]
+                children[parent] = children[parent] - 1
+                if parent != 0 and children[parent] == 0:
+                    heapq.heappush(leaves, (self.getGain(parent, predicted[parents[parent]]), -parent))
+        self.children = dict((key, child) for key, child in self.children.iteritems() if isKept[child])
+        self.counts = self.counts.getRows([0] + [node for node in nodes if isKept[node] and node in self.counts.rows])
+        self.isPruned = True
+    
+    def getGain(self, node, cell):
+        """Returns the no. of transitions from the context of node that it predicts correctly and cell does not, for each of its counts"""
+        
+        size = self.counts.getSize(node)
+        if size == 0:
+            return 0
+        return (self.counts.getMaximum(node)[1] - self.counts.getCount(node, cell)) / size
+    
+    def getCountsSize(self):
+        """Returns the no. of counts kept, which bounds the memory of the trie"""
+        
+        return self.counts.getEntryCount()
+    
+    def findNode(self, history, direction=None):
+        """Returns the node of the longest context of history that has counts, backing off to shorter contexts down to the root.
+        
+        history is the grid-ids of the current segment so far, the latest last, or at least the last order of them.
+        direction is the direction-of-movement code of the latest point, when the trie has directions.
+        
+        """
+        
+        best = 0
+        node = 0
+        for symbol in self.getSymbols(history, direction):
+            node = self.children.get((node, symbol))
+            if node is None:
+                break
+            if self.counts.getSize(node) > 0:
+                best = node
+        return best
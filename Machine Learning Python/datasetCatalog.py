@@ -0,0 +1,246 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+########################################################################################################
+###
+### DESCRIPTION:
+###
+### A catalog of the users and days of sample data under a data root, which holds one directory per
+### user (named by IMEI) with the sample data files of the user in its sample/ subdirectory, either
+### as a single trajectories.col file, as sample_data_<i>.col files or as sample_data_<i>.txt files
+### (see trajectoryFiles.py).
+###
+### The no. of rows, the first and last timestamp, the point density (rows per hour) and the columns
+### of every day are recorded in an index file (catalog.json) under the data root. A day file is only read again
+### when its size or modification time changed, and only the users that are asked for are indexed,
+### so that the days of a user can be selected by date range or no. of points without opening every
+### file. Running this script indexes every user under a data root and prints a summary.
+###
+########################################################################################################
+
+import datetime
+import json
+import os
+import re
+import trajectoryFiles
+
+catalogFileName = 'catalog.json'
+sourcePatterns = [('trajectories.col', re.compile(r'^trajectories\.col$')),
+                  ('sample_data_%d.col', re.compile(r'^sample_data_(\d+)\.col$')),
+                  ('sample_data_%d.txt', re.compile(r'^sample_data_(\d+)\.txt$'))]  # in order of preference
+timestampLabel = 'timestamp'
+
+def getDayStatistics(timestamps):
+    """Returns the no. of rows, first and last timestamp and density (rows per hour) of a day's timestamps"""
+    
+    timestamps = [int(float(t)) for t in timestamps]
+    if not timestamps:
+        return {'rows': 0, 'start': None, 'end': None, 'density': 0.0}
+    start = min(timestamps)
+    end = max(timestamps)
+    hours = (end - start) / 3600000.0
+    density = len(timestamps) / hours if hours > 0 else float(len(timestamps))
+    return {'rows': len(timestamps), 'start': start, 'end': end, 'density': density}
+
+def getColumns(path):
+    """Returns the names of the columns of a sample data file"""
+    
+    if path.endswith(trajectoryFiles.columnarExtension):
+        return [name for name, code in trajectoryFiles.columns]
+    return trajectoryFiles.readCsvHeader(path)
+
+def hasColumns(day, labels):
+    """Returns whether the sample data of an indexed day has all the columns named in labels"""
+    
+    return all(label in day['columns'] for label in labels)
+
+def getDate(timestamp):
+    """Returns the UTC date (YYYY-MM-DD) of a timestamp in milliseconds"""
+    
+    return datetime.datetime.utcfromtimestamp(timestamp / 1000.0).strftime('%Y-%m-%d')
+
+class Catalog:
+    """The catalog of the users and days under a data root"""
+    
+    def __init__(self, dataRoot):
+        self.dataRoot = dataRoot
+        self.path = os.path.join(dataRoot, catalogFileName)
+        self.users = {}
+        self.changed = False
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.users = json.load(f)
+    
+    def getUsers(self):
+        """Returns the users under the data root that have sample data, without indexing them"""
+        
+        users = []
+        for name in sorted(os.listdir(self.dataRoot)):
+            if os.path.isdir(os.path.join(self.dataRoot, name, 'sample')):
+                users.append(name)
+        return users
+    
+    def findSource(self, user):
+        """Returns the file name format of the sample data files of user and their {day number: file name}"""
+        
+        sampleDirectory = os.path.join(self.dataRoot, user, 'sample')
+        names = os.listdir(sampleDirectory) if os.path.isdir(sampleDirectory) else []
+        for source, pattern in sourcePatterns:
+            matches = [(pattern.match(name), name) for name in names]
+            matches = [(m, name) for m, name in matches if m]
+            if not matches:
+                continue
+            if '%' in source:
+                return source, dict((int(m.group(1)), name) for m, name in matches)
+            columnar = trajectoryFiles.ColumnarFile(os.path.join(sampleDirectory, source))
+            try:
+                return source, dict((n, source) for n in columnar.dayNumbers)
+            finally:
+                columnar.close()
+        return None, {}
+    
+    def indexUser(self, user):
+        """Brings the index of the days of user up to date with its sample data files and returns it"""
+        
+        source, dayFiles = self.findSource(user)
+        entry = self.users.get(user)
+        if entry is None or entry['source'] != source:
+            entry = {'source': source, 'days': {}}
+            self.changed = True
+        days = {}
+        for n, name in sorted(dayFiles.items()):
+            path = os.path.join(self.dataRoot, user, 'sample', name)
+            size = os.path.getsize(path)
+            mtime = os.path.getmtime(path)
+            day = entry['days'].get(str(n))
+            if day is None or day['size'] != size or day['mtime'] != mtime or not 'columns' in day:
+                pattern = os.path.join(self.dataRoot, user, 'sample', source)
+                if '%' in source:
+                    timestamps = [row[0] for row in trajectoryFiles.readRows(pattern, n, [timestampLabel])]
+                else:
+                    columnar = trajectoryFiles.ColumnarFile(pattern)
+                    try:
+                        timestamps = columnar.getColumn(timestampLabel, n)
+                    finally:
+                        columnar.close()
+                day = getDayStatistics(timestamps)
+                day['columns'] = getColumns(path)
+                day['size'] = size
+                day['mtime'] = mtime
+                self.changed = True
+            days[str(n)] = day
+        if len(days) != len(entry['days']):
+            self.changed = True
+        entry['days'] = days
+        self.users[user] = entry
+        return entry
+    
+    def getDays(self, user):
+        """Returns the indexed days of user as a sorted list of (day number, statistics) pairs"""
+        
+        entry = self.indexUser(user)
+        return sorted((int(n), day) for n, day in entry['days'].items())
+    
+    def select(self, user, startDate=None, endDate=None, minPoints=0, maxDays=None, labels=None):
+        """Returns the file name format of the sample data of user and the day numbers selected from it.
+        
+        Days are selected if they start between startDate and endDate (YYYY-MM-DD in UTC, both included,
+        None for no limit) and have at least minPoints rows. If labels is not None, only the days whose sample
+        data has all the columns named in labels are selected. If maxDays is not None, only the first maxDays
+        selected days are returned. The returned values can be passed as filename and files to the models.
+        
+        """
+        
+        files = []
+        for n, day in self.getDays(user):
+            if day['rows'] < minPoints:
+                continue
+            if not labels is None and not hasColumns(day, labels):
+                continue
+            if not day['start'] is None:
+                date = getDate(day['start'])
+                if (not startDate is None and date < startDate) or (not endDate is None and date > endDate):
+                    continue
+            elif not (startDate is None and endDate is None):
+                continue
+            files.append(n)
+        if not maxDays is None:
+            files = files[:maxDays]
+        self.save()
+        return os.path.join(self.dataRoot, user, 'sample', self.users[user]['source'] or sourcePatterns[-1][0]), files
+    
+    def save(self):
+        """Writes the index file if it changed, replacing the previous one only once it has been written completely"""
+        
+        if not self.changed or not os.path.isdir(self.dataRoot):
+            return
+        temporaryPath = self.path + '.tmp'
+        with open(temporaryPath, 'w') as f:
+            json.dump(self.users, f, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.rename(temporaryPath, self.path)  # replaces the previous index file in a single step
+        except OSError:
+            # os.rename cannot replace an existing file on Windows
+            os.remove(self.path)
+            os.rename(temporaryPath, self.path)
+        self.changed = False
+
+def main():
+    dataRoot = raw_input("Enter data root: ")
+    catalog = Catalog(dataRoot)
+    for user in catalog.getUsers():
+        days = catalog.getDays(user)
+        rows = sum(day['rows'] for n, day in days)
+        starts = [day['start'] for n, day in days if not day['start'] is None]
+        if starts:
+            print "%s: %d days, %d rows, %s to %s" % (user, len(days), rows, getDate(min(starts)), getDate(max(starts)))
+        else:
+            print "%s: %d days, %d rows" % (user, len(days), rows)
+    catalog.save()
+
+if __name__ == '__main__':
+    main()
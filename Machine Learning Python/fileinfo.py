@@ -43,5 +43,21 @@
 
 ###############################################################################
 
-filename = "data/860173015670486/sample/sample_data_%d.txt"  # format of file names used for running prediction algorithms
-files = range(1, 25)  # file numbers correspond to day numbers for a particular user
\ No newline at end of file
+from datasetCatalog import Catalog
+
+dataRoot = "data"  # directory with one directory per user holding the user's sample/ files (see datasetCatalog.py)
+user = "860173015670486"  # user whose days are used for running prediction algorithms
+startDate = None  # first date (YYYY-MM-DD, UTC) of the days used, None for no limit
+endDate = None  # last date (YYYY-MM-DD, UTC) of the days used, None for no limit
+minPoints = 0  # days with fewer rows in their sample data file are not used
+maxDays = 24  # no. of first days selected that are used, None for all of them
+
+def getFiles():
+    """Returns the file name format and the day numbers of the days of user selected above.
+    
+    The days are looked up in the catalog of dataRoot, whose index file is brought up to date, so this is only
+    called from the main function of the prediction algorithms and not when the module is imported.
+    
+    """
+    
+    return Catalog(dataRoot).select(user, startDate, endDate, minPoints, maxDays)
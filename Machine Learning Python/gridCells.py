@@ -0,0 +1,156 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+# Grid cells of lat/long points as integers
+
+from __future__ import division
+import array
+import itertools
+import operator
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+startCell = -1  # the grid-id before the first point of a day or trip
+segmentMarker = -2  # marks the end of a day or trip in the data
+noCell = -3  # the grid-id predicted when no prediction can be made
+specialLabels = {startCell: '$', segmentMarker: '---', noCell: ''}
+
+def toNumpy(values):
+    """Returns values (numbers or strings) as a numpy array of floats, without copying them if they are an array('d')"""
+    
+    if isinstance(values, array.array) and values.typecode == 'd':
+        return numpy.frombuffer(values, dtype=numpy.float64)
+    return numpy.array(map(float, values), dtype=numpy.float64)
+
+class GridCells:
+    """Packs the grid cells of lat/long values truncated using a grid-scale into integer grid-ids.
+    
+    A grid-id is the row of the cell on the grid times the no. of columns plus its column, so that grid-ids
+    are ordered by latitude and then longitude. The string labels of the cells (e.g. 'LAT23.12LON113.36')
+    are only made for display, and are kept in a table once they have been made.
+    
+    """
+    
+    def __init__(self, gridScale):
+        self.gridScale = gridScale
+        self.rowOffset = 90 * gridScale
+        self.columnOffset = 180 * gridScale
+        self.columns = 360 * gridScale + 1
+        self.labels = dict(specialLabels)
+    
+    def getCell(self, latitude, longitude):
+        """Returns the grid-id of the cell of latitude-longitude values"""
+        
+        row = int(float(latitude) * self.gridScale) + self.rowOffset
+        column = int(float(longitude) * self.gridScale) + self.columnOffset
+        return row * self.columns + column
+    
+    def getLabel(self, cell):
+        """Returns the string label of a grid-id"""
+        
+        if cell not in self.labels:
+            x, y = self.getPoint(cell)
+            self.labels[cell] = 'LAT' + str(x) + 'LON' + str(y)
+        return self.labels[cell]
+    
+    def getPoint(self, cell):
+        """Returns the truncated latitude-longitude values of a grid-id"""
+        
+        row, column = divmod(cell, self.columns)
+        return (row - self.rowOffset) / self.gridScale, (column - self.columnOffset) / self.gridScale
+
+    def getCells(self, latitudes, longitudes):
+        """Returns the grid-ids of the cells of columns of latitude and longitude values, as a list.
+        
+        numpy is used for this when it is installed.
+        
+        """
+        
+        if not numpy is None and len(latitudes):
+            rows = numpy.trunc(toNumpy(latitudes) * self.gridScale).astype(numpy.int64) + self.rowOffset
+            columns = numpy.trunc(toNumpy(longitudes) * self.gridScale).astype(numpy.int64) + self.columnOffset
+            return (rows * self.columns + columns).tolist()
+        n = len(latitudes)
+        scale = itertools.repeat(self.gridScale, n)
+        rows = map(operator.add, map(int, map(operator.mul, map(float, latitudes), scale)), itertools.repeat(self.rowOffset, n))
+        scale = itertools.repeat(self.gridScale, n)
+        columns = map(operator.add, map(int, map(operator.mul, map(float, longitudes), scale)), itertools.repeat(self.columnOffset, n))
+        return map(operator.add, map(operator.mul, rows, itertools.repeat(self.columns, n)), columns)
+
+def getKeptRows(cells, originals, shouldIgnoreRepetitions, shouldIgnoreAddedOnly):
+    """Returns the indices of the rows of a day that are kept when repetitions are ignored.
+    
+    A row is a repetition if its grid-id is that of the row before it, as the row before a repetition either
+    is kept or is a repetition of the same grid-id itself. If shouldIgnoreAddedOnly, only the repetitions
+    in rows added by the routing service (original-data = '0') are ignored.
+    
+    """
+    
+    if not shouldIgnoreRepetitions or not cells:
+        return range(len(cells))
+    repeated = [False] + map(operator.eq, cells[1:], cells[:-1])
+    if shouldIgnoreAddedOnly:
+        repeated = map(operator.and_, repeated, map('0'.__eq__, originals))
+    return list(itertools.compress(xrange(len(cells)), map(operator.not_, repeated)))
+
+def addSegmentMarkers(cells, timestamps, segmentTimeThreshold):
+    """Returns the grid-ids of a day with segmentMarker added before every grid-id whose timestamp is at least
+    segmentTimeThreshold after that of the grid-id before it (or, for the first grid-id, after its own)
+    
+    """
+    
+    times = map(float, timestamps)
+    gaps = map(operator.sub, times, times[:1] + times[:-1])
+    starts = [k for k, gap in enumerate(gaps) if gap >= segmentTimeThreshold]
+    d = []
+    previous = 0
+    for k in starts:
+        d.extend(cells[previous:k])
+        d.append(segmentMarker)
+        previous = k
+    d.extend(cells[previous:])
+    return d
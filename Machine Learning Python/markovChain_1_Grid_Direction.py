@@ -46,14 +46,22 @@
 # 1st order Markov Chain with direction-of-movement feature
 
 from __future__ import division
-import csv
 from collections import defaultdict
-from fileinfo import filename, files
+import itertools
+from fileinfo import getFiles
+from trajectoryFiles import readColumns
+from gridCells import GridCells, getKeptRows, segmentMarker, noCell
+from transitionCounts import TransitionCounts, FirstOccurrences, getPreviousCells, getSetRanks, getDictRanks
+from trajectoryStore import TrajectoryStore, getDirectionCodes, getDirectionName, markerDirection
+import parallelFolds
 
 shouldIgnoreRepetitions = True  # decides whether to ignore consecutive repetition in generated labels
 shouldIgnoreAddedOnly = False  # decides whether only the repetition in points added by the routing service is to be ignored
 shouldPrintPredictions = False  # decides whether predictions are printed to the screen during the test phase
 verbose = True  # decides whether to print the accuracy in each fold of cross-validation
+shouldTrainIncrementally = True  # decides whether each fold of cross-validation updates the counts of the previous fold instead of training from scratch
+shouldPrecomputePredictions = False  # decides whether the prediction for every context seen in training is computed right after training, so that predict is a single lookup
+numProcesses = 1  # no. of processes the folds of cross-validation are divided among, None uses one process per core
 latLabel = 'latitude'
 longLabel = 'longitude'
 dirLabel = 'direction_of_movement'
@@ -66,11 +74,18 @@ class LocationPrecitionModel:
     def __init__(self, files, filename, latLabel, longLabel, dirLabel, originalTextLabel, gridScale, shouldIgnoreRepetitions, shouldIgnoreAddedOnly, minPointsOnADay, verbose):
         self.files = files
         self.filename = filename
-        self.mostFrequentlyVisited = ''
+        self.cells = GridCells(gridScale)
+        self.mostFrequentlyVisited = noCell
+        self.predictions = None
+        self.fallbacks = {}
         self.counts_uni = defaultdict(int)
-        self.counts_bi = defaultdict(int)
-        self.next = defaultdict(set)
-        self.data = []
+        self.counts_bi = TransitionCounts()
+        self.next = TransitionCounts()
+        self.trainedFiles = set()
+        self.setRanks = {}  # the positions of the next grid-ids of each grid-id in the set of their labels, kept until the counts change
+        self.data = TrajectoryStore(hasDirections=True)
+        self.firstNext = FirstOccurrences()
+        self.firstVisited = FirstOccurrences()
         self.fileDataDict = {}
         self.dataFileDict = {}
         self.indices = []
@@ -85,61 +100,140 @@ class LocationPrecitionModel:
         self.minPointsOnADay = minPointsOnADay
     
     def predict(self, x, direction):
-        """Predicts the next grid-id based on the current grid-id and the present direction-of-motion."""
+        """Predicts the next grid-id based on the current grid-id and the code of the present direction-of-motion."""
         
+        if not self.predictions is None:
+            prediction = self.predictions.get((x, direction))
+            if prediction is None:
+                prediction = self.fallbacks.get(x, (self.mostFrequentlyVisited, 0))
+            return prediction
         maxProb = 0
-        r = ''
-        # the following code calculates the probablity of each candidate next grid-id and finds the one with the maximum probability
-        for y in self.next[x]:
-            P = (self.counts_bi[(x, y, direction)] + 1) / (self.counts_uni[(x, direction)] + len(self.next[x]))  # add-one smoothing is used
-            if P > maxProb:
-                maxProb = P
-                r = y
+        r = noCell
+        # with add-one smoothing, every candidate next grid-id of x has the probability (count + 1) / (counts_uni + no. of candidates),
+        # so the ones with the maximum probability are the ones with the maximum count, which are all the candidates if it is 0
+        candidates = self.next.getSize(x)
+        if candidates > 0:
+            tied, count = self.counts_bi.getMaxima((x, direction))
+            if count == 0:
+                tied = None
+            maxProb = (count + 1) / (self.counts_uni[(x, direction)] + candidates)
+            r = self.breakTie(x, tied)
         if maxProb == 0:  # fallback
             r = self.mostFrequentlyVisited
         return r, maxProb
     
+    def breakTie(self, x, tied):
+        """Returns the grid-id of tied, next grid-ids of x (all of them if it is None), whose label comes first in a set of the labels
+        of the next grid-ids of x added in the order training saw them, which is the one predicted when the labels were kept in sets.
+        
+        """
+        
+        if not tied is None and len(tied) == 1:
+            return tied[0]
+        ranks = self.setRanks.get(x)
+        if ranks is None:
+            added = self.firstNext.getOrder([(x, y) for y, count in self.next.getNext(x)], self.trainedFiles)
+            ranks = self.setRanks[x] = getSetRanks([y for context, y in added], self.cells.getLabel)
+        if tied is None:
+            tied = ranks
+        return min(tied, key=ranks.__getitem__)
+    
     def train(self, train_files):
         """Trains the location prediction model with the training set provided as argument.
         
-        train_files is a list. Each element of train_files is a list of type [<locationLabel>, <directionOfMovement>].
+        train_files is a list. Each element of train_files is a list of type [<gridId>, <directionOfMovement>].
         
         """
         
-        last = '$'
-        d = []
-        for file in train_files:
-            d = d + self.data[file]
         # the following code calculates the counts required by the prediction model
         # to calculate probabilities of candidate locations and make predictions
-        for e in d:
-            if e[0] == "---":
-                last = '$'
-            else:
-                self.counts_uni[(e[0], e[1])] = self.counts_uni[(e[0], e[1])] + 1
-                self.counts_bi[(last, e[0], e[1])] = self.counts_bi[(last, e[0], e[1])] + 1
-                self.next[last].add(e[0])
-                last = e[0]
-        maxCount = -1
-        for e in self.counts_uni:
-            if self.counts_uni[e] > maxCount:
-                self.mostFrequentlyVisited = e[0]
-                maxCount = self.counts_uni[e]
+        previous, cells, directions = self.getTransitions(train_files)
+        for e in zip(cells, directions):
+            self.counts_uni[e] = self.counts_uni[e] + 1
+        self.counts_bi = TransitionCounts(zip(previous, directions), cells)
+        self.next = TransitionCounts(previous, cells)
+        self.trainedFiles = set(train_files)
+        self.setRanks = {}
+        self.setMostFrequentlyVisited()
+    
+    def getTransitions(self, files):
+        """Returns the grid-id before each grid-id in files (or startCell), the grid-ids in files and their direction-of-movement codes,
+        without the segment markers."""
+        
+        cells = self.data.getCells(files)
+        directions = self.data.getDirections(files)
+        previous = [last for last, e in zip(getPreviousCells(cells), cells) if e != segmentMarker]
+        isCell = [e != segmentMarker for e in cells]
+        return previous, list(itertools.compress(cells, isCell)), list(itertools.compress(directions, isCell))
+    
+    def updateCounts(self, files, sign):
+        """Adds the counts of the files to the trained model, or subtracts them if sign is -1."""
+        
+        previous, cells, directions = self.getTransitions(files)
+        for e in zip(cells, directions):
+            self.counts_uni[e] = self.counts_uni[e] + sign
+        self.counts_bi.add(zip(previous, directions), cells, sign)
+        self.next.add(previous, cells, sign)
+    
+    def setMostFrequentlyVisited(self):
+        """Finds the most frequently visited grid-id in the training set, with the (grid-id, direction) visited most often.
+        If there are ties, it is the one whose (label, direction) comes first in a dict of those of the (grid-id, direction)s
+        visited added in the order training saw them, as when the counts were kept by label.
+        
+        """
+        
+        self.mostFrequentlyVisited = noCell
+        visited = [e for e in self.counts_uni if self.counts_uni[e] > 0]
+        if not visited:
+            return
+        maxCount = max(self.counts_uni[e] for e in visited)
+        tied = [e for e in visited if self.counts_uni[e] == maxCount]
+        if len(tied) == 1:
+            self.mostFrequentlyVisited = tied[0][0]
+            return
+        ranks = getDictRanks(self.firstVisited.getOrder(visited, self.trainedFiles), self.getVisitedKey)
+        self.mostFrequentlyVisited = min(tied, key=ranks.__getitem__)[0]
+    
+    def getVisitedKey(self, e):
+        """Returns the (label, direction-of-movement name) of a (grid-id, direction code)"""
+        
+        return self.cells.getLabel(e[0]), getDirectionName(e[1])
+    
+    def precomputePredictions(self):
+        """Computes the prediction for every (grid-id, direction) seen in training, and the prediction for every grid-id x
+        with a direction that was never seen with it, so that predict is a single lookup.
+        
+        The table is dropped by resetTrainedModel.
+        
+        """
+        
+        self.predictions = None
+        predictions = {}
+        for context in set(self.counts_bi.rows) | set(self.counts_uni):
+            if self.next.getSize(context[0]) > 0:
+                predictions[context] = self.predict(context[0], context[1])
+        # for a direction never seen with x, all the candidates of x have a count of 0,
+        # so the prediction is the candidate that breaks the tie between all of them with the probability 1 / no. of candidates
+        fallbacks = {}
+        for x in self.next.rows:
+            if self.next.getSize(x) > 0:
+                fallbacks[x] = (self.breakTie(x, None), 1 / self.next.getSize(x))
+        self.fallbacks = fallbacks
+        self.predictions = predictions
     
     def test(self, test_files):
         """Returns the accuracy of the location prediction model once it has been trained."""
         
-        t = []
-        for file in test_files:
-            t = t + self.data[file]
+        t = self.data.getCells(test_files)
+        directions = self.data.getDirections(test_files)
         total = len(t) - 2
         correct = 0
         for i in range(total):
-            predicted, P = self.predict(t[i][0], t[i][1])
-            if predicted == t[i+1][0]:
+            predicted, P = self.predict(t[i], directions[i])
+            if predicted == t[i+1]:
                 correct = correct + 1
             if shouldPrintPredictions:
-                print t[i][0], t[i+1][0], "-->", predicted
+                print self.cells.getLabel(t[i]), self.cells.getLabel(t[i+1]), "-->", self.cells.getLabel(predicted)
         if total <= self.minPointsOnADay:  # days with less than minPointsOnADay points are not considered
             return None
         else:
@@ -151,49 +245,82 @@ class LocationPrecitionModel:
         
         j = 0
         for i in self.files:
-            d = []
-            with open(self.filename % i) as file1:
-                sr = csv.reader(file1, delimiter=',')
-                first = True
-                last = ''
-                labelIdx = -1
-                for r in sr:
-                    if first:
-                        first = False
-                        latIdx = r.index(self.latLabel)
-                        longIdx = r.index(self.longLabel)
-                        dirIdx = r.index(self.dirLabel)
-                        origIdx = r.index(self.originalTextLabel)
-                    else:
-                        label = self.getLabel(r[latIdx], r[longIdx])
-                        direction = r[dirIdx]
-                        if shouldIgnoreRepetitions and last == label:
-                            if not self.shouldIgnoreAddedOnly or r[origIdx] == '0':
-                                continue
-                        d.append([label, direction])
-                        last = label
-            d.append(["---", "---"])
-            self.data.append(d)
+            latitudes, longitudes, directions, originals = readColumns(self.filename, i, [self.latLabel, self.longLabel, self.dirLabel, self.originalTextLabel])
+            cells = self.cells.getCells(latitudes, longitudes)
+            kept = getKeptRows(cells, originals, shouldIgnoreRepetitions, self.shouldIgnoreAddedOnly)
+            d = [cells[k] for k in kept] + [segmentMarker]
+            codes = getDirectionCodes([directions[k] for k in kept]) + [markerDirection]
+            self.data.addDay(d, codes)
+            self.firstNext.addDay(j, zip(getPreviousCells(d), d))
+            self.firstVisited.addDay(j, zip(d, codes))
             self.fileDataDict[i] = j
             self.dataFileDict[j] = i
             j = j + 1
         self.indices = [self.fileDataDict[i] for i in self.files]
     
+    def getCell(self, latitude, longitude):
+        """Returns the integer grid-id for latitude-longitude values after truncating the values using the grid-scale"""
+        
+        return self.cells.getCell(latitude, longitude)
+    
     def getLabel(self, latitude, longitude):
         """Returns a string label for latitude-longitude values after truncating the values using the grid-scale"""
         
-        x = int(float(latitude) * self.gridScale) / gridScale
-        y = int(float(longitude) * self.gridScale) / gridScale
-        label = 'LAT' + str(x) + 'LON' + str(y)
-        return label
+        return self.cells.getLabel(self.getCell(latitude, longitude))
+    
+    def updateTrainedModel(self, trained, train_files):
+        """Changes the model trained with the files in trained into one trained with the files in train_files.
+        
+        The counts of the files that are no longer used are subtracted and those of the new files are added,
+        so the model must have been trained at some point with all the files in train_files.
+        
+        """
+        
+        isTrained = set(trained)
+        isTraining = set(train_files)
+        self.updateCounts([file for file in trained if not file in isTraining], -1)
+        self.updateCounts([file for file in train_files if not file in isTrained], 1)
+        self.trainedFiles = isTraining
+        self.setRanks = {}
+        self.setMostFrequentlyVisited()
+        self.predictions = None
     
     def resetTrainedModel(self):
         """Resets the prediction model so that it can be trained again using a different dataset."""
         
         self.counts_uni = defaultdict(int)
-        self.counts_bi = defaultdict(int)
-        self.next = defaultdict(set)
-        self.mostFrequentlyVisited = ''
+        self.counts_bi = TransitionCounts()
+        self.next = TransitionCounts()
+        self.trainedFiles = set()
+        self.setRanks = {}
+        self.mostFrequentlyVisited = noCell
+        self.predictions = None
+    
+    def getFolds(self, sequential=False):
+        """Returns the (training files, test files) of every fold of a leave-one-out or a sequential cross-validation."""
+        
+        if sequential:
+            return [(self.indices[:i], [self.indices[i]]) for i in range(len(self.indices))]
+        return [(self.indices[:i] + self.indices[i+1:], [self.indices[i]]) for i in range(len(self.indices))]
+    
+    def runFolds(self, sets):
+        """Trains and tests the prediction model on each (training files, test files) of sets in turn, and yields the accuracies."""
+        
+        if shouldTrainIncrementally:
+            # the model is trained once on all the files, then each fold only subtracts or adds the files that differ from the previous fold
+            self.resetTrainedModel()
+            self.train(self.indices)
+            trained = self.indices
+        for train_files, test_files in sets:
+            if shouldTrainIncrementally:
+                self.updateTrainedModel(trained, train_files)
+                trained = train_files
+            else:
+                self.resetTrainedModel()
+                self.train(train_files)
+            if shouldPrecomputePredictions:
+                self.precomputePredictions()
+            yield self.test(test_files)
     
     def crossValidate(self, sequential=False):
         """Runs a leave-one-out or a sequential cross-validation for the prediction algorithm on the dataset.
@@ -201,21 +328,20 @@ class LocationPrecitionModel:
         sequential = False: leave-one-out cross-validation
         sequential = True: for the xth day, use data from 1...(x-1) days for training the model and tha from the xth day for testng
         
+        The folds are run over numProcesses processes unless it is 1, with the same results.
+        
         """
         
         maxAccuracy = -1
         bestSet = []
-        sets = []
-        if sequential:
-            sets = [(self.indices[:i], [self.indices[i]]) for i in range(len(self.indices))]
+        sets = self.getFolds(sequential)
+        if numProcesses == 1:
+            accuracies = self.runFolds(sets)
         else:
-            sets = [(self.indices[:i] + self.indices[i+1:], [self.indices[i]]) for i in range(len(self.indices))]
+            accuracies = parallelFolds.getAccuracies(self, sequential, numProcesses)
         passNum = 1
         total = 0.0
-        for train_files, test_files in sets:
-            self.resetTrainedModel()
-            self.train(train_files)
-            accuracy = self.test(test_files)
+        for (train_files, test_files), accuracy in itertools.izip(sets, accuracies):
             if not accuracy is None:
                 if accuracy > maxAccuracy:
                     maxAccuracy = accuracy
@@ -233,29 +359,28 @@ class LocationPrecitionModel:
     
     def printData(self):
         i = 1
-        for d in self.data:
+        for k in range(self.data.getDayCount()):
+            d = zip(self.data.getCells([k]), self.data.getDirections([k]))
             print i
             i = i + 1
             print "######################"
             j = 1
             for x in d:
-                print j, x
+                print j, [self.cells.getLabel(x[0]), getDirectionName(x[1])]
                 j = j + 1
             print
             print "######################"
     
     def printUniqueLocations(self):
-        l = []
-        for d in self.data:
-            l = l + d
-        s = set(l)
+        s = set(self.data.cells)
         print "Unique Locations:\n"
-        c = sorted(s)
+        c = sorted(self.cells.getLabel(x) for x in s)
         for x in c:
             print x
         print "\nTotal:", len(c)
 
 def main():
+    filename, files = getFiles()
     model = LocationPrecitionModel(files, filename, latLabel, longLabel, dirLabel, originalTextLabel, gridScale, shouldIgnoreRepetitions, shouldIgnoreAddedOnly, minPointsOnADay, verbose)
     model.readFiles()
     print
@@ -46,10 +46,15 @@
 # 2nd order Markov Chain
 
 from __future__ import division
-import csv
 from collections import defaultdict
+import itertools
 import datetime
-from fileinfo import filename, files
+from fileinfo import getFiles
+from trajectoryFiles import readColumns
+from gridCells import GridCells, getKeptRows, addSegmentMarkers, startCell, segmentMarker, noCell
+from transitionCounts import TransitionCounts, FirstOccurrences, getPreviousCells, getSetRanks, getDictRanks
+from trajectoryStore import TrajectoryStore
+import parallelFolds
 
 shouldIgnoreRepetitions = True  # decides whether to ignore consecutive repetition in generated labels
 shouldIgnoreAddedOnly = False  # decides whether only the repetition in points added by the routing service is to be ignored
@@ -57,6 +62,9 @@ shouldPrintPredictions = False  # decides whether predictions are printed to the
 shouldSegmentData = False  # decides whether to segment the data for each day into trips based on the concept of stationary locations
 segmentTimeThreshold = 60 * 60000  # 60min or 1hr threshold for segmenting data into trips
 verbose = True  # decides whether to print the accuracy in each fold of cross-validation
+shouldTrainIncrementally = True  # decides whether each fold of cross-validation updates the counts of the previous fold instead of training from scratch
+shouldPrecomputePredictions = False  # decides whether the prediction for every context seen in training is computed right after training, so that predict is a single lookup
+numProcesses = 1  # no. of processes the folds of cross-validation are divided among, None uses one process per core
 latLabel = 'latitude'
 longLabel = 'longitude'
 timestampLabel = 'timestamp'
@@ -69,12 +77,18 @@ class LocationPrecitionModel:
     def __init__(self, files, filename, latLabel, longLabel, timestampLabel, originalTextLabel, gridScale, shouldIgnoreRepetitions, shouldSegmentData, shouldIgnoreAddedOnly, segmentTimeThreshold, minPointsOnADay, verbose):
         self.files = files
         self.filename = filename
-        self.mostFrequentlyVisited = ''
+        self.cells = GridCells(gridScale)
+        self.mostFrequentlyVisited = noCell
+        self.predictions = None
+        self.fallbacks = {}
         self.counts_uni = defaultdict(int)
-        self.counts_bi = defaultdict(int)
-        self.counts_tri = defaultdict(int)
-        self.next = defaultdict(set)
-        self.data = []
+        self.counts_bi = TransitionCounts()
+        self.counts_tri = TransitionCounts()
+        self.trainedFiles = set()
+        self.setRanks = {}  # the positions of the next grid-ids of each grid-id in the set of their labels, kept until the counts change
+        self.data = TrajectoryStore()
+        self.firstNext = FirstOccurrences()
+        self.firstVisited = FirstOccurrences()
         self.fileDataDict = {}
         self.dataFileDict = {}
         self.indices = []
@@ -94,63 +108,122 @@ class LocationPrecitionModel:
     def predict(self, z, x):
         """Predicts the next grid-id based on the current and the previous grid-ids."""
         
+        if not self.predictions is None:
+            prediction = self.predictions.get((z, x))
+            if prediction is None:
+                prediction = self.fallbacks.get(x, (self.mostFrequentlyVisited, 0))
+            return prediction
         maxProb = 0
-        r = ''
-        # the following code calculates the probablity of each candidate next grid-id and finds the one with the maximum probability
-        for y in self.next[x]:
-            P = 0
-            if self.counts_bi[(x, y)] != 0:
-                P = self.counts_tri[(z, x, y)] / self.counts_bi[(x, y)]
-            if P > maxProb:
-                maxProb = P
-                r = y
+        r = noCell
+        # the following code calculates the probablity of each candidate next grid-id seen after (z, x) and finds the ones with the maximum probability
+        candidates = [(y, count / self.counts_bi.getCount(x, y)) for y, count in self.counts_tri.getNext((z, x))]
+        if candidates:
+            maxProb = max(P for y, P in candidates)
+            r = self.breakTie(x, [y for y, P in candidates if P == maxProb])
         if maxProb == 0:  # 1st fallback --> 1st order markov chain
-            for y in self.next[x]:
-                P = self.counts_bi[(x, y)] / self.counts_uni[x]
-                if P > maxProb:
-                    maxProb = P
-                    r = y
+            tied, count = self.counts_bi.getMaxima(x)
+            if count > 0:
+                maxProb = count / self.counts_uni[x]
+                r = self.breakTie(x, tied)
             if maxProb == 0:  # 2nd fallback
                 r = self.mostFrequentlyVisited
         return r, maxProb
     
+    def breakTie(self, x, tied):
+        """Returns the grid-id of tied, next grid-ids of x, whose label comes first in a set of the labels of the next grid-ids of x
+        added in the order training saw them, which is the one predicted when the labels were kept in sets.
+        
+        """
+        
+        if len(tied) == 1:
+            return tied[0]
+        ranks = self.setRanks.get(x)
+        if ranks is None:
+            added = self.firstNext.getOrder([(x, y) for y, count in self.counts_bi.getNext(x)], self.trainedFiles)
+            ranks = self.setRanks[x] = getSetRanks([y for context, y in added], self.cells.getLabel)
+        return min(tied, key=ranks.__getitem__)
+    
     def train(self, train_files):
         """Trains the location prediction model with the training set provided as argument.
         
-        train_files is a list. Each element of train_files is a list of type location-labels.
+        train_files is a list. Each element of train_files is a list of type grid-ids.
         
         """
         
-        last = '$'
-        last2 = '$'
-        d = []
-        for file in train_files:
-            d = d + self.data[file]
         # the following code calculates the counts required by the prediction model
         # to calculate probabilities of candidate locations and make predictions
+        last2, last, d = self.getTransitions(train_files)
         for e in d:
-            if e == "---":
-                last = '$'
-                last2 = '$'
-            else:
-                self.counts_uni[e] = self.counts_uni[e] + 1
-                self.counts_bi[(last, e)] = self.counts_bi[(last, e)] + 1
-                self.counts_tri[(last2, last, e)] = self.counts_tri[(last2, last, e)] + 1
-                self.next[last].add(e)
-                last2 = last
-                last = e
-        maxCount = -1
-        for e in self.counts_uni:
-            if self.counts_uni[e] > maxCount:
-                self.mostFrequentlyVisited = e
-                maxCount = self.counts_uni[e]
+            self.counts_uni[e] = self.counts_uni[e] + 1
+        self.counts_bi = TransitionCounts(last, d)
+        self.counts_tri = TransitionCounts(zip(last2, last), d)
+        self.trainedFiles = set(train_files)
+        self.setRanks = {}
+        self.setMostFrequentlyVisited()
+    
+    def getTransitions(self, files):
+        """Returns the two grid-ids before each grid-id in files (or startCell), and the grid-ids in files, without the segment markers."""
+        
+        d = self.data.getCells(files)
+        previous = getPreviousCells(d)
+        previous2 = getPreviousCells(d, previous)
+        isCell = [e != segmentMarker for e in d]
+        last = list(itertools.compress(previous, isCell))
+        last2 = list(itertools.compress(previous2, isCell))
+        d = list(itertools.compress(d, isCell))
+        return last2, last, d
+    
+    def updateCounts(self, files, sign):
+        """Adds the counts of the files to the trained model, or subtracts them if sign is -1."""
+        
+        last2, last, d = self.getTransitions(files)
+        for e in d:
+            self.counts_uni[e] = self.counts_uni[e] + sign
+        self.counts_bi.add(last, d, sign)
+        self.counts_tri.add(zip(last2, last), d, sign)
+    
+    def setMostFrequentlyVisited(self):
+        """Finds the most frequently visited grid-id in the training set. If there are ties, it is the one whose label comes first
+        in a dict of the labels of the grid-ids visited added in the order training saw them, as when the counts were kept by label.
+        
+        """
+        
+        self.mostFrequentlyVisited = noCell
+        visited = [e for e in self.counts_uni if self.counts_uni[e] > 0]
+        if not visited:
+            return
+        maxCount = max(self.counts_uni[e] for e in visited)
+        tied = [e for e in visited if self.counts_uni[e] == maxCount]
+        if len(tied) == 1:
+            self.mostFrequentlyVisited = tied[0]
+            return
+        ranks = getDictRanks(self.firstVisited.getOrder(visited, self.trainedFiles), self.cells.getLabel)
+        self.mostFrequentlyVisited = min(tied, key=ranks.__getitem__)
+    
+    def precomputePredictions(self):
+        """Computes the prediction for every pair of grid-ids (z, x) seen in training, and the fallback prediction for every
+        grid-id x, so that predict is a single lookup.
+        
+        The table is dropped by resetTrainedModel.
+        
+        """
+        
+        self.predictions = None
+        predictions = {}
+        for z, x in self.counts_tri.rows:
+            predictions[(z, x)] = self.predict(z, x)
+        # (noCell, x) is never seen in training, so predict falls back to the 1st order markov chain for it
+        fallbacks = {}
+        for x in self.counts_bi.rows:
+            if x != startCell:
+                fallbacks[x] = self.predict(noCell, x)
+        self.fallbacks = fallbacks
+        self.predictions = predictions
     
     def test(self, test_files):
         """Returns the accuracy of the location prediction model once it has been trained."""
         
-        t = []
-        for file in test_files:
-            t = t + self.data[file]
+        t = self.data.getCells(test_files)
         total = len(t) - 3
         correct = 0
         for i in range(total):
@@ -158,7 +231,7 @@ class LocationPrecitionModel:
             if predicted == t[i+2]:
                 correct = correct + 1
             if shouldPrintPredictions:
-                print t[i+1], t[i+2], "-->", predicted
+                print self.cells.getLabel(t[i+1]), self.cells.getLabel(t[i+2]), "-->", self.cells.getLabel(predicted)
         if total <= self.minPointsOnADay:  # days with less than minPointsOnADay points are not considered
             return None
         accuracy = correct / total
@@ -169,59 +242,84 @@ class LocationPrecitionModel:
         
         j = 0
         for i in self.files:
-            d = []
-            with open(self.filename % i) as file1:
-                sr = csv.reader(file1, delimiter=',')
-                first = True
-                last = ''
-                labelIdx = -1
-                tsIdx = -1
-                origIdx = -1
-                lastTime = None
-                for r in sr:
-                    if first:
-                        first = False
-                        latIdx = r.index(self.latLabel)
-                        longIdx = r.index(self.longLabel)
-                        tsIdx = r.index(self.timestampLabel)
-                        origIdx = r.index(self.originalTextLabel)
-                    else:
-                        label = self.getLabel(r[latIdx], r[longIdx])
-                        if self.shouldIgnoreRepetitions and last == label:
-                            if not self.shouldIgnoreAddedOnly or r[origIdx] == '0':
-                                continue
-                        if self.shouldSegmentData:
-                            Time = float(r[tsIdx])
-                            if lastTime is None:
-                                lastTime = Time
-                            if (Time - lastTime) >= self.segmentTimeThreshold:
-                                d.append("---")
-                            lastTime = Time
-                        d.append(label)
-                        last = label
-            d.append("---")
-            self.data.append(d)
+            latitudes, longitudes, timestamps, originals = readColumns(self.filename, i, [self.latLabel, self.longLabel, self.timestampLabel, self.originalTextLabel])
+            cells = self.cells.getCells(latitudes, longitudes)
+            kept = getKeptRows(cells, originals, self.shouldIgnoreRepetitions, self.shouldIgnoreAddedOnly)
+            d = [cells[k] for k in kept]
+            if self.shouldSegmentData:
+                d = addSegmentMarkers(d, [timestamps[k] for k in kept], self.segmentTimeThreshold)
+            d.append(segmentMarker)
+            self.data.addDay(d)
+            self.firstNext.addDay(j, zip(getPreviousCells(d), d))
+            self.firstVisited.addDay(j, d)
             self.fileDataDict[i] = j
             self.dataFileDict[j] = i
             j = j + 1
         self.indices = [self.fileDataDict[i] for i in self.files]
     
+    def getCell(self, latitude, longitude):
+        """Returns the integer grid-id for latitude-longitude values after truncating the values using the grid-scale"""
+        
+        return self.cells.getCell(latitude, longitude)
+    
     def getLabel(self, latitude, longitude):
         """Returns a string label for latitude-longitude values after truncating the values using the grid-scale"""
         
-        x = int(float(latitude) * self.gridScale) / gridScale
-        y = int(float(longitude) * self.gridScale) / gridScale
-        label = 'LAT' + str(x) + 'LON' + str(y)
-        return label
+        return self.cells.getLabel(self.getCell(latitude, longitude))
+    
+    def updateTrainedModel(self, trained, train_files):
+        """Changes the model trained with the files in trained into one trained with the files in train_files.
+        
+        The counts of the files that are no longer used are subtracted and those of the new files are added,
+        so the model must have been trained at some point with all the files in train_files.
+        
+        """
+        
+        isTrained = set(trained)
+        isTraining = set(train_files)
+        self.updateCounts([file for file in trained if not file in isTraining], -1)
+        self.updateCounts([file for file in train_files if not file in isTrained], 1)
+        self.trainedFiles = isTraining
+        self.setRanks = {}
+        self.setMostFrequentlyVisited()
+        self.predictions = None
     
     def resetTrainedModel(self):
         """Resets the prediction model so that it can be trained again using a different dataset."""
         
-        self.counts_tri = defaultdict(int)
+        self.counts_tri = TransitionCounts()
         self.counts_uni = defaultdict(int)
-        self.counts_bi = defaultdict(int)
-        self.next = defaultdict(set)
-        self.mostFrequentlyVisited = ''
+        self.counts_bi = TransitionCounts()
+        self.trainedFiles = set()
+        self.setRanks = {}
+        self.mostFrequentlyVisited = noCell
+        self.predictions = None
+    
+    def getFolds(self, sequential=False):
+        """Returns the (training files, test files) of every fold of a leave-one-out or a sequential cross-validation."""
+        
+        if sequential:
+            return [(self.indices[:i], [self.indices[i]]) for i in range(len(self.indices))]
+        return [(self.indices[:i] + self.indices[i+1:], [self.indices[i]]) for i in range(len(self.indices))]
+    
+    def runFolds(self, sets):
+        """Trains and tests the prediction model on each (training files, test files) of sets in turn, and yields the accuracies."""
+        
+        if shouldTrainIncrementally:
+            # the model is trained once on all the files, then each fold only subtracts or adds the files that differ from the previous fold
+            self.resetTrainedModel()
+            self.train(self.indices)
+            trained = self.indices
+        for train_files, test_files in sets:
+            if shouldTrainIncrementally:
+                self.updateTrainedModel(trained, train_files)
+                trained = train_files
+            else:
+                self.resetTrainedModel()
+                self.train(train_files)
+            if shouldPrecomputePredictions:
+                self.precomputePredictions()
+            yield self.test(test_files)
     
     def crossValidate(self, sequential=False):
         """Runs a leave-one-out or a sequential cross-validation for the prediction algorithm on the dataset.
@@ -229,21 +327,20 @@ class LocationPrecitionModel:
         sequential = False: leave-one-out cross-validation
         sequential = True: for the xth day, use data from 1...(x-1) days for training the model and tha from the xth day for testng
         
+        The folds are run over numProcesses processes unless it is 1, with the same results.
+        
         """
         
         maxAccuracy = -1
         bestSet = []
-        sets = []
-        if sequential:
-            sets = [(self.indices[:i], [self.indices[i]]) for i in range(len(self.indices))]
+        sets = self.getFolds(sequential)
+        if numProcesses == 1:
+            accuracies = self.runFolds(sets)
         else:
-            sets = [(self.indices[:i] + self.indices[i+1:], [self.indices[i]]) for i in range(len(self.indices))]
+            accuracies = parallelFolds.getAccuracies(self, sequential, numProcesses)
         passNum = 1
         total = 0.0
-        for train_files, test_files in sets:
-            self.resetTrainedModel()
-            self.train(train_files)
-            accuracy = self.test(test_files)
+        for (train_files, test_files), accuracy in itertools.izip(sets, accuracies):
             if not accuracy is None:
                 if accuracy > maxAccuracy:
                     maxAccuracy = accuracy
@@ -261,29 +358,28 @@ class LocationPrecitionModel:
     
     def printData(self):
         i = 1
-        for d in self.data:
+        for k in range(self.data.getDayCount()):
+            d = self.data.getCells([k])
             print i
             i = i + 1
             print "######################"
             j = 1
             for x in d:
-                print j, x
+                print j, self.cells.getLabel(x)
                 j = j + 1
             print
             print "######################"
     
     def printUniqueLocations(self):
-        l = []
-        for d in self.data:
-            l = l + d
-        s = set(l)
+        s = set(self.data.cells)
         print "Unique Locations:\n"
-        c = sorted(s)
+        c = sorted(self.cells.getLabel(x) for x in s)
         for x in c:
             print x
         print "\nTotal:", len(c)
 
 def main():
+    filename, files = getFiles()
     model = LocationPrecitionModel(files, filename, latLabel, longLabel, timestampLabel, originalTextLabel, gridScale, shouldIgnoreRepetitions, shouldSegmentData, shouldIgnoreAddedOnly, segmentTimeThreshold, minPointsOnADay, verbose)
     model.readFiles()
     print
@@ -0,0 +1,427 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+# Variable order Markov Chain with backoff
+
+from __future__ import division
+import heapq
+import itertools
+from fileinfo import getFiles
+from trajectoryFiles import readColumns, directionCodes
+from gridCells import GridCells, getKeptRows, addSegmentMarkers, segmentMarker, noCell
+from trajectoryStore import TrajectoryStore, getDirectionCodes, markerDirection
+from contextTrie import ContextTrie
+import parallelFolds
+
+order = 3  # no. of grid-ids before the next one used as context, fewer are used when a context was not seen in training
+shouldUseDirections = False  # decides whether the direction-of-movement at the current point is also used as context
+shouldPruneContexts = False  # decides whether the contexts that do not change the prediction are removed after training
+maxCounts = None  # max. no. of (context, next grid-id) counts kept after training, which bounds the memory of the model, None for no limit
+shouldIgnoreRepetitions = True  # decides whether to ignore consecutive repetition in generated labels
+shouldIgnoreAddedOnly = False  # decides whether only the repetition in points added by the routing service is to be ignored
+shouldPrintPredictions = False  # decides whether predictions are printed to the screen during the test phase
+shouldSegmentData = False  # decides whether to segment the data for each day into trips based on the concept of stationary locations
+segmentTimeThreshold = 60 * 60000  # 60min or 1hr threshold for segmenting data into trips
+verbose = True  # decides whether to print the accuracy in each fold of cross-validation
+shouldTrainIncrementally = True  # decides whether each fold of cross-validation updates the counts of the previous fold instead of training from scratch
+shouldPrecomputePredictions = False  # decides whether the prediction for every context seen in training is computed right after training, so that predict is a single lookup
+numProcesses = 1  # no. of processes the folds of cross-validation are divided among, None uses one process per core
+latLabel = 'latitude'
+longLabel = 'longitude'
+timestampLabel = 'timestamp'
+dirLabel = 'direction_of_movement'
+originalTextLabel = 'original-data'
+gridScale = 100  # 100 is equivalent to truncating the lat/long values to the second place after decimal
+minPointsOnADay = 5  # there should be at least these many no. of points in a day to be considered for testing
+
+class LocationPrecitionModel:
+    
+    def __init__(self, files, filename, latLabel, longLabel, timestampLabel, dirLabel, originalTextLabel, gridScale, order, shouldUseDirections, shouldPruneContexts, maxCounts, shouldIgnoreRepetitions, shouldSegmentData, shouldIgnoreAddedOnly, segmentTimeThreshold, minPointsOnADay, verbose):
+        self.files = files
+        self.filename = filename
+        self.cells = GridCells(gridScale)
+        self.order = order
+        self.shouldUseDirections = shouldUseDirections
+        self.shouldPruneContexts = shouldPruneContexts
+        self.maxCounts = maxCounts
+        self.trie = ContextTrie(order, shouldUseDirections)
+        self.predictions = None
+        self.data = TrajectoryStore(hasDirections=shouldUseDirections)
+        self.fileDataDict = {}
+        self.dataFileDict = {}
+        self.indices = []
+        self.shouldIgnoreRepetitions = shouldIgnoreRepetitions
+        self.verbose = verbose
+        self.latLabel = latLabel
+        self.longLabel = longLabel
+        self.timestampLabel = timestampLabel
+        self.dirLabel = dirLabel
+        self.originalTextLabel = originalTextLabel
+        self.gridScale = gridScale
+        self.shouldSegmentData = shouldSegmentData
+        self.segmentTimeThreshold = segmentTimeThreshold
+        self.shouldIgnoreAddedOnly = shouldIgnoreAddedOnly
+        self.minPointsOnADay = minPointsOnADay
+        self.endDay()
+    
+    def predict(self, history, direction=None):
+        """Predicts the next grid-id based on the grid-ids of the current segment so far (the latest last), and the code of the
+        direction-of-motion at the latest one if directions are used.
+        
+        The prediction is the grid-id seen most often after the longest context of history seen in training, which is
+        the grid-id visited most often when not even the latest grid-id was seen. Ties are broken in favour of the smallest grid-id.
+        
+        This is the tie-break of every context, whether the trie is pruned or updated online, while markovChain_1_Grid.py breaks
+        ties in the order its sets and dicts of labels used to. So with order 1 and no directions, the predictions of the two
+        models only differ where grid-ids are tied.
+        
+        """
+        
+        node = self.trie.findNode(history, direction)
+        if not self.predictions is None:
+            return self.predictions.get(node, (noCell, 0))
+        y, count = self.trie.counts.getMaximum(node)
+        if count == 0:  # nothing was seen in training
+            return noCell, 0
+        return y, count / self.trie.counts.getTotal(node)
+    
+    def predictTop(self, history, direction=None, k=1):
+        """Returns up to k (grid-id, probability) pairs of the grid-ids seen most often after the longest context of history
+        seen in training, most probable first and the smallest grid-id first among equally probable ones, so that the
+        first one is the prediction of predict. The list is empty if nothing was seen in training.
+        
+        """
+        
+        node = self.trie.findNode(history, direction)
+        total = self.trie.counts.getTotal(node)
+        if total == 0:
+            return []
+        top = heapq.nsmallest(k, ((-count, cell) for cell, count in self.trie.counts.getNext(node)))
+        return [(cell, -negativeCount / total) for negativeCount, cell in top]
+    
+    def train(self, train_files):
+        """Trains the location prediction model with the training set provided as argument.
+        
+        train_files is a list of day numbers in self.data.
+        
+        """
+        
+        d, directions = self.getSequences(train_files)
+        self.trie.train(d, directions)
+        if self.isPruned():
+            self.trie.prune(self.maxCounts)
+    
+    def isPruned(self):
+        """Returns whether the contexts are pruned after training"""
+        
+        return self.shouldPruneContexts or not self.maxCounts is None
+    
+    def getSequences(self, files):
+        """Returns the grid-ids of files with the segment markers, and their direction-of-movement codes if directions are used."""
+        
+        directions = None
+        if self.shouldUseDirections:
+            directions = self.data.getDirections(files)
+        return self.data.getCells(files), directions
+    
+    def updateCounts(self, files, sign):
+        """Adds the counts of the files to the trained model, or subtracts them if sign is -1."""
+        
+        d, directions = self.getSequences(files)
+        self.trie.add(d, directions, sign)
+    
+    def precomputePredictions(self):
+        """Computes the prediction for every context seen in training, so that predict only has to find the context.
+        
+        The table is dropped by resetTrainedModel.
+        
+        """
+        
+        self.predictions = None
+        predictions = {}
+        for node in self.trie.counts.rows:
+            y, count = self.trie.counts.getMaximum(node)
+            if count > 0:
+                predictions[node] = (y, count / self.trie.counts.getTotal(node))
+        self.predictions = predictions
+    
+    def addPoint(self, latitude, longitude, timestamp, original='1', direction=None):
+        """Adds a GPS point to the trained model and returns the predicted next grid-id with its probability.
+        
+        The point is labelled, ignored if it is a repetition and starts a new segment after a long enough gap,
+        as in readFiles, and its transition is counted as train would count it in a data file. The counts are updated
+        in a time that does not depend on the no. of points seen. original is the original-data value ('0' for a point
+        added by the routing service) and direction the direction-of-movement name, which is only used with directions.
+        
+        """
+        
+        cell = self.cells.getCell(latitude, longitude)
+        isRepetition = cell == self.lastCell and (not self.shouldIgnoreAddedOnly or original == '0')
+        self.lastCell = cell
+        if not (self.shouldIgnoreRepetitions and isRepetition):
+            if self.shouldSegmentData and not self.lastTimestamp is None and float(timestamp) - self.lastTimestamp >= self.segmentTimeThreshold:
+                self.history = []
+                self.direction = markerDirection
+            self.trie.setOnline()
+            self.trie.addTransition(self.history, self.direction, cell)
+            self.predictions = None
+            if not self.maxCounts is None and self.trie.getCountsSize() > self.maxCounts:
+                # new next grid-ids are still counted in the contexts that were kept, so the trie is pruned again,
+                # with room for a fifth of maxCounts new counts before the next time
+                self.trie.prune(self.maxCounts * 4 // 5)
+            self.history.append(cell)
+            if len(self.history) > self.order:
+                del self.history[0]
+            self.lastTimestamp = float(timestamp)
+            if self.shouldUseDirections:
+                self.direction = directionCodes[direction]
+        return self.predict(self.history, self.direction)
+    
+    def endDay(self):
+        """Ends the day of the points added by addPoint, so that the next point starts a new segment as the first point of a data file."""
+        
+        self.history = []  # grid-ids of the current segment, the latest last, at most order of them
+        self.direction = markerDirection  # direction-of-movement code of the latest point of the current segment
+        self.lastCell = None  # grid-id of the last point added, even if it was ignored as a repetition
+        self.lastTimestamp = None  # timestamp of the last point that was not ignored
+    
+    def test(self, test_files):
+        """Returns the accuracy of the location prediction model once it has been trained."""
+        
+        t = self.data.getCells(test_files)
+        directions = None
+        if self.shouldUseDirections:
+            directions = self.data.getDirections(test_files)
+        total = len(t) - 2
+        correct = 0
+        direction = None
+        for i in range(total):
+            if not directions is None:
+                direction = directions[i]
+            predicted, P = self.predict(t[max(0, i + 1 - self.order):i + 1], direction)
+            if predicted == t[i+1]:
+                correct = correct + 1
+            if shouldPrintPredictions:
+                print self.cells.getLabel(t[i]), self.cells.getLabel(t[i+1]), "-->", self.cells.getLabel(predicted)
+        if total <= self.minPointsOnADay:  # days with less than minPointsOnADay points are not considered
+            return None
+        accuracy = correct / total
+        return accuracy
+    
+    def getLabels(self):
+        """Returns the names of the columns read from the data files"""
+        
+        labels = [self.latLabel, self.longLabel, self.timestampLabel, self.originalTextLabel]
+        if self.shouldUseDirections:
+            labels.append(self.dirLabel)
+        return labels
+    
+    def readFiles(self):
+        """Reads the data files, extracts lat/long values (and the direction-of-movement) from each row, and adds the data to the class."""
+        
+        labels = self.getLabels()
+        j = 0
+        for i in self.files:
+            columns = readColumns(self.filename, i, labels)
+            latitudes, longitudes, timestamps, originals = columns[:4]
+            cells = self.cells.getCells(latitudes, longitudes)
+            kept = getKeptRows(cells, originals, self.shouldIgnoreRepetitions, self.shouldIgnoreAddedOnly)
+            rows = list(kept)
+            if self.shouldSegmentData:
+                rows = addSegmentMarkers(rows, [timestamps[k] for k in kept], self.segmentTimeThreshold)
+            rows.append(segmentMarker)
+            d = [segmentMarker if k == segmentMarker else cells[k] for k in rows]
+            if self.shouldUseDirections:
+                codes = getDirectionCodes(columns[4])
+                self.data.addDay(d, [markerDirection if k == segmentMarker else codes[k] for k in rows])
+            else:
+                self.data.addDay(d)
+            self.fileDataDict[i] = j
+            self.dataFileDict[j] = i
+            j = j + 1
+        self.indices = [self.fileDataDict[i] for i in self.files]
+    
+    def getCell(self, latitude, longitude):
+        """Returns the integer grid-id for latitude-longitude values after truncating the values using the grid-scale"""
+        
+        return self.cells.getCell(latitude, longitude)
+    
+    def getLabel(self, latitude, longitude):
+        """Returns a string label for latitude-longitude values after truncating the values using the grid-scale"""
+        
+        return self.cells.getLabel(self.getCell(latitude, longitude))
+    
+    def updateTrainedModel(self, trained, train_files):
+        """Changes the model trained with the files in trained into one trained with the files in train_files.
+        
+        The counts of the files that are no longer used are subtracted and those of the new files are added,
+        so the model must have been trained at some point with all the files in train_files.
+        
+        """
+        
+        isTrained = set(trained)
+        isTraining = set(train_files)
+        self.updateCounts([file for file in trained if not file in isTraining], -1)
+        self.updateCounts([file for file in train_files if not file in isTrained], 1)
+        self.predictions = None
+    
+    def resetTrainedModel(self):
+        """Resets the prediction model so that it can be trained again using a different dataset."""
+        
+        self.trie = ContextTrie(self.order, self.shouldUseDirections)
+        self.predictions = None
+        self.endDay()
+    
+    def getFolds(self, sequential=False):
+        """Returns the (training files, test files) of every fold of a leave-one-out or a sequential cross-validation."""
+        
+        if sequential:
+            return [(self.indices[:i], [self.indices[i]]) for i in range(len(self.indices))]
+        return [(self.indices[:i] + self.indices[i+1:], [self.indices[i]]) for i in range(len(self.indices))]
+    
+    def runFolds(self, sets):
+        """Trains and tests the prediction model on each (training files, test files) of sets in turn, and yields the accuracies."""
+        
+        # the contexts kept by pruning depend on the training files, so a pruned model is trained from scratch in every fold
+        isIncremental = shouldTrainIncrementally and not self.isPruned()
+        if isIncremental:
+            # the model is trained once on all the files, then each fold only subtracts or adds the files that differ from the previous fold
+            self.resetTrainedModel()
+            self.train(self.indices)
+            trained = self.indices
+        for train_files, test_files in sets:
+            if isIncremental:
+                self.updateTrainedModel(trained, train_files)
+                trained = train_files
+            else:
+                self.resetTrainedModel()
+                self.train(train_files)
+            if shouldPrecomputePredictions:
+                self.precomputePredictions()
+            yield self.test(test_files)
+    
+    def crossValidate(self, sequential=False):
+        """Runs a leave-one-out or a sequential cross-validation for the prediction algorithm on the dataset.
+        
+        sequential = False: leave-one-out cross-validation
+        sequential = True: for the xth day, use data from 1...(x-1) days for training the model and tha from the xth day for testng
+        
+        The folds are run over numProcesses processes unless it is 1, with the same results.
+        
+        """
+        
+        maxAccuracy = -1
+        bestSet = []
+        sets = self.getFolds(sequential)
+        if numProcesses == 1:
+            accuracies = self.runFolds(sets)
+        else:
+            accuracies = parallelFolds.getAccuracies(self, sequential, numProcesses)
+        passNum = 1
+        total = 0.0
+        for (train_files, test_files), accuracy in itertools.izip(sets, accuracies):
+            if not accuracy is None:
+                if accuracy > maxAccuracy:
+                    maxAccuracy = accuracy
+                    bestSet = (train_files, test_files)
+                total = total + accuracy
+                if self.verbose:
+                    print "Pass no.:", passNum, "| Accuracy:", accuracy
+                passNum = passNum + 1
+        bestSetFiles = ([self.dataFileDict[i] for i in bestSet[0]], [self.dataFileDict[i] for i in bestSet[1]])
+        cases = passNum - 1
+        if sequential:
+            cases = cases - 1
+        avgAccuracy = total / cases
+        return maxAccuracy, bestSetFiles, avgAccuracy
+    
+    def printData(self):
+        i = 1
+        for k in range(self.data.getDayCount()):
+            d = self.data.getCells([k])
+            print i
+            i = i + 1
+            print "######################"
+            j = 1
+            for x in d:
+                print j, self.cells.getLabel(x)
+                j = j + 1
+            print
+            print "######################"
+    
+    def printUniqueLocations(self):
+        s = set(self.data.cells)
+        print "Unique Locations:\n"
+        c = sorted(self.cells.getLabel(x) for x in s)
+        for x in c:
+            print x
+        print "\nTotal:", len(c)
+
+def main():
+    filename, files = getFiles()
+    model = LocationPrecitionModel(files, filename, latLabel, longLabel, timestampLabel, dirLabel, originalTextLabel, gridScale, order, shouldUseDirections, shouldPruneContexts, maxCounts, shouldIgnoreRepetitions, shouldSegmentData, shouldIgnoreAddedOnly, segmentTimeThreshold, minPointsOnADay, verbose)
+    model.readFiles()
+    print
+    print "1 test file and remaining all training files:"
+    print
+    maxAccuracy, bestSet, avgAccuracy = model.crossValidate(sequential=False)
+    print
+    print "Maximum accuracy:", maxAccuracy
+    print "Training files:", bestSet[0]
+    print "Test files:", bestSet[1]
+    print "Average accuracy:", avgAccuracy
+    print
+    print "1 test file and all preceding it as training files:"
+    print
+    maxAccuracy, bestSet, avgAccuracy = model.crossValidate(sequential=True)
+    print
+    print "Maximum accuracy:", maxAccuracy
+    print "Training files:", bestSet[0]
+    print "Test files:", bestSet[1]
+    print "Average accuracy [excluding first day's predictions]:", avgAccuracy
+    print
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+# Cross-validation folds over a pool of processes
+
+import multiprocessing
+
+sharedModel = None  # the model whose folds are run, inherited by the forked processes of the pool instead of being pickled
+
+def runFolds(task):
+    """Runs the folds start...end-1 of the cross-validation of sharedModel and returns their accuracies"""
+    
+    sequential, start, end = task
+    return list(sharedModel.runFolds(sharedModel.getFolds(sequential)[start:end]))
+
+def getAccuracies(model, sequential, processes=None):
+    """Yields the accuracy of every fold of the leave-one-out or sequential cross-validation of model, in the order of the folds.
+    
+    The folds are divided into one block of consecutive folds per process, so that the model is trained on all
+    the files only once in each process and then updated from fold to fold. The model and its data are shared
+    with the processes by forking, so this needs a platform where multiprocessing forks (Linux, Mac OS X).
+    
+    """
+    
+    global sharedModel
+    folds = len(model.getFolds(sequential))
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    blocks = min(processes, folds)
+    if blocks == 0:
+        return
+    bounds = [folds * k // blocks for k in range(blocks + 1)]
+    sharedModel = model
+    pool = multiprocessing.Pool(blocks)
+    try:
+        for accuracies in pool.imap(runFolds, [(sequential, bounds[k], bounds[k + 1]) for k in range(blocks)]):
+            for accuracy in accuracies:
+                yield accuracy
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        sharedModel = None
@@ -0,0 +1,267 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+
+# Next-location prediction service over a local HTTP/JSON endpoint
+
+from __future__ import division
+import BaseHTTPServer
+import SocketServer
+import array
+import json
+import threading
+import time
+from datasetCatalog import Catalog, hasColumns
+from fileinfo import dataRoot, startDate, endDate, minPoints, maxDays
+from trajectoryFiles import directionCodes
+import markovChain_k_Grid
+from markovChain_k_Grid import LocationPrecitionModel
+
+host = 'localhost'  # address the service listens on, localhost only accepts local clients
+port = 8642
+users = None  # users whose models are served, None for all the users under dataRoot
+maxTop = 100  # max. no. of predictions returned for a query
+maxLatencies = 100000  # no. of latest requests whose latencies are kept for the percentiles
+
+def createModel(files, filename):
+    """Returns a variable order model of the files as configured in markovChain_k_Grid.py"""
+    
+    m = markovChain_k_Grid
+    return LocationPrecitionModel(files, filename, m.latLabel, m.longLabel, m.timestampLabel, m.dirLabel, m.originalTextLabel, m.gridScale, m.order, m.shouldUseDirections, m.shouldPruneContexts, m.maxCounts, m.shouldIgnoreRepetitions, m.shouldSegmentData, m.shouldIgnoreAddedOnly, m.segmentTimeThreshold, m.minPointsOnADay, False)
+
+def loadModels(dataRoot, users=None):
+    """Returns {user: model} of the variable order models trained with all the selected days of each user (as
+    selected in fileinfo.py). The days whose sample data lacks a column read by the models are left out and
+    reported, and users without selected days are left out.
+    
+    """
+    
+    catalog = Catalog(dataRoot)
+    if users is None:
+        users = catalog.getUsers()
+    labels = createModel([], None).getLabels()
+    models = {}
+    for user in users:
+        missing = [n for n, day in catalog.getDays(user) if not hasColumns(day, labels)]
+        if missing:
+            print "%s: %d days left out, whose sample data lacks one of the columns %s: %s" % (user, len(missing), ', '.join(labels), ', '.join(map(str, missing)))
+        filename, files = catalog.select(user, startDate, endDate, minPoints, maxDays, labels)
+        if not files:
+            continue
+        model = createModel(files, filename)
+        model.readFiles()
+        model.train(model.indices)
+        model.precomputePredictions()
+        models[user] = model
+    return models
+
+def getPercentile(values, percent):
+    """Returns the value below which percent % of the sorted values are (nearest rank), or None if there are none"""
+    
+    if not values:
+        return None
+    k = int(round(percent / 100 * len(values) + 0.5)) - 1
+    return values[min(max(k, 0), len(values) - 1)]
+
+def isCoordinate(value, limit):
+    """Returns whether value is a finite number from -limit to limit"""
+    
+    return isinstance(value, (int, long, float)) and not isinstance(value, bool) and -limit <= value <= limit
+
+class QueryError(Exception):
+    pass
+
+class PredictionServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Answers next-location queries on the trained models of users, one thread per connection.
+    
+    POST /predict takes a query, or a list of queries answered in one request, as JSON. A query is an object
+    {"user": ..., "points": [[latitude, longitude], ...], "direction": ..., "k": ...} where user is the user's name
+    (IMEI) as a string, points are the points of the current trip so far as numbers in degrees, the current point
+    last (only the last order of them are used), direction is the direction-of-movement name at the current point
+    (only for models with directions) and k the no. of predictions (1 if it is left out). The answer is {"predictions": [{"cell", "label", "latitude", "longitude", "probability"}, ...]},
+    most probable first, or {"error": ...} for a query that cannot be answered.
+    
+    GET /stats returns the no. of requests and queries answered and the 50th and 99th percentile of the time taken
+    to answer the latest maxLatencies requests, in milliseconds. The models are only read once they are loaded,
+    so the threads share them without locking.
+    
+    """
+    
+    daemon_threads = True
+    allow_reuse_address = True
+    
+    def __init__(self, address, models):
+        BaseHTTPServer.HTTPServer.__init__(self, address, PredictionHandler)
+        self.models = models
+        self.lock = threading.Lock()
+        self.latencies = array.array('d', [0.0]) * maxLatencies
+        self.requests = 0
+        self.queries = 0
+    
+    def answer(self, query):
+        """Returns the answer to a query"""
+        
+        if not isinstance(query, dict):
+            return {'error': 'a query must be a JSON object'}
+        try:
+            if not isinstance(query.get('user'), basestring):
+                raise QueryError('user must be a string')
+            model = self.models.get(query['user'])
+            if model is None:
+                raise QueryError('unknown user: %s' % query.get('user'))
+            history = self.getHistory(model, query.get('points', []))
+            direction = None
+            if model.shouldUseDirections:
+                if not query.get('direction') in directionCodes:
+                    raise QueryError('a direction-of-movement name is needed, one of: %s' % ', '.join(sorted(directionCodes)))
+                direction = directionCodes[query['direction']]
+            k = query.get('k', 1)
+            if not isinstance(k, (int, long)) or isinstance(k, bool) or not 1 <= k <= maxTop:
+                raise QueryError('k must be an integer from 1 to %d' % maxTop)
+        except QueryError as e:
+            return {'error': str(e)}
+        if k == 1:
+            predicted, P = model.predict(history, direction)
+            top = [(predicted, P)] if P > 0 else []
+        else:
+            top = model.predictTop(history, direction, k)
+        predictions = []
+        for cell, P in top:
+            latitude, longitude = model.cells.getPoint(cell)
+            predictions.append({'cell': cell, 'label': model.cells.getLabel(cell), 'latitude': latitude, 'longitude': longitude, 'probability': P})
+        return {'predictions': predictions}
+    
+    def getHistory(self, model, points):
+        """Returns the last order grid-ids of the points of a query, with consecutive repetitions left out as in training"""
+        
+        if not isinstance(points, list):
+            raise QueryError('points must be a list of [latitude, longitude] pairs')
+        history = []
+        for point in points:
+            if not isinstance(point, list) or len(point) != 2 or not isCoordinate(point[0], 90) or not isCoordinate(point[1], 180):
+                raise QueryError('points must be a list of [latitude, longitude] pairs of numbers within -90..90 and -180..180')
+            try:
+                cell = model.getCell(point[0], point[1])
+            except (TypeError, ValueError, OverflowError):
+                raise QueryError('points must be a list of [latitude, longitude] pairs')
+            if model.shouldIgnoreRepetitions and not model.shouldIgnoreAddedOnly and history and history[-1] == cell:
+                continue
+            history.append(cell)
+        return history[-model.order:]
+    
+    def addLatency(self, seconds, queries):
+        """Records the time taken to answer a request of a no. of queries"""
+        
+        with self.lock:
+            self.latencies[self.requests % maxLatencies] = seconds
+            self.requests = self.requests + 1
+            self.queries = self.queries + queries
+    
+    def getStats(self):
+        """Returns the no. of requests and queries answered and the percentiles of the latencies in milliseconds"""
+        
+        with self.lock:
+            latencies = sorted(self.latencies[:min(self.requests, maxLatencies)])
+            stats = {'requests': self.requests, 'queries': self.queries, 'users': len(self.models)}
+        for percent in [50, 99]:
+            latency = getPercentile(latencies, percent)
+            stats['p%d' % percent] = None if latency is None else latency * 1000
+        return stats
+
+class PredictionHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Handles the requests on a keep-alive connection"""
+    
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1  # the response is sent in one write when the request has been handled
+    disable_nagle_algorithm = True
+    
+    def do_POST(self):
+        start = time.time()
+        if self.path != '/predict':
+            self.sendJson(404, {'error': 'not found: %s' % self.path})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.getheader('Content-Length', 0))))
+        except ValueError:
+            self.sendJson(400, {'error': 'the request is not valid JSON'})
+            return
+        if isinstance(request, list):
+            response = [self.server.answer(query) for query in request]
+        else:
+            response = self.server.answer(request)
+        self.sendJson(200, response)
+        self.server.addLatency(time.time() - start, len(request) if isinstance(request, list) else 1)
+    
+    def do_GET(self):
+        if self.path != '/stats':
+            self.sendJson(404, {'error': 'not found: %s' % self.path})
+            return
+        self.sendJson(200, self.server.getStats())
+    
+    def sendJson(self, status, value):
+        body = json.dumps(value)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass  # a line per request would take longer than answering it
+
+def main():
+    print "Training the models..."
+    models = loadModels(dataRoot, users)
+    server = PredictionServer((host, port), models)
+    print "Serving %d users on http://%s:%d/predict (latencies on /stats)" % (len(models), host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
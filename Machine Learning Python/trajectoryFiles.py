@@ -0,0 +1,299 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+########################################################################################################
+###
+### DESCRIPTION:
+###
+### Reads the sample data of a user either from the sample/sample_data_<i>.txt CSV files or from a
+### binary columnar file, which holds the rows of one or more days as the columns:
+###   timestamp (int64), latitude (float64), longitude (float64), original-data (uint8),
+###   direction_of_movement (uint8, index into directionNames)
+### preceded by an index of the first row and the no. of rows of every day. Columnar files are
+### memory-mapped, so that the rows of a day are read without parsing any text.
+###
+### Columnar files with the rows of a single day (sample/sample_data_<i>.col) are written by
+### conversionPipeline.py. Running this script converts the sample CSV files of a user directory
+### into a single columnar file (sample/trajectories.col) with the rows of all days.
+###
+########################################################################################################
+
+import array
+import csv
+import itertools
+import mmap
+import os
+import re
+import struct
+import sys
+
+columnarExtension = '.col'
+combinedFileName = 'trajectories.col'
+sampleFilePattern = re.compile(r'^sample_data_(\d+)\.txt$')
+magic = 'KDMT'
+version = 1
+headerFormat = '<4sIIQ'  # magic, version, no. of days, no. of rows
+dayFormat = '<qqq'  # day number, first row, no. of rows
+columns = [('timestamp', 'q'), ('latitude', 'd'), ('longitude', 'd'), ('original-data', 'B'), ('direction_of_movement', 'B')]
+directionNames = ['$', 'stat', 'N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']  # same codes as directionOfMovement.directionNames
+directionCodes = dict((name, code) for code, name in enumerate(directionNames))
+originalNames = ['0', '1']
+int64Typecode = 'l' if array.array('l').itemsize == 8 else None  # None if the platform has no 8-byte array type
+openedFiles = {}
+
+def getColumnSizes():
+    """Returns the no. of bytes of a value of every column, in the order of columns"""
+    
+    return [struct.calcsize('<' + code) for name, code in columns]
+
+class ColumnarWriter:
+    """Collects the rows of one or more days and writes them as a columnar file on close()"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.days = []
+        self.timestamps = []
+        self.lats = array.array('d')
+        self.longs = array.array('d')
+        self.originals = array.array('B')
+        self.directions = array.array('B')
+    
+    def addRow(self, timestamp, latitude, longitude, original, direction):
+        """Adds a row to the last day added, with original as 0/1 and direction as one of directionNames"""
+        
+        self.timestamps.append(int(timestamp))
+        self.lats.append(float(latitude))
+        self.longs.append(float(longitude))
+        self.originals.append(int(original))
+        self.directions.append(directionCodes[direction])
+        self.days[-1][2] = self.days[-1][2] + 1
+    
+    def addDay(self, n):
+        """Starts day n, to which the rows added from now on belong"""
+        
+        self.days.append([n, len(self.timestamps), 0])
+    
+    def addRows(self, n, rows):
+        """Starts day n and yields every row of rows (lists of strings in the order of the sample files) after adding it to the day"""
+        
+        self.addDay(n)
+        for row in rows:
+            self.addRow(row[0], row[3], row[4], row[5], row[6])
+            yield row
+    
+    def close(self):
+        """Writes the collected days to the file, replacing it only once it has been written completely"""
+        
+        values = [self.timestamps, self.lats, self.longs, self.originals, self.directions]
+        temporaryPath = self.path + '.tmp'
+        with open(temporaryPath, 'wb') as f:
+            f.write(struct.pack(headerFormat, magic, version, len(self.days), len(self.timestamps)))
+            for day in self.days:
+                f.write(struct.pack(dayFormat, *day))
+            for (name, code), column in zip(columns, values):
+                f.write(struct.pack('<%d%s' % (len(column), code), *column))
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.rename(temporaryPath, self.path)  # replaces the previous file in a single step
+        except OSError:
+            # os.rename cannot replace an existing file on Windows
+            os.remove(self.path)
+            os.rename(temporaryPath, self.path)
+
+class ColumnarFile:
+    """A memory-mapped columnar file"""
+    
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        headerSize = struct.calcsize(headerFormat)
+        fileMagic, fileVersion, numDays, self.numRows = struct.unpack(headerFormat, self.map[:headerSize])
+        if fileMagic != magic or fileVersion != version:
+            self.close()
+            raise ValueError("%s is not a columnar trajectory file of version %d" % (path, version))
+        daySize = struct.calcsize(dayFormat)
+        self.days = {}
+        self.dayNumbers = []
+        for k in range(numDays):
+            n, start, count = struct.unpack(dayFormat, self.map[headerSize + k * daySize:headerSize + (k + 1) * daySize])
+            self.days[n] = (start, count)
+            self.dayNumbers.append(n)
+        self.offsets = {}
+        offset = headerSize + numDays * daySize
+        for (name, code), size in zip(columns, getColumnSizes()):
+            self.offsets[name] = (offset, code, size)
+            offset = offset + self.numRows * size
+    
+    def getColumn(self, name, n):
+        """Returns the values of column name for the rows of day n, as an array"""
+        
+        start, count = self.days[n]
+        offset, code, size = self.offsets[name]
+        data = self.map[offset + start * size:offset + (start + count) * size]
+        if code == 'q':
+            if int64Typecode is None:
+                return list(struct.unpack('<%dq' % count, data))
+            code = int64Typecode
+        values = array.array(code)
+        values.fromstring(data)
+        if sys.byteorder == 'big' and size > 1:
+            values.byteswap()
+        return values
+    
+    def getValues(self, name, n):
+        """Returns the values of column name for the rows of day n in the form read from the sample files.
+        
+        The original-data and direction_of_movement values are strings, as in the sample files, while the
+        timestamp, latitude and longitude values are numbers.
+        
+        """
+        
+        values = self.getColumn(name, n)
+        if name == 'original-data':
+            return [originalNames[v] for v in values]
+        if name == 'direction_of_movement':
+            return [directionNames[v] for v in values]
+        return values
+    
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+def openColumnar(path):
+    """Returns the ColumnarFile of path, which is opened only once per process"""
+    
+    if path not in openedFiles:
+        openedFiles[path] = ColumnarFile(path)
+    return openedFiles[path]
+
+def readCsvHeader(path):
+    """Returns the names of the columns of the CSV file path, or [] if it is empty"""
+    
+    with open(path) as f:
+        for r in csv.reader(f, delimiter=','):
+            return r
+    return []
+
+def readCsvRows(path, labels):
+    """Yields the values of the columns named in labels for every row of the CSV file path"""
+    
+    with open(path) as f:
+        sr = csv.reader(f, delimiter=',')
+        for r in sr:
+            indices = [r.index(label) for label in labels]
+            break
+        for r in sr:
+            yield [r[idx] for idx in indices]
+
+def readRows(filename, n, labels):
+    """Returns an iterator over the values of the columns named in labels for every row of day n.
+    
+    filename is either the format of the names of the files of single days (e.g. sample/sample_data_%d.txt
+    or sample/sample_data_%d.col) or the name of a columnar file holding all days (e.g. sample/trajectories.col).
+    
+    """
+    
+    path = filename % n if '%' in filename else filename
+    if path.endswith(columnarExtension):
+        columnar = openColumnar(path)
+        return itertools.izip(*[columnar.getValues(label, n) for label in labels])
+    return readCsvRows(path, labels)
+
+def readColumns(filename, n, labels):
+    """Returns the columns named in labels for the rows of day n, as lists (or arrays) of the values of readRows"""
+    
+    path = filename % n if '%' in filename else filename
+    if path.endswith(columnarExtension):
+        columnar = openColumnar(path)
+        return [columnar.getValues(label, n) for label in labels]
+    rows = list(readCsvRows(path, labels))
+    if not rows:
+        return [[] for label in labels]
+    return map(list, zip(*rows))
+
+def convertDirectory(directory, outputPath=None):
+    """Converts the sample CSV files in the sample/ directory of a user directory into a single columnar file.
+    
+    The files that lack one of the columns are left out. Returns the path of the columnar file, the day numbers
+    it holds and the day numbers of the files left out.
+    
+    """
+    
+    sampleDirectory = os.path.join(directory, 'sample')
+    if outputPath is None:
+        outputPath = os.path.join(sampleDirectory, combinedFileName)
+    days = []
+    for name in os.listdir(sampleDirectory):
+        m = sampleFilePattern.match(name)
+        if m:
+            days.append(int(m.group(1)))
+    days.sort()
+    labels = [name for name, code in columns]
+    converted = []
+    skipped = []
+    writer = ColumnarWriter(outputPath)
+    for n in days:
+        path = os.path.join(sampleDirectory, 'sample_data_%d.txt' % n)
+        header = readCsvHeader(path)
+        if not all(label in header for label in labels):
+            skipped.append(n)
+            continue
+        writer.addDay(n)
+        for row in readCsvRows(path, labels):
+            writer.addRow(*row)
+        converted.append(n)
+    writer.close()
+    return outputPath, converted, skipped
+
+def main():
+    directory = raw_input("Enter user directory: ")
+    path, days, skipped = convertDirectory(directory)
+    print path, "created with", len(days), "days."
+    if skipped:
+        print len(skipped), "days left out, whose sample data lacks one of the columns %s:" % ', '.join(name for name, code in columns), ', '.join(map(str, skipped))
+
+if __name__ == '__main__':
+    main()
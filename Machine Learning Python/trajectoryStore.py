@@ -0,0 +1,114 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+# Trajectories of all the days in contiguous arrays
+
+import array
+from trajectoryFiles import directionNames, directionCodes
+
+markerDirection = -1  # the direction-of-movement code stored with a segment marker
+
+class TrajectoryStore:
+    """The grid-ids, and optionally the direction-of-movement codes, of the points of every day, kept one day after
+    another in arrays of integers.
+    
+    The days are numbered 0...n-1 in the order they were added. The points of the day numbered k are
+    cells[firstPoint[k]:firstPoint[k+1]], with the directions directions[firstPoint[k]:firstPoint[k+1]].
+    A set of days is read with getCells/getDirections, which copy the slices of the days one after another
+    instead of concatenating lists of points.
+    
+    """
+    
+    def __init__(self, hasDirections=False):
+        self.cells = array.array('l')
+        self.directions = None
+        if hasDirections:
+            self.directions = array.array('l')
+        self.firstPoint = array.array('l', [0])
+    
+    def addDay(self, cells, directions=None):
+        """Adds a day with the grid-ids in cells, and the direction-of-movement codes in directions if the store has directions"""
+        
+        self.cells.extend(cells)
+        if not self.directions is None:
+            self.directions.extend(directions)
+        self.firstPoint.append(len(self.cells))
+    
+    def getDayCount(self):
+        """Returns the no. of days in the store"""
+        
+        return len(self.firstPoint) - 1
+    
+    def getCells(self, days):
+        """Returns the grid-ids of the days numbered in days, one day after another"""
+        
+        return self.getValues(self.cells, days)
+    
+    def getDirections(self, days):
+        """Returns the direction-of-movement codes of the days numbered in days, one day after another"""
+        
+        return self.getValues(self.directions, days)
+    
+    def getValues(self, values, days):
+        """Returns the slices of values of the days numbered in days, one day after another"""
+        
+        if len(days) == 1:
+            return values[self.firstPoint[days[0]]:self.firstPoint[days[0] + 1]]
+        result = array.array('l')
+        for k in days:
+            result.extend(values[self.firstPoint[k]:self.firstPoint[k + 1]])
+        return result
+
+def getDirectionCodes(directions):
+    """Returns the codes of the direction-of-movement names in directions"""
+    
+    return [directionCodes[direction] for direction in directions]
+
+def getDirectionName(code):
+    """Returns the direction-of-movement name of a code, or '---' for the code stored with a segment marker"""
+    
+    if code == markerDirection:
+        return '---'
+    return directionNames[code]
@@ -0,0 +1,361 @@
+###############################################################################
+
+
+# Copyright 2013 University of Southern California
+#
+
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+
+
+#
+# Unless required by applicable law or agreed to in writing, software
+
+
+# distributed under the License is distributed on an "AS IS" BASIS,
+
+
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+
+
+# limitations under the License.
+#
+
+
+# This code was developed by the Information Integration Group as part
+
+
+# of the Karma project at the Information Sciences Institute of the
+# University of Southern California.  For more information, publications,
+
+
+# and related projects, please see: http://www.isi.edu/integration
+
+
+###############################################################################
+
+# Counts of the transitions between grid cells as a sparse matrix
+
+import array
+import bisect
+import itertools
+import operator
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from gridCells import startCell, segmentMarker
+
+class TransitionCounts:
+    """The no. of transitions from each context (a grid-id, or a tuple such as (previous grid-id, grid-id) or
+    (grid-id, direction)) to each next grid-id, kept in compressed sparse row form.
+    
+    The contexts are numbered 0...n-1 in rows. The next grid-ids of the context numbered k are
+    nextCell[firstEntry[k]:firstEntry[k+1]] in increasing order, with the counts count[firstEntry[k]:firstEntry[k+1]].
+    Probabilities are not stored; they are computed from the counts when they are needed.
+    numpy is used to build the matrix when it is installed.
+    
+    The counts can be changed later with add, as long as the transitions were in the matrix when it was built,
+    so that a matrix built from all the data can be used for any subset of it. Entries with a count of 0 are
+    treated as if they were not in the matrix.
+    
+    """
+    
+    def __init__(self, contexts=(), cells=()):
+        """Counts the transitions from contexts[i] to cells[i] for every i"""
+        
+        self.rows = {}
+        rowIds = [self.rows.setdefault(context, len(self.rows)) for context in contexts]
+        self.firstEntry = array.array('l', [0] * (len(self.rows) + 1))
+        self.nextCell = array.array('l')
+        self.count = array.array('l')
+        self.size = array.array('l', [0] * len(self.rows))
+        if not rowIds:
+            return
+        # every (row, next grid-id) pair is packed into a single integer key, so that the pairs are grouped by sorting integers
+        width = max(cells) + 1
+        if not numpy is None:
+            keys = numpy.array(rowIds, dtype=numpy.int64) * width + numpy.array(cells, dtype=numpy.int64)
+            keys.sort()
+            starts = numpy.flatnonzero(numpy.concatenate(([True], keys[1:] != keys[:-1])))
+            rowIds, nextCells = numpy.divmod(keys[starts], width)
+            counts = numpy.diff(numpy.append(starts, len(keys)))
+            self.firstEntry = array.array('l', numpy.searchsorted(rowIds, numpy.arange(len(self.rows) + 1)).tolist())
+            self.nextCell = array.array('l', nextCells.tolist())
+            self.count = array.array('l', counts.tolist())
+            self.size = array.array('l', numpy.diff(self.firstEntry).tolist())
+            return
+        keys = sorted(map(operator.add, map(operator.mul, rowIds, itertools.repeat(width, len(rowIds))), cells))
+        for key, group in itertools.groupby(keys):
+            row, cell = divmod(key, width)
+            self.firstEntry[row + 1] = self.firstEntry[row + 1] + 1
+            self.nextCell.append(cell)
+            self.count.append(sum(1 for k in group))
+        for row in range(len(self.rows)):
+            self.size[row] = self.firstEntry[row + 1]
+            self.firstEntry[row + 1] = self.firstEntry[row + 1] + self.firstEntry[row]
+    
+    def add(self, contexts, cells, sign=1):
+        """Adds (or subtracts, if sign is -1) the transitions from contexts[i] to cells[i] for every i.
+        
+        Every transition must have been counted when the matrix was built, otherwise KeyError is raised.
+        
+        """
+        
+        for context, cell in itertools.izip(contexts, cells):
+            row = self.rows[context]
+            k = bisect.bisect_left(self.nextCell, cell, self.firstEntry[row], self.firstEntry[row + 1])
+            if k == self.firstEntry[row + 1] or self.nextCell[k] != cell:
+                raise KeyError((context, cell))
+            count = self.count[k] + sign
+            if count == 0 or self.count[k] == 0:  # the entry appears or disappears
+                self.size[row] = self.size[row] + sign
+            self.count[k] = count
+    
+    def getRows(self, contexts):
+        """Returns a new matrix with the rows of contexts only, in that order, without the entries with a count of 0"""
+        
+        counts = TransitionCounts()
+        for context in contexts:
+            start, end = self.getEntries(context)
+            counts.rows[context] = len(counts.rows)
+            for k in xrange(start, end):
+                if self.count[k] > 0:
+                    counts.nextCell.append(self.nextCell[k])
+                    counts.count.append(self.count[k])
+            counts.firstEntry.append(len(counts.nextCell))
+            counts.size.append(counts.firstEntry[-1] - counts.firstEntry[-2])
+        return counts
+    
+    def getEntryCount(self):
+        """Returns the no. of entries with a count other than 0"""
+        
+        return sum(self.size)
+    
+    def getEntries(self, context):
+        """Returns the first and last+1 index of the entries of context, which are empty if it was never seen"""
+        
+        row = self.rows.get(context)
+        if row is None:
+            return 0, 0
+        return self.firstEntry[row], self.firstEntry[row + 1]
+    
+    def getCount(self, context, cell):
+        """Returns the no. of transitions from context to cell"""
+        
+        start, end = self.getEntries(context)
+        k = bisect.bisect_left(self.nextCell, cell, start, end)
+        if k < end and self.nextCell[k] == cell:
+            return self.count[k]
+        return 0
+    
+    def getNext(self, context):
+        """Returns the (next grid-id, count) pairs of context in increasing order of grid-id"""
+        
+        start, end = self.getEntries(context)
+        return ((cell, count) for cell, count in itertools.izip(self.nextCell[start:end], self.count[start:end]) if count > 0)
+    
+    def getSize(self, context):
+        """Returns the no. of distinct next grid-ids of context"""
+        
+        row = self.rows.get(context)
+        if row is None:
+            return 0
+        return self.size[row]
+    
+    def getTotal(self, context):
+        """Returns the no. of transitions from context"""
+        
+        start, end = self.getEntries(context)
+        return sum(self.count[start:end])
+    
+    def getMaximum(self, context):
+        """Returns the smallest next grid-id of context with the maximum count and that count, or (None, 0)"""
+        
+        start, end = self.getEntries(context)
+        if start == end:
+            return None, 0
+        counts = self.count[start:end]
+        maxCount = max(counts)
+        if maxCount == 0:
+            return None, 0
+        return self.nextCell[start + counts.index(maxCount)], maxCount
+    
+    def getMaxima(self, context):
+        """Returns the next grid-ids of context with the maximum count in increasing order and that count, or ([], 0)"""
+        
+        start, end = self.getEntries(context)
+        if start == end:
+            return [], 0
+        counts = self.count[start:end]
+        maxCount = max(counts)
+        if maxCount == 0:
+            return [], 0
+        return list(itertools.compress(self.nextCell[start:end], itertools.imap(operator.eq, counts, itertools.repeat(maxCount)))), maxCount
+
+class TransitionDict:
+    """The same counts as a TransitionCounts, kept in a dict of dicts so that transitions never seen before can be counted
+    in constant time, for models that are updated online.
+    
+    rows maps each context to a dict of the counts of its next grid-ids. Entries whose count drops to 0 are removed.
+    
+    """
+    
+    def __init__(self, counts=None):
+        """Copies the counts of a TransitionCounts, if given"""
+        
+        self.rows = {}
+        self.entries = 0
+        if not counts is None:
+            for context in counts.rows:
+                self.rows[context] = dict(counts.getNext(context))
+                self.entries = self.entries + len(self.rows[context])
+    
+    def add(self, contexts, cells, sign=1):
+        """Adds (or subtracts, if sign is -1) the transitions from contexts[i] to cells[i] for every i.
+        
+        KeyError is raised if a count would drop below 0.
+        
+        """
+        
+        for context, cell in itertools.izip(contexts, cells):
+            row = self.rows.get(context)
+            if row is None:
+                row = self.rows[context] = {}
+            count = row.get(cell, 0) + sign
+            if count < 0:
+                raise KeyError((context, cell))
+            if count == 0:
+                del row[cell]
+                self.entries = self.entries - 1
+            else:
+                if count == sign:
+                    self.entries = self.entries + 1
+                row[cell] = count
+    
+    def getRows(self, contexts):
+        """Returns a new TransitionDict with the rows of contexts only"""
+        
+        counts = TransitionDict()
+        for context in contexts:
+            counts.rows[context] = dict(self.rows.get(context, {}))
+            counts.entries = counts.entries + len(counts.rows[context])
+        return counts
+    
+    def getEntryCount(self):
+        """Returns the no. of entries, which have a count other than 0"""
+        
+        return self.entries
+    
+    def getCount(self, context, cell):
+        """Returns the no. of transitions from context to cell"""
+        
+        return self.rows.get(context, {}).get(cell, 0)
+    
+    def getNext(self, context):
+        """Returns the (next grid-id, count) pairs of context in increasing order of grid-id"""
+        
+        return sorted(self.rows.get(context, {}).iteritems())
+    
+    def getSize(self, context):
+        """Returns the no. of distinct next grid-ids of context"""
+        
+        return len(self.rows.get(context, {}))
+    
+    def getTotal(self, context):
+        """Returns the no. of transitions from context"""
+        
+        return sum(self.rows.get(context, {}).itervalues())
+    
+    def getMaximum(self, context):
+        """Returns the smallest next grid-id of context with the maximum count and that count, or (None, 0)"""
+        
+        row = self.rows.get(context)
+        if not row:
+            return None, 0
+        maxCount = max(row.itervalues())
+        return min(cell for cell, count in row.iteritems() if count == maxCount), maxCount
+
+def getPreviousCells(d, cells=None):
+    """Returns the element of cells (by default d itself) before each element of d, a list or array of grid-ids and
+    segment markers, or startCell for the first element of d and every element after a segment marker.
+    
+    getPreviousCells(d) gives the grid-id before each element, and getPreviousCells(d, getPreviousCells(d))
+    the one before that.
+    
+    """
+    
+    if cells is None:
+        cells = d
+    return [startCell if e == segmentMarker else cell for e, cell in itertools.izip(itertools.chain([startCell], d[:-1]), itertools.chain([startCell], cells[:-1]))]
+
+class FirstOccurrences:
+    """The index of the first occurrence of each key (such as a transition or a grid-id) in each day of the data, so that
+    the keys seen in any set of days can be put in the order in which training on those days sees them first.
+    
+    The models compare candidate grid-ids by the order in which a set or dict of their labels, filled in that order,
+    iterates over them, which is how ties were broken when the counts were kept in sets and dicts keyed by labels.
+    
+    """
+    
+    def __init__(self):
+        self.occurrences = {}  # key -> (day, index in the day) of its first occurrence in each day it occurs in, in increasing order of day
+    
+    def addDay(self, day, keys):
+        """Adds the keys of the points of a day, which must be numbered after the days added before it"""
+        
+        first = {}
+        for k, key in enumerate(keys):
+            if not key in first:
+                first[key] = k
+        for key, k in first.iteritems():
+            self.occurrences.setdefault(key, []).append((day, k))
+    
+    def getOrder(self, keys, days):
+        """Returns keys, which must all occur in days (a set of day numbers), in the order of their first occurrence in days"""
+        
+        first = []
+        for key in keys:
+            for occurrence in self.occurrences[key]:
+                if occurrence[0] in days:
+                    first.append((occurrence, key))
+                    break
+        first.sort()
+        return [key for occurrence, key in first]
+
+def getSetRanks(elements, getKey):
+    """Returns the position of the key of each element (given by getKey) in the order in which a set that the keys
+    of elements are added to one after another iterates over them, as {element: position}
+    
+    """
+    
+    s = set()
+    for e in elements:
+        s.add(getKey(e))
+    return getRanks(elements, getKey, s)
+
+def getDictRanks(elements, getKey):
+    """Returns the position of the key of each element (given by getKey) in the order in which a dict that the keys
+    of elements are added to one after another iterates over them, as {element: position}
+    
+    """
+    
+    d = {}
+    for e in elements:
+        d[getKey(e)] = 0
+    return getRanks(elements, getKey, d)
+
+def getRanks(elements, getKey, keys):
+    """Returns {element: position of its key in keys}"""
+    
+    elements = dict((getKey(e), e) for e in elements)
+    return dict((elements[key], k) for k, key in enumerate(keys))